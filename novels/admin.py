@@ -1,8 +1,15 @@
 from django.contrib import admin
 from django.db.models import Count
+from django.db import transaction
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import Category, Novel, Chapter, FilterWord
-from django.urls import path
+from .models import Category, Novel, Chapter, FilterWord, CleaningJob, CrawlTask
+from .caching import SCOPE_SITE, invalidate_common_data, purge_scopes
+from .cleaning import enqueue_cleaning
+from .ingest import import_novel
+from .textfiles import decode_bytes, split_chapters
+from .titles import TitleRule, start_title_rewrite
+from django.urls import path, reverse
 from django.shortcuts import render, redirect
 from django.contrib import messages
 import re
@@ -34,6 +41,9 @@ class NovelAdmin(admin.ModelAdmin):
     search_fields = ('title', 'author')
     list_filter = ('category', 'is_recommend')
     inlines = [ChapterInline]
+    # 目录指纹由爬虫维护
+    readonly_fields = ('toc_hash', 'toc_count', 'toc_last_url', 'toc_etag', 'toc_last_modified', 'toc_probe_hash',
+                       'toc_checked_at')
 
     # 封面缩略图显示
     def cover_thumbnail(self, obj):
@@ -47,11 +57,17 @@ class NovelAdmin(admin.ModelAdmin):
 
     def mark_recommend(self, request, queryset):
         updated_count = queryset.update(is_recommend=True)
+        # update() 不触发信号，手动刷新侧边栏和页面缓存
+        invalidate_common_data()
+        purge_scopes(SCOPE_SITE)
         self.message_user(request, f"{updated_count} 部作品已成功推荐！")
     mark_recommend.short_description = "批量推荐选中作品"
 
     def unmark_recommend(self, request, queryset):
         updated_count = queryset.update(is_recommend=False)
+        # update() 不触发信号，手动刷新侧边栏和页面缓存
+        invalidate_common_data()
+        purge_scopes(SCOPE_SITE)
         self.message_user(request, f"{updated_count} 部作品已取消推荐！")
     unmark_recommend.short_description = "取消推荐选中作品"
 
@@ -104,26 +120,12 @@ class NovelAdmin(admin.ModelAdmin):
                 messages.error(request, '只支持TXT文件')
                 return redirect('..')
             
-            # 尝试不同的编码
-            encodings = ['utf-8', 'gb18030', 'gbk', 'gb2312', 'big5', 'utf-16']
-            content = None
-            detected_encoding = None
-            
             try:
-                # 读取文件内容
-                file_content = txt_file.read()
-                
-                # 尝试不同的编码解码文件内容
-                for encoding in encodings:
-                    try:
-                        content = file_content.decode(encoding)
-                        detected_encoding = encoding
-                        break
-                    except UnicodeDecodeError:
-                        continue
+                # 读取文件内容，识别编码后只解码一次
+                content, detected_encoding = decode_bytes(txt_file.read())
                 
                 if content is None:
-                    messages.error(request, f'无法识别文件编码，已尝试以下编码：{", ".join(encodings)}')
+                    messages.error(request, '无法识别文件编码，请转换为 UTF-8 或 GBK 后重试')
                     return redirect('..')
                 
                 # 提取书名和作者（假设文件名格式为：书名-作者.txt）
@@ -134,60 +136,26 @@ class NovelAdmin(admin.ModelAdmin):
                     title = filename
                     author = '未知'
                 
-                # 处理重复的小说标题
-                base_title = title.strip()
-                final_title = base_title
-                counter = 1
-                while Novel.objects.filter(title=final_title).exists():
-                    final_title = f"{base_title}({counter})"
-                    counter += 1
-                
-                # 查找章节（支持更多章节标记格式）
-                chapter_pattern = r'第[一二三四五六七八九十百千万0-9１２３４５６７８９０]+[章節回卷].*?\n'
-                chapters = re.finditer(chapter_pattern, content)
-                chapter_positions = [(m.start(), m.group()) for m in chapters]
+                # 按章节标题切分（支持第一章、第1章、第十回等格式）
+                chapters = split_chapters(content)
                 
-                if not chapter_positions:
+                if not chapters:
                     messages.error(request, '未找到任何章节，请确保章节标题格式正确（如：第一章、第1章）')
                     return redirect('..')
                 
-                # 创建小说
-                novel = Novel.objects.create(
-                    title=final_title,  # 使用处理后的标题
-                    author=author.strip(),
+                # 创建小说并批量写入章节（重复标题自动加后缀）
+                novel, count = import_novel(
+                    chapters,
+                    title=title,
+                    author=author,
                     category_id=1,  # 默认分类，可以根据需要修改
                     intro=content[:200] + '...',  # 使用开头作为简介
                     source_url='本地导入'  # 标记来源
                 )
                 
-                # 创建章节
-                used_titles = set()  # 用于跟踪已使用的标题
-                for i, (pos, title) in enumerate(chapter_positions):
-                    # 获取章节内容
-                    next_pos = chapter_positions[i + 1][0] if i + 1 < len(chapter_positions) else len(content)
-                    chapter_content = content[pos:next_pos].strip()
-                    
-                    # 处理重复标题
-                    original_title = title.strip()
-                    chapter_title = original_title
-                    counter = 1
-                    while chapter_title in used_titles:
-                        chapter_title = f"{original_title}({counter})"
-                        counter += 1
-                    used_titles.add(chapter_title)
-                    
-                    try:
-                        Chapter.objects.create(
-                            novel=novel,
-                            title=chapter_title,
-                            content=chapter_content
-                        )
-                    except Exception as e:
-                        messages.warning(request, f'章节"{chapter_title}"导入失败：{str(e)}')
-                
                 messages.success(
                     request, 
-                    f'成功导入小说《{novel.title}》，共 {len(chapter_positions)} 章。'
+                    f'成功导入小说《{novel.title}》，共 {count} 章。'
                     f'文件编码：{detected_encoding}'
                 )
                 
@@ -296,22 +264,17 @@ class ChapterAdmin(admin.ModelAdmin):
             replace = request.POST.get('replace')
             action_type = request.POST.get('action_type')
             
-            import re
-            updated = 0
+            try:
+                rule = TitleRule(pattern, '' if action_type == 'remove' else replace)
+            except re.error as e:
+                self.message_user(request, f'正则表达式有误: {e}', level='ERROR')
+                return HttpResponseRedirect(request.get_full_path())
             
-            for chapter in queryset:
-                old_title = chapter.title
-                if action_type == 'remove':
-                    new_title = re.sub(pattern, '', old_title)
-                else:  # replace
-                    new_title = re.sub(pattern, replace, old_title)
-                    
-                if old_title != new_title:
-                    chapter.title = new_title
-                    chapter.save(update_fields=['title'])
-                    updated += 1
+            # 交给后台线程批量改写，避免大批量章节阻塞请求
+            chapter_ids = list(queryset.values_list('id', flat=True))
+            transaction.on_commit(lambda: start_title_rewrite([rule], chapter_ids))
             
-            self.message_user(request, f'成功更新了 {updated} 个章节标题')
+            self.message_user(request, f'已在后台处理 {len(chapter_ids)} 个章节的标题，与已有标题重复的将被跳过')
             return HttpResponseRedirect(request.get_full_path())
             
         # 显示表单
@@ -336,38 +299,40 @@ class FilterWordAdmin(admin.ModelAdmin):
             self.message_user(request, '请至少选择一个过滤词！', level='WARNING')
             return
         
-        # 获取所有章节
-        chapters = Chapter.objects.all()
-        cleaned_count = 0
-        total_count = chapters.count()
-        
-        try:
-            # 获取选中的过滤词
-            selected_words = list(queryset.values_list('word', flat=True))
-            
-            for chapter in chapters:
-                original_content = chapter.content
-                cleaned_content = original_content
-                
-                # 只应用选中的过滤词
-                for word in selected_words:
-                    cleaned_content = cleaned_content.replace(word, '')
-                
-                if original_content != cleaned_content:
-                    chapter.content = cleaned_content
-                    chapter.save()
-                    cleaned_count += 1
-            
-            self.message_user(
-                request, 
-                f'清理完成！总共 {total_count} 个章节，清理了 {cleaned_count} 个章节的内容。',
-                level='SUCCESS'
-            )
-        except Exception as e:
-            self.message_user(
-                request,
-                f'清理过程中发生错误：{str(e)}',
-                level='ERROR'
-            )
+        # 只登记后台任务，清理在后台按批次进行
+        job = enqueue_cleaning(queryset.values_list('word', flat=True))
+        job_url = reverse('admin:novels_cleaningjob_change', args=[job.pk])
+        self.message_user(
+            request,
+            format_html('已提交清理任务 <a href="{}">#{}</a>，可在清理任务列表查看进度。', job_url, job.pk),
+            level='SUCCESS'
+        )
+
+    execute_cleaning.short_description = '使用选中的过滤词清理内容'
+
+@admin.register(CleaningJob)
+class CleaningJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'progress', 'processed_count', 'total_count', 'cleaned_count', 'created_at', 'updated_at']
+    list_filter = ['status']
+    readonly_fields = ['words', 'status', 'filter_version', 'last_chapter_id', 'total_count',
+                       'processed_count', 'cleaned_count', 'error', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(CrawlTask)
+class CrawlTaskAdmin(admin.ModelAdmin):
+    list_display = ['id', 'novel', 'title', 'state', 'attempts', 'next_retry_at', 'updated_at']
+    list_filter = ['state']
+    search_fields = ['title', 'url', 'novel__title']
+    list_select_related = ['novel']
+    raw_id_fields = ['novel']
+    readonly_fields = ['attempts', 'last_error', 'created_at', 'updated_at']
+    actions = ['retry_now']
+
+    def retry_now(self, request, queryset):
+        """把选中的任务重新排队，下次运行爬虫时立即抓取"""
+        count = queryset.update(state='pending', attempts=0, next_retry_at=timezone.now())
+        self.message_user(request, f'已重新排队 {count} 个抓取任务', level='SUCCESS')
 
-    execute_cleaning.short_description = '使用选中的过滤词清理内容'
\ No newline at end of file
+    retry_now.short_description = '立即重试选中的任务'
@@ -13,3 +13,5 @@ class NovelsConfig(AppConfig):
         """当应用准备就绪时，确保所有模板标签都被正确加载"""
         # 导入模板标签，让它们在Django的画布上绽放
         import novels.templatetags.novel_filters
+        # 注册信号处理，让缓存随数据变化而更新
+        import novels.signals
@@ -0,0 +1,104 @@
+"""
+页面缓存
+
+侧边栏的分类统计和推荐小说在每个页面都会用到，这里把查询结果
+物化成普通的字典列表后缓存，由信号和后台操作在数据变化时主动失效。
+
+首页、分类页等整页响应按“作用域”缓存：每个作用域有一个版本号，
+缓存键中带上版本号，数据变化时只需更新相关作用域的版本，
+旧的缓存自然失效，其他作用域的页面不受影响。
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db.models import Count
+from django.http import HttpResponse
+
+COMMON_DATA_KEY = 'common_data'
+COMMON_DATA_TIMEOUT = 1800
+
+SCOPE_KEY = 'page_scope:{}'
+PAGE_KEY = 'page:{}'
+PAGE_CACHE_TIMEOUT = 600
+
+# 作用域
+SCOPE_SITE = 'site'  # 分类、推荐等全站数据
+SCOPE_NOVELS = 'novels'  # 小说列表（首页、最新小说）
+SCOPE_CHAPTERS = 'chapters'  # 最新章节（首页）
+
+
+def get_common_data():
+    """公共上下文数据：分类（含小说数量）和推荐小说"""
+    data = cache.get(COMMON_DATA_KEY)
+    if data is None:
+        from .models import Category, Novel
+
+        categories = Category.objects.annotate(
+            novel_count=Count('novels')
+        ).order_by('-novel_count').values('id', 'name', 'novel_count')
+        recommend_novels = Novel.objects.filter(
+            is_recommend=True
+        ).values('id', 'title', 'author', 'cover')[:3]
+
+        data = {
+            'categories': list(categories),
+            'recommend_novels': list(recommend_novels),
+        }
+        cache.set(COMMON_DATA_KEY, data, COMMON_DATA_TIMEOUT)
+    return data
+
+
+def invalidate_common_data():
+    """小说、分类或推荐状态变化后调用"""
+    cache.delete(COMMON_DATA_KEY)
+
+
+def category_scope(category_id):
+    return f'category:{category_id}'
+
+
+def scope_version(scope):
+    """获取作用域当前的版本号"""
+    key = SCOPE_KEY.format(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def purge_scopes(*scopes):
+    """让这些作用域下缓存的页面和片段全部失效"""
+    now = time.time_ns()
+    cache.set_many({SCOPE_KEY.format(scope): now for scope in scopes}, None)
+
+
+def cache_page_scoped(get_scopes, timeout=PAGE_CACHE_TIMEOUT):
+    """
+    按作用域缓存整页响应的装饰器
+    get_scopes(request, **kwargs) 返回页面依赖的作用域列表
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            scopes = [SCOPE_SITE] + list(get_scopes(request, **kwargs))
+            versions = '|'.join(f'{scope}={scope_version(scope)}' for scope in scopes)
+            raw = f'{request.get_full_path()}|{versions}'
+            key = PAGE_KEY.format(hashlib.sha1(raw.encode('utf-8')).hexdigest())
+
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return wrapper
+    return decorator
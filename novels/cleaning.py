@@ -0,0 +1,163 @@
+"""
+后台清理任务
+
+过滤词变化后按主键分批扫描章节，只重写真正包含变更词的行，
+每批用 bulk_update 写回并记录检查点，中断后可从检查点继续。
+进程退出后停在“进行中”的任务，长时间没有推进检查点就由下一个领取者自动接管。
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import search_index
+from .filters import FilterMatcher, get_filter_matcher
+from .models import Chapter, CleaningJob
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500  # 每批扫描的章节数
+PREFILTER_LIMIT = 20  # 变更词不多时交给数据库做 LIKE 预筛选
+STALE_AFTER = timedelta(minutes=10)  # 进行中的任务超过这么久没有推进检查点，视为进程已经退出
+
+_worker_lock = threading.Lock()
+
+
+def enqueue_cleaning(words=()):
+    """登记一个清理任务；已有等待中的任务时合并变更词"""
+    words = [w for w in words if w]
+    with transaction.atomic():
+        job = CleaningJob.objects.select_for_update().filter(status='pending').first()
+        if job:
+            merged = job.word_list()
+            merged.extend(w for w in words if w not in merged)
+            job.words = '\n'.join(merged)
+            job.save(update_fields=['words', 'updated_at'])
+        else:
+            job = CleaningJob.objects.create(
+                words='\n'.join(words),
+                total_count=Chapter.objects.count()
+            )
+        transaction.on_commit(start_cleaning_worker)
+    return job
+
+
+def run_cleaning_job(job, batch_size=BATCH_SIZE):
+    """执行清理任务，从 last_chapter_id 之后继续"""
+    matcher = get_filter_matcher()
+    words = job.word_list()
+    # 其他尚未完成的任务的变更词一并处理，否则下面只更新版本号时
+    # 会把仍含有这些词的章节标记为已清理，阅读页也不再临时清理
+    for other in CleaningJob.objects.filter(status='running').exclude(pk=job.pk):
+        words.extend(w for w in other.word_list() if w not in words)
+    changed = FilterMatcher(words)
+
+    job.status = 'running'
+    job.filter_version = matcher.version
+    job.save(update_fields=['status', 'filter_version', 'updated_at'])
+
+    # 旧数据（没有版本号）需要完整重建；新增的词只看包含它的章节
+    stale = Q(filter_version='')
+    if words and len(words) <= PREFILTER_LIMIT:
+        for word in words:
+            stale |= Q(content__contains=word)
+
+    while True:
+        ids = list(
+            Chapter.objects.filter(pk__gt=job.last_chapter_id)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+
+        batch = Chapter.objects.filter(pk__gte=ids[0], pk__lte=ids[-1])
+        candidates = batch if words and len(words) > PREFILTER_LIMIT else batch.filter(stale)
+
+        now = timezone.now()
+        updated = []
+        for chapter in candidates.only('id', 'novel_id', 'title', 'content', 'filter_version', 'updated_at').iterator():
+            if chapter.filter_version and not changed.contains(chapter.content):
+                continue
+            old_content = chapter.content
+            chapter.refresh_rendered(matcher)
+            if chapter.content != old_content:
+                chapter.updated_at = now
+            updated.append(chapter)
+
+        with transaction.atomic():
+            if updated:
+                Chapter.objects.bulk_update(
+                    updated,
+                    ['content', 'rendered_content', 'filter_version', 'updated_at'],
+                    batch_size=100
+                )
+                search_index.index_chapters(updated)
+            # 其余章节不含变更词，渲染结果不变，只需更新版本号
+            batch.exclude(pk__in=[c.pk for c in updated]).exclude(
+                filter_version=''
+            ).exclude(
+                filter_version=matcher.version
+            ).update(filter_version=matcher.version)
+
+            job.last_chapter_id = ids[-1]
+            job.processed_count += len(ids)
+            job.cleaned_count += len(updated)
+            job.save(update_fields=['last_chapter_id', 'processed_count', 'cleaned_count', 'updated_at'])
+
+    job.status = 'done'
+    job.save(update_fields=['status', 'updated_at'])
+    return job
+
+
+def claim_next_job(resume=False):
+    """
+    领取下一个任务；超过 STALE_AFTER 没有进展的进行中任务视为中断，自动接管，
+    resume 为真时接管所有进行中的任务
+    """
+    running = Q(status='running')
+    if not resume:
+        running &= Q(updated_at__lt=timezone.now() - STALE_AFTER)
+    for job in CleaningJob.objects.filter(Q(status='pending') | running).order_by('created_at'):
+        # 条件更新保证同一任务只被一个进程领取
+        claimed = CleaningJob.objects.filter(pk=job.pk, status=job.status, updated_at=job.updated_at).update(
+            status='running', updated_at=timezone.now()
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def run_pending_jobs(resume=False, batch_size=BATCH_SIZE):
+    """依次执行所有待处理任务，返回完成的任务数"""
+    finished = 0
+    while True:
+        job = claim_next_job(resume=resume)
+        if job is None:
+            return finished
+        try:
+            run_cleaning_job(job, batch_size=batch_size)
+            finished += 1
+        except Exception as e:
+            logger.exception('清理任务 #%s 失败', job.pk)
+            CleaningJob.objects.filter(pk=job.pk).update(status='failed', error=str(e))
+
+
+def start_cleaning_worker():
+    """在后台线程中处理待执行的任务，同一进程只启动一个线程"""
+    if not _worker_lock.acquire(blocking=False):
+        return
+
+    def worker():
+        try:
+            close_old_connections()
+            run_pending_jobs()
+        finally:
+            connection.close()
+            _worker_lock.release()
+
+    threading.Thread(target=worker, name='cleaning-worker', daemon=True).start()
@@ -0,0 +1,249 @@
+"""
+爬虫公共设施
+
+各爬虫命令共用：按主机限制并发数和请求频率，取代到处散落的随机 sleep；
+固定数量的浏览器标签页循环复用，不再每个章节新开、关闭一个标签页；
+任务放进 asyncio 队列，由 N 个工作协程并发消费，吞吐量随工作数增长。
+
+抓取后端可以替换：正文由服务器直接渲染的页面用 HttpFetcher（aiohttp 长连接 +
+BeautifulSoup 解析），不必为每个页面付出一个浏览器标签页的 CPU 和内存；
+只有需要执行 JavaScript 的列表页才用 BrowserFetcher。两者都返回解析好的文档，
+所以 beautifulsoup4 是两种抓取方式共同的必需依赖（在第一次解析时导入）；
+aiohttp 只在使用 HTTP 抓取时才导入。
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+DEFAULT_WORKERS = 3
+DEFAULT_RATE = 0.5  # 每个主机每秒最多发起的请求数
+FETCH_TIMEOUT = 30  # 单个页面的超时秒数
+
+FETCHERS = ('browser', 'http')
+
+
+class HostLimiter:
+    """按主机限制并发数和最小请求间隔"""
+
+    def __init__(self, rate=DEFAULT_RATE, concurrency=DEFAULT_WORKERS):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.concurrency = max(1, concurrency)
+        self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                'semaphore': asyncio.Semaphore(self.concurrency),
+                'lock': asyncio.Lock(),
+                'next_time': 0.0,
+            }
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url):
+        """占用一个请求名额：先排队等并发名额，再等到距上次请求满足最小间隔"""
+        state = self._state(urlsplit(url).netloc)
+        async with state['semaphore']:
+            async with state['lock']:
+                loop = asyncio.get_running_loop()
+                now = loop.time()
+                wait = state['next_time'] - now
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                state['next_time'] = max(now, state['next_time']) + self.interval
+            yield
+
+
+class PagePool:
+    """固定数量、循环复用的浏览器标签页"""
+
+    def __init__(self, browser, size=DEFAULT_WORKERS, setup=None):
+        self.browser = browser
+        self.size = max(1, size)
+        self.setup = setup
+        self._pages = asyncio.Queue()
+        self._all = []
+
+    async def _new_page(self):
+        page = await self.browser.newPage()
+        if self.setup:
+            await self.setup(page)
+        self._all.append(page)
+        return page
+
+    async def start(self):
+        for _ in range(self.size):
+            self._pages.put_nowait(await self._new_page())
+        return self
+
+    @asynccontextmanager
+    async def page(self):
+        """借出一个标签页，用完归还；标签页已崩溃时换一个新的"""
+        page = await self._pages.get()
+        try:
+            yield page
+        finally:
+            if page.isClosed():
+                self._all.remove(page)
+                page = await self._new_page()
+            self._pages.put_nowait(page)
+
+    async def close(self):
+        for page in self._all:
+            if not page.isClosed():
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+        self._all = []
+
+
+async def run_queue(items, handler, workers=DEFAULT_WORKERS):
+    """
+    把 items 放进队列，由 workers 个协程并发调用 handler 处理
+    返回 handler 的结果列表（按完成顺序）
+    """
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    results = []
+
+    async def worker():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append(await handler(item))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(workers, queue.qsize() or 1)))))
+    return results
+
+
+def parse_html(html):
+    """解析 HTML，优先使用 lxml，未安装时使用内置解析器；两种抓取方式的 soup() 都依赖 beautifulsoup4"""
+    from bs4 import BeautifulSoup, FeatureNotFound
+
+    try:
+        return BeautifulSoup(html, 'lxml')
+    except FeatureNotFound:
+        return BeautifulSoup(html, 'html.parser')
+
+
+def join_paragraphs(paragraphs, min_length=1):
+    """把段落文本加上全角缩进并用空行连接，与各爬虫原来的 JS 提取格式一致"""
+    texts = (text.strip() for text in paragraphs)
+    return '\n\n'.join('　　' + text for text in texts if len(text) >= min_length)
+
+
+class HttpFetcher:
+    """用共享的长连接会话抓取服务器渲染的页面"""
+
+    def __init__(self, limiter=None, headers=None, concurrency=DEFAULT_WORKERS, timeout=FETCH_TIMEOUT):
+        self.limiter = limiter
+        # 压缩格式交给 aiohttp 自己协商，未安装 brotli 时声明 br 会导致解码失败
+        self.headers = {k: v for k, v in (headers or {}).items() if k.lower() != 'accept-encoding'}
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.session = None
+
+    async def start(self):
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency * 2, limit_per_host=self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+        )
+        return self
+
+    async def fetch(self, url, wait_for=None):
+        """返回页面 HTML，非 2xx 响应抛出异常；服务器渲染的页面不需要等待 wait_for"""
+        async def get():
+            async with self.session.get(url) as response:
+                response.raise_for_status()
+                return await response.text(errors='replace')
+
+        if self.limiter is None:
+            return await get()
+        async with self.limiter.slot(url):
+            return await get()
+
+    async def soup(self, url, wait_for=None):
+        return parse_html(await self.fetch(url, wait_for))
+
+    async def fetch_conditional(self, url, etag='', last_modified=''):
+        """
+        带 If-None-Match / If-Modified-Since 的请求，返回 (html, etag, last_modified)
+        服务器返回 304 时 html 为 None，校验值沿用传入的值
+        """
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        async def get():
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return None, etag, last_modified
+                response.raise_for_status()
+                return (
+                    await response.text(errors='replace'),
+                    response.headers.get('ETag', ''),
+                    response.headers.get('Last-Modified', ''),
+                )
+
+        if self.limiter is None:
+            return await get()
+        async with self.limiter.slot(url):
+            return await get()
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+
+class BrowserFetcher:
+    """用标签页池打开需要执行 JavaScript 的页面，接口与 HttpFetcher 相同"""
+
+    def __init__(self, pages, limiter=None, wait_until='networkidle0', timeout=FETCH_TIMEOUT):
+        self.pages = pages
+        self.limiter = limiter
+        self.wait_until = wait_until
+        self.timeout = timeout
+
+    async def start(self):
+        await self.pages.start()
+        return self
+
+    async def _goto(self, page, url):
+        options = {'waitUntil': self.wait_until, 'timeout': self.timeout * 1000}
+        if self.limiter is None:
+            return await page.goto(url, options)
+        async with self.limiter.slot(url):
+            return await page.goto(url, options)
+
+    async def fetch(self, url, wait_for=None):
+        """返回渲染后的 HTML，wait_for 为需要等到出现的 CSS 选择器"""
+        async with self.pages.page() as page:
+            await self._goto(page, url)
+            if wait_for:
+                await page.waitForSelector(wait_for, {'timeout': self.timeout * 1000})
+            return await page.content()
+
+    async def evaluate(self, url, script):
+        """打开页面后在页面中执行脚本并返回结果"""
+        async with self.pages.page() as page:
+            await self._goto(page, url)
+            return await page.evaluate(script)
+
+    async def soup(self, url, wait_for=None):
+        return parse_html(await self.fetch(url, wait_for))
+
+    async def close(self):
+        await self.pages.close()
@@ -0,0 +1,253 @@
+"""
+小说导出
+
+按 ('order', 'id') 顺序用服务端游标逐章读取，边编码边输出，内存占用与书的长度无关。
+首次下载时顺带把结果写入磁盘缓存（TXT 原文、gzip 压缩版和 EPUB），
+章节变化后缓存标记随之变化，旧文件自动清理。
+"""
+import glob
+import gzip
+import hashlib
+import os
+import tempfile
+import uuid
+import zipfile
+from html import escape
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Chapter
+from .utils import get_random_cover
+
+EXPORT_DIR = os.path.join(settings.MEDIA_ROOT, 'downloads')
+CHUNK_SIZE = 64 * 1024  # 每次输出的字节数
+ITERATOR_CHUNK = 100  # 游标每次读取的章节数
+
+
+def chapter_stats(novel_id):
+    """返回 (章节数, 最近一次章节更新时间)"""
+    stats = Chapter.objects.filter(novel_id=novel_id).aggregate(
+        count=Count('id'),
+        updated=Max('updated_at')
+    )
+    return stats['count'], stats['updated']
+
+
+def export_stamp(novel, stats=None):
+    """导出缓存标记：小说信息或任一章节变化后都会改变"""
+    count, updated = stats or chapter_stats(novel.id)
+    raw = f"{novel.updated_at.isoformat()}|{count}|{updated.isoformat() if updated else ''}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def artifact_path(novel, stamp, ext):
+    return os.path.join(EXPORT_DIR, f'{novel.id}-{stamp}.{ext}')
+
+
+def cached_artifact(novel, stamp, ext):
+    """返回已缓存的导出文件路径，不存在时返回 None"""
+    path = artifact_path(novel, stamp, ext)
+    return path if os.path.exists(path) else None
+
+
+def iter_novel_text(novel):
+    """逐段生成整本小说的文本"""
+    yield (
+        f"{novel.title}\n"
+        f"作者：{novel.author}\n"
+        f"简介：{novel.intro}\n"
+        + "=" * 50 + "\n\n"
+    )
+
+    chapters = (
+        Chapter.objects.filter(novel_id=novel.id)
+        .order_by('order', 'id')
+        .values_list('title', 'content')
+        .iterator(chunk_size=ITERATOR_CHUNK)
+    )
+    for title, content in chapters:
+        yield f"{title}\n\n{content}\n\n" + "=" * 30 + "\n\n"
+
+
+def iter_novel_bytes(novel):
+    """把文本编码成 UTF-8 并合并成大小适中的块"""
+    buffer = []
+    size = 0
+    for text in iter_novel_text(novel):
+        data = text.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _discard_stale(novel, keep):
+    """删除这本小说过期的导出文件"""
+    for path in glob.glob(os.path.join(EXPORT_DIR, f'{novel.id}-*')):
+        if os.path.basename(path).split('.', 1)[0] != f'{novel.id}-{keep}':
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def stream_and_cache_text(novel, stamp):
+    """
+    输出整本小说的字节流，同时写入原文和 gzip 缓存
+    下载中断时临时文件会被删除，不会留下不完整的缓存
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    txt_fd, txt_tmp = tempfile.mkstemp(dir=EXPORT_DIR, suffix='.tmp')
+    gz_fd, gz_tmp = tempfile.mkstemp(dir=EXPORT_DIR, suffix='.tmp')
+    completed = False
+    try:
+        with os.fdopen(txt_fd, 'wb') as txt_file, os.fdopen(gz_fd, 'wb') as gz_raw:
+            with gzip.GzipFile(fileobj=gz_raw, mode='wb', compresslevel=6) as gz_file:
+                for chunk in iter_novel_bytes(novel):
+                    txt_file.write(chunk)
+                    gz_file.write(chunk)
+                    yield chunk
+
+        os.replace(txt_tmp, artifact_path(novel, stamp, 'txt'))
+        os.replace(gz_tmp, artifact_path(novel, stamp, 'txt.gz'))
+        completed = True
+        _discard_stale(novel, stamp)
+    finally:
+        if not completed:
+            for path in (txt_tmp, gz_tmp):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+EPUB_CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+
+EPUB_PAGE = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="zh-CN">
+<head><meta charset="utf-8"/><title>{title}</title></head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+COVER_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png'}
+
+
+def local_cover_path(novel):
+    """把封面地址解析成本地文件；远程图片不在请求中下载，返回 None"""
+    url = novel.cover or get_random_cover()
+    if url.startswith(settings.MEDIA_URL):
+        path = os.path.join(settings.MEDIA_ROOT, url[len(settings.MEDIA_URL):])
+    elif url.startswith(settings.STATIC_URL):
+        path = finders.find(url[len(settings.STATIC_URL):])
+    else:
+        return None
+
+    if path and os.path.splitext(path)[1].lower() in COVER_TYPES and os.path.exists(path):
+        return path
+    return None
+
+
+def _chapter_page(title, content):
+    """生成单个章节的 XHTML"""
+    body = [f'<h2>{escape(title)}</h2>']
+    body.extend(f'<p>{escape(line)}</p>' for line in content.split('\n') if line.strip())
+    return EPUB_PAGE.format(title=escape(title), body='\n'.join(body))
+
+
+def build_epub(novel, stamp):
+    """
+    逐章写入 EPUB 压缩包并缓存到磁盘，返回文件路径
+    每章写完即释放，只在内存中保留章节标题用于生成目录
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_DIR, suffix='.tmp')
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as epub:
+            # mimetype 必须是第一个文件且不压缩
+            epub.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+            epub.writestr('META-INF/container.xml', EPUB_CONTAINER)
+
+            manifest = []
+            spine = []
+            nav_items = []
+
+            cover = local_cover_path(novel)
+            if cover:
+                ext = os.path.splitext(cover)[1].lower()
+                epub.write(cover, f'OEBPS/images/cover{ext}')
+                manifest.append(
+                    f'<item id="cover-image" href="images/cover{ext}" media-type="{COVER_TYPES[ext]}" properties="cover-image"/>'
+                )
+                epub.writestr('OEBPS/cover.xhtml', EPUB_PAGE.format(
+                    title=escape(novel.title),
+                    body=f'<img src="images/cover{ext}" alt="{escape(novel.title)}"/>'
+                ))
+                manifest.append('<item id="cover" href="cover.xhtml" media-type="application/xhtml+xml"/>')
+                spine.append('<itemref idref="cover"/>')
+
+            intro = [f'<h1>{escape(novel.title)}</h1>', f'<p>作者：{escape(novel.author)}</p>']
+            intro.extend(f'<p>{escape(line)}</p>' for line in novel.intro.split('\n') if line.strip())
+            epub.writestr('OEBPS/intro.xhtml', EPUB_PAGE.format(title=escape(novel.title), body='\n'.join(intro)))
+            manifest.append('<item id="intro" href="intro.xhtml" media-type="application/xhtml+xml"/>')
+            spine.append('<itemref idref="intro"/>')
+
+            chapters = (
+                Chapter.objects.filter(novel_id=novel.id)
+                .order_by('order', 'id')
+                .values_list('title', 'content')
+                .iterator(chunk_size=ITERATOR_CHUNK)
+            )
+            for index, (title, content) in enumerate(chapters, 1):
+                href = f'text/chapter_{index}.xhtml'
+                epub.writestr(f'OEBPS/{href}', _chapter_page(title, content))
+                manifest.append(f'<item id="c{index}" href="{href}" media-type="application/xhtml+xml"/>')
+                spine.append(f'<itemref idref="c{index}"/>')
+                nav_items.append(f'<li><a href="{href}">{escape(title)}</a></li>')
+
+            nav = '<nav epub:type="toc" id="toc"><h1>目录</h1><ol>\n' + '\n'.join(nav_items) + '\n</ol></nav>'
+            epub.writestr('OEBPS/nav.xhtml', EPUB_PAGE.format(title='目录', body=nav))
+            manifest.append('<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>')
+
+            book_id = uuid.uuid5(uuid.NAMESPACE_URL, f'novel:{novel.id}')
+            modified = timezone.now().strftime('%Y-%m-%dT%H:%M:%SZ')
+            epub.writestr('OEBPS/content.opf', f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="book-id" xml:lang="zh-CN">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="book-id">urn:uuid:{book_id}</dc:identifier>
+    <dc:title>{escape(novel.title)}</dc:title>
+    <dc:creator>{escape(novel.author)}</dc:creator>
+    <dc:language>zh-CN</dc:language>
+    <meta property="dcterms:modified">{modified}</meta>
+  </metadata>
+  <manifest>
+    {chr(10).join(manifest)}
+  </manifest>
+  <spine>
+    {chr(10).join(spine)}
+  </spine>
+</package>
+""")
+
+        path = artifact_path(novel, stamp, 'epub')
+        os.replace(tmp_path, path)
+        _discard_stale(novel, stamp)
+        return path
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
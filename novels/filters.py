@@ -0,0 +1,164 @@
+"""
+过滤词引擎
+
+把所有过滤词编译成一台 Aho-Corasick 自动机，一次线性扫描即可找出
+章节中所有广告词，取代逐词 str.replace 的 O(词数 × 长度) 做法。
+自动机在进程内缓存，以数据库中过滤词的条数和最后修改时间为版本，
+任何进程修改了 FilterWord 表，其他进程下次使用时都会重建。
+"""
+import hashlib
+from collections import deque
+
+_matcher = None  # 当前进程内缓存的自动机
+_matcher_stamp = None  # 构建 _matcher 时数据库中过滤词的版本
+
+
+class FilterMatcher:
+    """多模式匹配自动机，支持删除和打码两种模式"""
+
+    def __init__(self, words):
+        self.words = sorted({w for w in words if w})
+        self.version = hashlib.sha1('\n'.join(self.words).encode('utf-8')).hexdigest()[:16]
+
+        # 节点以下标表示：goto 为转移表，fail 为失配指针，
+        # length 为以该节点结尾的模式长度（不是模式结尾时为 0），
+        # output 为沿失配链最近的一个模式结尾节点（字典后缀链接）
+        self._goto = [{}]
+        self._fail = [0]
+        self._length = [0]
+        self._output = [0]
+
+        for word in self.words:
+            node = 0
+            for char in word:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._length.append(0)
+                    self._output.append(0)
+                node = nxt
+            self._length[node] = len(word)
+
+        # 广度优先构建失配指针
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                if target == nxt:
+                    target = 0
+                self._fail[nxt] = target
+                self._output[nxt] = target if self._length[target] else self._output[target]
+
+    def __bool__(self):
+        return bool(self.words)
+
+    def spans(self, text):
+        """返回互不重叠的匹配区间 [(start, end), ...]，左侧优先、同起点取最长"""
+        if not self.words or not text:
+            return []
+
+        goto, fail, length, output = self._goto, self._fail, self._length, self._output
+        matches = []
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            # 收集在此结尾的所有模式，较短的模式可能与前一个匹配不重叠
+            hit = node if length[node] else output[node]
+            while hit:
+                matches.append((i + 1 - length[hit], i + 1))
+                hit = output[hit]
+
+        if not matches:
+            return []
+
+        # 贪心选出不重叠区间
+        matches.sort(key=lambda span: (span[0], -span[1]))
+        result = []
+        last_end = 0
+        for start, end in matches:
+            if start >= last_end:
+                result.append((start, end))
+                last_end = end
+        return result
+
+    def contains(self, text):
+        """判断文本中是否出现任意过滤词"""
+        if not self.words or not text:
+            return False
+
+        goto, fail, length, output = self._goto, self._fail, self._length, self._output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if length[node] or output[node]:
+                return True
+        return False
+
+    def replace(self, text, mask=None):
+        """删除匹配到的过滤词；指定 mask 时用该字符按原长度打码"""
+        spans = self.spans(text)
+        if not spans:
+            return text
+
+        parts = []
+        pos = 0
+        for start, end in spans:
+            parts.append(text[pos:start])
+            if mask:
+                parts.append(mask * (end - start))
+            pos = end
+        parts.append(text[pos:])
+        return ''.join(parts)
+
+    def remove(self, text):
+        """删除模式；删除后前后文字可能拼成新的过滤词，重复删除直到不再匹配"""
+        text = self.replace(text)
+        while self.contains(text):
+            text = self.replace(text)
+        return text
+
+    def mask(self, text, char='*'):
+        """打码模式"""
+        return self.replace(text, mask=char)
+
+
+def filter_words_stamp():
+    """数据库中过滤词的版本：条数加最后修改时间，增删改都会改变它"""
+    from django.db.models import Count, Max
+
+    from .models import FilterWord
+
+    stats = FilterWord.objects.aggregate(count=Count('id'), latest=Max('updated_at'))
+    latest = stats['latest'].isoformat() if stats['latest'] else ''
+    return f"{stats['count']}:{latest}"
+
+
+def get_filter_matcher():
+    """获取基于当前 FilterWord 表的自动机，仅在过滤词变化后重建"""
+    global _matcher, _matcher_stamp
+
+    stamp = filter_words_stamp()
+    if _matcher is None or _matcher_stamp != stamp:
+        from .models import FilterWord
+        _matcher = FilterMatcher(FilterWord.objects.values_list('word', flat=True))
+        _matcher_stamp = stamp
+    return _matcher
+
+
+def invalidate_filter_matcher():
+    """过滤词变化后调用，丢弃本进程的自动机；其他进程根据数据库版本自行重建"""
+    global _matcher, _matcher_stamp
+    _matcher = None
+    _matcher_stamp = None
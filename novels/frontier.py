@@ -0,0 +1,262 @@
+"""
+爬虫抓取队列
+
+待抓取的章节持久化为 CrawlTask，以章节链接为唯一键，重复登记由数据库去重。
+每个章节抓取完成后立即记录状态，进程中断后重启即可从队列继续，
+不需要重新打开列表页和小说页；失败的章节按指数退避安排下次重试，
+超过最大次数后放弃；放弃的章节冷却一段时间后，在目录中再次发现时才重新登记。
+登记前先一次读出小说已有章节的标题，与远端目录在内存中做集合差，
+只把缺失的章节交给抓取协程，不再逐章查询数据库。
+
+每本小说记录远端目录的指纹（章节链接的哈希、章节数、最后一章链接和 HTTP 校验值），
+重新爬取时目录没有变化就跳过，只是在末尾追加了章节时只抓取新增的部分。
+预检请求看到的目录数据与浏览器中合并后的目录不同，另存一份预检指纹，只和下次预检比较。
+304 和预检指纹都可能误判（缓存返回旧的页面壳、页面里没有目录数据），
+距上次完整检查超过 TOC_MAX_AGE 后不再信任它们，强制完整检查一次。
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+from datetime import timedelta
+
+from django.db.models import Count
+from django.utils import timezone
+
+from .headings import chapter_number
+from .models import Chapter, CrawlTask, Novel
+
+MAX_ATTEMPTS = 5  # 超过后放弃
+BACKOFF_BASE = 60  # 第一次失败后等待的秒数，之后每次翻倍
+BACKOFF_MAX = 6 * 3600
+FAILED_COOLDOWN = timedelta(days=7)  # 放弃的任务至少冷却这么久才重新排队
+TOC_MAX_AGE = timedelta(days=1)  # 超过这么久没有完整检查目录时不再信任 304 和预检指纹
+WRITE_BATCH = 500
+
+LEGACY_DIR = 'failed_chapters'
+
+
+def backoff(attempts):
+    """第 attempts 次失败后需要等待的时间"""
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX))
+
+
+def existing_titles(novel):
+    """一次读出小说已有章节的 {标题: id}"""
+    if novel is None or novel.pk is None:
+        return {}
+    return dict(Chapter.objects.filter(novel=novel).values_list('title', 'id'))
+
+
+def plan_missing(existing, chapters):
+    """目录与已有章节按标题做集合差，返回缺失的章节，同一标题只保留第一个"""
+    seen = set(existing)
+    missing = []
+    for chapter in chapters:
+        if chapter['title'] not in seen:
+            seen.add(chapter['title'])
+            missing.append(chapter)
+    return missing
+
+
+def enqueue(novel, chapters):
+    """
+    登记要抓取的章节，chapters 为含 title、url（可选 order）的字典列表
+    已登记的链接不会重复插入，等待重试的保持原有的退避时间；
+    已完成的只有章节确实不在库中时才重新排队，已放弃的要冷却 FAILED_COOLDOWN 之后才重新排队，
+    否则每次目录中再出现都会清零失败次数，MAX_ATTEMPTS 形同虚设
+    """
+    now = timezone.now()
+    tasks = {}
+    for chapter in chapters:
+        if chapter.get('url') and chapter['url'] not in tasks:
+            tasks[chapter['url']] = CrawlTask(
+                url=chapter['url'],
+                novel_id=novel.pk,
+                title=chapter['title'][:255],
+                order=chapter.get('order', chapter_number(chapter['title'])),
+                next_retry_at=now,
+            )
+    urls = list(tasks)
+    for start in range(0, len(urls), WRITE_BATCH):
+        batch = urls[start:start + WRITE_BATCH]
+        CrawlTask.objects.bulk_create([tasks[url] for url in batch], ignore_conflicts=True)
+
+        revive = list(
+            CrawlTask.objects.filter(url__in=batch, state='failed', updated_at__lte=now - FAILED_COOLDOWN)
+            .values_list('pk', flat=True)
+        )
+        done = list(CrawlTask.objects.filter(url__in=batch, state='done').values_list('pk', 'novel_id', 'title'))
+        if done:
+            present = set(
+                Chapter.objects.filter(
+                    novel_id__in={novel_id for _, novel_id, _ in done},
+                    title__in={title for _, _, title in done},
+                ).values_list('novel_id', 'title')
+            )
+            revive.extend(pk for pk, novel_id, title in done if (novel_id, title) not in present)
+
+        if revive:
+            CrawlTask.objects.filter(pk__in=revive).update(
+                state='pending', attempts=0, next_retry_at=now, last_error='', updated_at=now
+            )
+    return len(urls)
+
+
+def due_tasks(novel=None, limit=None):
+    """到期待抓取的任务，按小说和章节顺序排列"""
+    tasks = CrawlTask.objects.filter(state='pending', next_retry_at__lte=timezone.now())
+    if novel is not None:
+        tasks = tasks.filter(novel=novel)
+    tasks = tasks.order_by('novel_id', 'order', 'id')
+    return list(tasks[:limit] if limit else tasks)
+
+
+def pending_novels():
+    """有到期任务的小说"""
+    novel_ids = (
+        CrawlTask.objects.filter(state='pending', next_retry_at__lte=timezone.now())
+        .values_list('novel_id', flat=True).distinct()
+    )
+    return list(Novel.objects.filter(id__in=novel_ids).order_by('id'))
+
+
+def revive_failed(novel=None):
+    """
+    已放弃超过 FAILED_COOLDOWN 的任务重新排队，返回数量
+    目录没有变化而跳过对比时不会调用 enqueue，由它代替 enqueue 让放弃的章节有机会重新抓取
+    """
+    now = timezone.now()
+    tasks = CrawlTask.objects.filter(state='failed', updated_at__lte=now - FAILED_COOLDOWN)
+    if novel is not None:
+        tasks = tasks.filter(novel=novel)
+    return tasks.update(state='pending', attempts=0, next_retry_at=now, last_error='', updated_at=now)
+
+
+def mark_done(task_id):
+    CrawlTask.objects.filter(pk=task_id).update(
+        state='done', last_error='', updated_at=timezone.now()
+    )
+
+
+def mark_done_many(task_ids):
+    """批量标记完成，用于目录对比时发现章节已经存在的任务"""
+    task_ids = list(task_ids)
+    now = timezone.now()
+    for start in range(0, len(task_ids), WRITE_BATCH):
+        CrawlTask.objects.filter(pk__in=task_ids[start:start + WRITE_BATCH]).update(
+            state='done', last_error='', updated_at=now
+        )
+
+
+def mark_failed(task_id, error=''):
+    """记录一次失败，按失败次数安排下次重试或放弃，返回新的状态"""
+    task = CrawlTask.objects.filter(pk=task_id).only('attempts').first()
+    if task is None:
+        return None
+    now = timezone.now()
+    attempts = task.attempts + 1
+    state = 'failed' if attempts >= MAX_ATTEMPTS else 'pending'
+    CrawlTask.objects.filter(pk=task_id).update(
+        state=state,
+        attempts=attempts,
+        next_retry_at=now + backoff(attempts),
+        last_error=str(error)[:1000],
+        updated_at=now,
+    )
+    return state
+
+
+def summary():
+    """各状态的任务数"""
+    counts = dict.fromkeys(dict(CrawlTask.STATE_CHOICES), 0)
+    for row in CrawlTask.objects.values('state').order_by().annotate(n=Count('id')):
+        counts[row['state']] = row['n']
+    return counts
+
+
+def toc_fingerprint(urls):
+    """目录指纹：按顺序排列的章节链接的 SHA-1"""
+    return hashlib.sha1('\n'.join(urls).encode('utf-8')).hexdigest()
+
+
+def compare_toc(novel, urls):
+    """
+    与上次记录的目录对比，返回 (状态, 新增部分的起始位置)
+    unchanged：完全相同；grown：前 toc_count 章不变，只在末尾追加；
+    changed：目录有其他改动；new：没有记录过
+    """
+    if novel is None or not novel.toc_hash:
+        return 'new', 0
+    count = novel.toc_count
+    if len(urls) == count and toc_fingerprint(urls) == novel.toc_hash:
+        return 'unchanged', count
+    if len(urls) > count and urls[count - 1:count] == [novel.toc_last_url] \
+            and toc_fingerprint(urls[:count]) == novel.toc_hash:
+        return 'grown', count
+    return 'changed', 0
+
+
+def toc_expired(novel, now=None):
+    """距上次完整检查是否已超过 TOC_MAX_AGE，从未完整检查过也算过期"""
+    if novel is None or novel.toc_checked_at is None:
+        return True
+    return novel.toc_checked_at <= (now or timezone.now()) - TOC_MAX_AGE
+
+
+def save_toc(novel_id, urls, etag='', last_modified='', probe_hash=''):
+    """
+    完整检查后记录目录指纹和检查时间，不改变小说的 updated_at
+    probe_hash 为预检请求自己算出的指纹，只和下次预检的结果比较，不能与 urls 混用
+    """
+    Novel.objects.filter(pk=novel_id).update(
+        toc_hash=toc_fingerprint(urls),
+        toc_count=len(urls),
+        toc_last_url=urls[-1] if urls else '',
+        toc_etag=etag[:255],
+        toc_last_modified=last_modified[:64],
+        toc_probe_hash=probe_hash,
+        toc_checked_at=timezone.now(),
+    )
+
+
+def touch_toc(novel_id, etag=None, last_modified=None):
+    """
+    预检判断目录没有变化时只更新服务器新给出的校验值
+    不更新 toc_checked_at：它记录的是上次完整检查的时间，跳过时刷新它会让误判的 304 或指纹一直跳过下去
+    """
+    fields = {}
+    if etag:
+        fields['toc_etag'] = etag[:255]
+    if last_modified:
+        fields['toc_last_modified'] = last_modified[:64]
+    if fields:
+        Novel.objects.filter(pk=novel_id).update(**fields)
+
+
+def import_legacy(directory=LEGACY_DIR):
+    """
+    把旧的 failed_chapters/*.json 失败记录导入队列，返回 (导入章节数, 无法导入的文件列表)
+    导入后的文件改名为 .imported，不再重复导入
+    """
+    imported = 0
+    missing = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                chapters = json.load(f)
+        except (OSError, ValueError):
+            missing.append(path)
+            continue
+
+        # 文件名是把特殊字符换成下划线的小说标题
+        novel_title = re.sub(r'_+', ' ', os.path.basename(path)[:-len('.json')]).strip()
+        novel = Novel.objects.filter(title__icontains=novel_title).order_by('id').first()
+        if novel is None:
+            missing.append(path)
+            continue
+
+        imported += enqueue(novel, [c for c in chapters if isinstance(c, dict) and c.get('title')])
+        os.replace(path, path + '.imported')
+    return imported, missing
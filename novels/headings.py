@@ -0,0 +1,136 @@
+"""
+章节标题解析
+
+导入切分、爬虫排序和排序修复共用的一套标题语法：正则只在模块加载时编译一次，
+支持阿拉伯数字、全角数字和中文数字（第一百二十三章 -> 123），
+并识别番外、后记等特殊章节。解析结果按标题做 LRU 缓存，重复标题只解析一次。
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# 中文数字
+CN_DIGITS = {
+    '零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '兩': 2, '三': 3, '四': 4,
+    '五': 5, '六': 6, '七': 7, '八': 8, '九': 9,
+    '壹': 1, '贰': 2, '貳': 2, '叁': 3, '參': 3, '肆': 4, '伍': 5,
+    '陆': 6, '陸': 6, '柒': 7, '捌': 8, '玖': 9,
+}
+CN_UNITS = {
+    '十': 10, '拾': 10, '百': 100, '佰': 100, '千': 1000, '仟': 1000,
+    '万': 10000, '萬': 10000, '亿': 10 ** 8, '億': 10 ** 8,
+}
+FULLWIDTH_DIGITS = str.maketrans('０１２３４５６７８９', '0123456789')
+NUMERAL_CHARS = '0-9０-９' + ''.join(CN_DIGITS) + ''.join(CN_UNITS)
+
+# 章节级单位（序号取自这里）和卷级单位（只在没有章节序号时使用）
+CHAPTER_UNITS = '章節节回话話'
+VOLUME_UNITS = '卷部集篇'
+# 导入时用于切分全文的标题单位，保持与原有导入器一致
+SPLIT_UNITS = '章節回卷'
+
+SPECIAL_KEYWORDS = ('番外', '后记', '後記', '附录', '附錄', '特别篇', '特別篇', '外传', '外傳')
+
+CACHE_SIZE = 65536
+
+Heading = namedtuple('Heading', ['number', 'special'])
+
+
+def chinese_to_int(text):
+    """
+    把章节序号转换成整数，支持阿拉伯数字、全角数字、中文数字及逐位写法
+    （"123"、"１２３"、"一百二十三"、"一二三" 都得到 123），无法识别时返回 None
+    """
+    text = text.translate(FULLWIDTH_DIGITS)
+    if text.isascii() and text.isdigit():
+        return int(text)
+
+    # 没有单位时按逐位读法处理，如 "一〇二"
+    if not any(char in CN_UNITS for char in text):
+        digits = []
+        for char in text:
+            if '0' <= char <= '9':
+                digits.append(char)
+            elif char in CN_DIGITS:
+                digits.append(str(CN_DIGITS[char]))
+            else:
+                return None
+        return int(''.join(digits)) if digits else None
+
+    total = section = number = 0
+    for char in text:
+        if char in CN_DIGITS:
+            number = CN_DIGITS[char]
+        elif '0' <= char <= '9':
+            number = number * 10 + int(char)
+        elif char in CN_UNITS:
+            unit = CN_UNITS[char]
+            if unit == 10 ** 8:
+                total = (total + section + number) * unit
+                section = 0
+            elif unit == 10000:
+                total += (section + number) * unit
+                section = 0
+            else:
+                # "十二" 省略了开头的 "一"
+                section += (number or 1) * unit
+            number = 0
+        else:
+            return None
+    return total + section + number
+
+
+class HeadingParser:
+    """可配置的章节标题解析器，正则在构造时编译，结果带 LRU 缓存"""
+
+    def __init__(self, chapter_units=CHAPTER_UNITS, volume_units=VOLUME_UNITS,
+                 split_units=SPLIT_UNITS, special_keywords=SPECIAL_KEYWORDS, cache_size=CACHE_SIZE):
+        self.special_keywords = tuple(special_keywords)
+        self.chapter_re = re.compile(rf'第\s*([{NUMERAL_CHARS}]+)\s*[{chapter_units}]')
+        self.volume_re = re.compile(rf'第\s*([{NUMERAL_CHARS}]+)\s*[{volume_units}]')
+        self.digits_re = re.compile(r'[0-9０-９]+')
+        # 全文切分用：标题从 "第" 开始到行尾
+        self.line_pattern = re.compile(rf'第[{NUMERAL_CHARS}]+[{split_units}].*?\n')
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, title):
+        """解析标题，返回 Heading(序号或 None, 是否特殊章节)"""
+        special = any(keyword in title for keyword in self.special_keywords)
+
+        # 依次尝试：第 N 章 -> 标题中第一个数字 -> 第 N 卷
+        number = None
+        match = self.chapter_re.search(title)
+        if match:
+            number = chinese_to_int(match.group(1))
+        if number is None:
+            match = self.digits_re.search(title)
+            if match:
+                number = int(match.group().translate(FULLWIDTH_DIGITS))
+        if number is None:
+            match = self.volume_re.search(title)
+            if match:
+                number = chinese_to_int(match.group(1))
+        return Heading(number, special)
+
+    def number(self, title, default=0):
+        """章节序号，识别不到时返回 default"""
+        number = self.parse(title).number
+        return default if number is None else number
+
+    def is_special(self, title):
+        """是否为番外、后记等特殊章节"""
+        return self.parse(title).special
+
+    def cache_info(self):
+        return self.parse.cache_info()
+
+    def cache_clear(self):
+        self.parse.cache_clear()
+
+
+default_parser = HeadingParser()
+
+CHAPTER_PATTERN = default_parser.line_pattern
+parse_heading = default_parser.parse
+chapter_number = default_parser.number
+is_special = default_parser.is_special
@@ -0,0 +1,256 @@
+"""
+章节批量入库
+
+导入器和爬虫共用的写入服务：过滤词自动机只加载一次，内容在内存中清理和渲染，
+标题冲突在写入前就地处理，然后在一个事务里用 bulk_create 分批插入，
+最后统一刷新导航、搜索索引和页面缓存。
+
+爬虫使用 ChapterWriter：抓取协程把章节放进队列后立即继续抓取，
+单个写入任务按批取出，在一个事务里 bulk_create(ignore_conflicts=True)，
+已存在的章节由唯一约束跳过，抓取和写库互不等待。
+"""
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Max
+
+from . import search_index
+from .caching import SCOPE_CHAPTERS, purge_scopes
+from .filters import get_filter_matcher
+from .models import Chapter, Novel
+from .navigation import invalidate_chapter_sequence
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH = 500  # 每批插入的章节数
+WRITER_BATCH = 100  # 写入任务每个事务最多写入的章节数
+WRITER_QUEUE_SIZE = 1000  # 队列满时抓取协程等待，限制内存占用
+
+# 等待写入的章节，meta 原样交给写入后的回调
+PendingChapter = namedtuple('PendingChapter', 'novel_id title content order meta')
+
+
+def unique_title(title, used):
+    """在已用标题集合中为标题加上 (1)、(2) 后缀去重，并登记到集合中"""
+    final_title = title
+    counter = 1
+    while final_title in used:
+        final_title = f"{title}({counter})"
+        counter += 1
+    used.add(final_title)
+    return final_title
+
+
+def unique_novel_title(title):
+    """生成不与现有小说重复的书名，只查询一次数据库"""
+    title = title.strip()
+    used = set(Novel.objects.filter(title__startswith=title).values_list('title', flat=True))
+    return unique_title(title, used)
+
+
+def bulk_create_chapters(novel, chapters, batch_size=INGEST_BATCH, matcher=None):
+    """
+    批量写入章节，返回写入的章节数
+    chapters 为 (标题, 内容) 或 (标题, 内容, 排序) 元组的可迭代对象，可以是生成器
+    """
+    if matcher is None:
+        matcher = get_filter_matcher()
+    used = set(Chapter.objects.filter(novel=novel).values_list('title', flat=True))
+
+    created = 0
+    batch = []
+    with transaction.atomic():
+        for item in chapters:
+            title, content = item[0], item[1]
+            order = item[2] if len(item) > 2 else 0
+
+            chapter = Chapter(
+                novel=novel,
+                title=unique_title(title.strip(), used),
+                content=content,
+                order=order
+            )
+            chapter.refresh_rendered(matcher)
+            batch.append(chapter)
+
+            if len(batch) >= batch_size:
+                created += _flush(batch)
+                batch = []
+        if batch:
+            created += _flush(batch)
+
+    if created:
+        invalidate_chapter_sequence(novel.id)
+        purge_scopes(SCOPE_CHAPTERS)
+    return created
+
+
+def _flush(batch):
+    Chapter.objects.bulk_create(batch)
+    search_index.index_chapters(batch)
+    return len(batch)
+
+
+def import_novel(chapters, batch_size=INGEST_BATCH, **novel_fields):
+    """
+    在一个事务中创建小说并写入全部章节，返回 (小说, 章节数)
+    novel_fields 为 Novel 的字段，书名重复时自动加后缀
+    chapters 可以是边读边切分的生成器，没有任何章节时回滚并抛出 ValueError
+    """
+    novel_fields['title'] = unique_novel_title(novel_fields['title'])
+    novel_fields['author'] = novel_fields.get('author', '未知').strip()
+    with transaction.atomic():
+        novel = Novel.objects.create(**novel_fields)
+        count = bulk_create_chapters(novel, chapters, batch_size=batch_size)
+        if not count:
+            raise ValueError('未找到任何章节')
+    return novel, count
+
+
+def write_pending(items, matcher=None):
+    """
+    在一个事务中写入一批 PendingChapter，已存在（同一小说同名）的章节跳过
+    返回实际插入的 {(novel_id, 标题): id}
+    """
+    if matcher is None:
+        matcher = get_filter_matcher()
+
+    # 同一批中重复的章节只保留第一个，与 bulk_create 忽略冲突时实际插入的一致
+    keys = {}
+    for item in items:
+        title = item.title[:255]
+        if (item.novel_id, title) in keys:
+            continue
+        chapter = Chapter(novel_id=item.novel_id, title=title, content=item.content, order=item.order)
+        chapter.refresh_rendered(matcher)
+        keys[item.novel_id, title] = chapter
+    chapters = list(keys.values())
+    novel_ids = {novel_id for novel_id, _ in keys}
+
+    with transaction.atomic():
+        last_id = Chapter.objects.aggregate(last=Max('id'))['last'] or 0
+        Chapter.objects.bulk_create(chapters, ignore_conflicts=True)
+        # ignore_conflicts 时不会回填主键，按主键范围找回本次插入的行
+        inserted = {
+            (novel_id, title): chapter_id
+            for chapter_id, novel_id, title in Chapter.objects.filter(
+                pk__gt=last_id, novel_id__in=novel_ids
+            ).values_list('id', 'novel_id', 'title')
+            if (novel_id, title) in keys
+        }
+        search_index.index_chapters(
+            (chapter_id, novel_id, title, keys[novel_id, title].content)
+            for (novel_id, title), chapter_id in inserted.items()
+        )
+
+    if inserted:
+        invalidate_chapter_sequence(*{novel_id for novel_id, _ in inserted})
+        purge_scopes(SCOPE_CHAPTERS)
+    return inserted
+
+
+class ChapterWriter:
+    """
+    爬虫的异步写入阶段
+
+    抓取协程调用 put() 把章节放进队列，单个写入任务在后台按批取出写库；
+    on_flush(items, inserted) 在每批提交后于写入线程中调用，
+    inserted 为 write_pending 的返回值，不在其中的章节说明已经存在
+    """
+
+    def __init__(self, batch_size=WRITER_BATCH, maxsize=WRITER_QUEUE_SIZE, on_flush=None):
+        self.batch_size = max(1, batch_size)
+        self.queue = asyncio.Queue(maxsize)
+        self.on_flush = on_flush
+        self.written = 0
+        self.skipped = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.started_at = None
+        self._task = None
+
+    async def start(self):
+        self.started_at = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def put(self, novel_id, title, content, order=0, **meta):
+        await self.queue.put(PendingChapter(novel_id, title, content, order, meta))
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def _write(self, items):
+        inserted = write_pending(items)
+        if self.on_flush:
+            self.on_flush(items, inserted)
+        return inserted
+
+    async def _run(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            # 写入期间积累的章节在下一批一起写入
+            items = [item]
+            stop = False
+            while len(items) < self.batch_size and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is None:
+                    stop = True
+                    break
+                items.append(item)
+
+            try:
+                inserted = await sync_to_async(self._write)(items)
+                self.written += len(inserted)
+                self.skipped += len(items) - len(inserted)
+            except Exception:
+                # 这批章节在抓取队列中保持未完成，下次运行时重新抓取
+                logger.exception('章节写入失败，%s 个章节未保存', len(items))
+                self.failed += len(items)
+            self.batches += 1
+            for _ in range(len(items) + stop):
+                self.queue.task_done()
+            if stop:
+                return
+
+    async def join(self):
+        """等待已放入队列的章节全部写完"""
+        await self.queue.join()
+
+    async def close(self):
+        """写完剩余章节后结束写入任务"""
+        if self._task is None:
+            return
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+
+    @property
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0
+        return {
+            'written': self.written,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'batches': self.batches,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'rows_per_sec': self.written / elapsed if elapsed else 0.0,
+        }
+
+    def describe(self):
+        stats = self.stats()
+        return (
+            f"写入 {stats['written']} 章（跳过 {stats['skipped']}，失败 {stats['failed']}），"
+            f"{stats['batches']} 批，{stats['rows_per_sec']:.1f} 行/秒，"
+            f"队列 {stats['depth']}（峰值 {stats['max_depth']}）"
+        )
@@ -0,0 +1,115 @@
+from django.core.management.base import BaseCommand
+from novels.headings import HeadingParser
+from novels.models import Chapter
+import random
+import re
+import time
+
+
+def legacy_chapter_number(title):
+    """重构前各命令里的写法，作为对照"""
+    match = re.search(r'第(\d+)章', title)
+    if match:
+        return int(match.group(1))
+    numbers = re.findall(r'\d+', title)
+    if numbers:
+        return int(numbers[0])
+    return 0
+
+
+def to_chinese(n):
+    """把 1~9999 转成中文数字，用于生成样本"""
+    digits = '零一二三四五六七八九'
+    units = ['', '十', '百', '千']
+    parts = []
+    zero = False
+    for power in range(3, -1, -1):
+        d = n // 10 ** power % 10
+        if d:
+            if zero:
+                parts.append('零')
+            parts.append(digits[d] + units[power])
+            zero = False
+        elif parts:
+            zero = True
+    text = ''.join(parts)
+    return text[1:] if text.startswith('一十') else text
+
+
+def sample_titles(count):
+    """没有语料时生成的样本：阿拉伯数字、中文数字、番外和卷标混合"""
+    titles = []
+    for _ in range(count):
+        n = random.randint(1, 3000)
+        kind = random.random()
+        if kind < 0.4:
+            titles.append(f'第{n}章 风起云涌')
+        elif kind < 0.8:
+            titles.append(f'第{to_chinese(n)}章 山雨欲来')
+        elif kind < 0.9:
+            titles.append(f'第{random.randint(1, 9)}卷 第{n}章 大结局')
+        else:
+            titles.append(f'番外{random.randint(1, 20)} 后日谈')
+    return titles
+
+
+class Command(BaseCommand):
+    help = '测试章节标题解析的速度（默认使用数据库中的章节标题）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', type=str, help='语料文件，每行一个标题')
+        parser.add_argument('--limit', type=int, default=100000, help='最多读取的标题数')
+        parser.add_argument('--repeat', type=int, default=3, help='重复次数，取最快一次')
+
+    def load_titles(self, options):
+        if options['file']:
+            with open(options['file'], encoding='utf-8') as f:
+                titles = [line.strip() for line in f if line.strip()]
+            return titles[:options['limit']], options['file']
+
+        titles = list(Chapter.objects.values_list('title', flat=True)[:options['limit']])
+        if titles:
+            return titles, '数据库'
+        return sample_titles(options['limit']), '随机样本'
+
+    def timeit(self, func, titles, repeat, before=None):
+        best = None
+        for _ in range(repeat):
+            if before:
+                before()
+            start = time.perf_counter()
+            for title in titles:
+                func(title)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def report(self, name, elapsed, count):
+        rate = count / elapsed if elapsed else float('inf')
+        self.stdout.write(f'{name:<12} {elapsed * 1000:>9.1f} ms  {rate:>12,.0f} 个/秒')
+
+    def handle(self, *args, **options):
+        titles, source = self.load_titles(options)
+        if not titles:
+            self.stdout.write(self.style.WARNING('没有可用的标题'))
+            return
+        repeat = max(options['repeat'], 1)
+        self.stdout.write(f'语料: {source}，共 {len(titles)} 个标题，不同标题 {len(set(titles))} 个')
+
+        parser = HeadingParser()
+        self.report('旧正则', self.timeit(legacy_chapter_number, titles, repeat), len(titles))
+        self.report('冷缓存', self.timeit(parser.number, titles, repeat, before=parser.cache_clear), len(titles))
+        self.report('热缓存', self.timeit(parser.number, titles, repeat), len(titles))
+
+        # 解析结果统计，以及与旧写法不一致的样例
+        parsed = sum(1 for t in titles if parser.parse(t).number is not None)
+        special = sum(1 for t in titles if parser.is_special(t))
+        changed = [t for t in titles if parser.number(t) != legacy_chapter_number(t)]
+        self.stdout.write(f'识别出序号 {parsed} 个，特殊章节 {special} 个，与旧写法结果不同 {len(changed)} 个')
+        for title in changed[:10]:
+            self.stdout.write(f'  {title!r}: {legacy_chapter_number(title)} -> {parser.number(title)}')
+
+        info = parser.cache_info()
+        self.stdout.write(self.style.SUCCESS(
+            f'缓存命中 {info.hits} 次，未命中 {info.misses} 次，当前条目 {info.currsize}'
+        ))
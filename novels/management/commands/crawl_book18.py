@@ -1,13 +1,15 @@
 from django.core.management.base import BaseCommand
-from novels.models import Novel, Chapter, Category
-from django.utils import timezone
+from novels.models import Novel, Category
 import asyncio
 import random
-import re
 from datetime import datetime
 from pyppeteer import launch
 from pyppeteer_stealth import stealth
 from asgiref.sync import sync_to_async
+from novels import frontier
+from novels.crawling import FETCHERS, BrowserFetcher, HttpFetcher, PagePool, join_paragraphs, parse_html
+from novels.ingest import ChapterWriter
+from urllib.parse import urljoin
 
 # 配置信息
 CHROME_PATH = r"J:\crawler\chrome-win\chrome.exe"  # 请修改为您的 Chrome 路径
@@ -19,6 +21,44 @@ USER_AGENTS = [
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
 ]
 
+HEADERS = {
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate, br'
+}
+
+# 段落中出现这些文字的视为广告
+AD_MARKERS = ('广告', 'APP', 'http', '小黄书')
+AD_TEXTS = AD_MARKERS + ('下载', '关注')
+MIN_PARAGRAPH_LENGTH = 21  # 过滤掉太短的段落
+
+
+def extract_chapter_links(soup, base_url):
+    """章节列表：.chapters 下指向 /fiction/ 的链接"""
+    return [
+        {'title': a.get_text().strip(), 'url': urljoin(base_url, a['href'])}
+        for a in soup.select('.chapters a[href*="/fiction/"]')
+    ]
+
+
+def extract_content(soup):
+    """提取 #content 下的正文段落，去掉广告 span 和广告段落"""
+    content = soup.select_one('#content')
+    if content is None:
+        return ''
+
+    # 移除所有广告 span
+    for span in content.select('span'):
+        if any(marker in span.get_text() for marker in AD_MARKERS):
+            span.decompose()
+
+    # 获取并过滤段落
+    paragraphs = []
+    for p in content.select('p'):
+        text = p.get_text().strip()
+        paragraphs.append('' if any(marker in text for marker in AD_TEXTS) else text)
+    return join_paragraphs(paragraphs, min_length=MIN_PARAGRAPH_LENGTH)
+
+
 class Command(BaseCommand):
     help = '从 book18 网站爬取小说并入库'
 
@@ -26,6 +66,11 @@ class Command(BaseCommand):
         super().__init__()
         self.browser = None
         self.main_page = None
+        self.fetcher_type = 'browser'
+        self.fetcher = None
+        self.probe = None
+        self.writer = None
+        self.full = False
 
     def print_status(self, stage, message, status=None):
         """打印带颜色的状态信息"""
@@ -65,12 +110,57 @@ class Command(BaseCommand):
             await self.main_page.setUserAgent(random.choice(USER_AGENTS))
             await stealth(self.main_page)
             
+            await self.init_fetcher()
+            
             self.print_status("浏览器引擎", "初始化完成", "success")
             return True
         except Exception as e:
             self.print_status("浏览器引擎", f"初始化失败: {str(e)}", "error")
             return False
 
+    async def setup_page(self, page):
+        """小说页和章节页的标签页设置"""
+        await page.setUserAgent(random.choice(USER_AGENTS))
+        await page.setExtraHTTPHeaders(HEADERS)
+        await stealth(page)
+
+    async def init_fetcher(self):
+        """小说页和章节页的抓取后端，列表页始终使用浏览器"""
+        headers = dict(HEADERS, **{'User-Agent': random.choice(USER_AGENTS)})
+        if self.fetcher_type == 'http':
+            self.fetcher = HttpFetcher(headers=headers, concurrency=1)
+        else:
+            self.fetcher = BrowserFetcher(PagePool(self.browser, 1, self.setup_page))
+        await self.fetcher.start()
+        # 小说页先用轻量 HTTP 请求获取，带上次记录的校验值
+        if isinstance(self.fetcher, HttpFetcher):
+            self.probe = self.fetcher
+        else:
+            self.probe = await HttpFetcher(headers=headers, concurrency=1).start()
+
+    async def fetch_novel_page(self, novel, novel_url):
+        """
+        获取小说页，返回 (soup, (etag, last_modified))，目录没有变化（304）时 soup 为 None
+        距上次完整检查超过 TOC_MAX_AGE 时不发条件请求
+        轻量请求拿到的页面里没有章节列表时再用浏览器打开
+        """
+        validators = ('', '')
+        try:
+            # 距上次完整检查过久时不发校验值，避免服务器或缓存一直返回 304
+            if novel is None or self.full or frontier.toc_expired(novel):
+                etag, last_modified = '', ''
+            else:
+                etag, last_modified = novel.toc_etag, novel.toc_last_modified
+            html, *validators = await self.probe.fetch_conditional(novel_url, etag, last_modified)
+            if html is None:
+                return None, tuple(validators)
+            soup = parse_html(html)
+            if extract_chapter_links(soup, novel_url) or self.fetcher is self.probe:
+                return soup, tuple(validators)
+        except Exception as e:
+            self.print_status("小说页面", f"轻量请求失败: {str(e)}", "warning")
+        return await self.fetcher.soup(novel_url), tuple(validators)
+
     async def navigate_page(self, url, page_type="列表页", page=None):
         """页面导航"""
         if page is None:
@@ -89,19 +179,25 @@ class Command(BaseCommand):
         """处理单本小说"""
         self.print_status("小说处理", f"开始处理: {title[:15]}...", "start")
 
-        page = None
         try:
             # ================= 检查现有小说 =================
             novel_exists = await sync_to_async(Novel.objects.filter(title=title).first)()
             novel = novel_exists
 
-            if novel_exists:
-                # 获取现有章节数
-                chapter_count = await sync_to_async(
-                    lambda: Chapter.objects.filter(novel=novel_exists).count()
-                )()
-                self.print_status("章节信息", f"当前章节数：{chapter_count}", "info")
-            else:
+            # ================= 抓取小说页 =================
+            self.print_status("小说页面", f"开始访问: {novel_url}", "start")
+            try:
+                soup, validators = await self.fetch_novel_page(novel_exists, novel_url)
+            except Exception as e:
+                self.print_status("小说页面", f"页面加载失败: {str(e)}", "error")
+                return False
+
+            if soup is None:
+                await sync_to_async(frontier.touch_toc)(novel_exists.id, *validators)
+                self.print_status("章节检查", "目录没有变化（服务器返回 304），跳过", "info")
+                return True
+
+            if not novel_exists:
                 # 创建新小说
                 get_or_create_category = sync_to_async(Category.objects.get_or_create)
                 category, _ = await get_or_create_category(name='网络小说')
@@ -114,95 +210,29 @@ class Command(BaseCommand):
                     intro="正在获取...",
                     source_url=novel_url
                 )
-                chapter_count = 0
-
-            # ================= 页面初始化和导航 =================
-            page = await self.browser.newPage()
-            await page.setUserAgent(random.choice(USER_AGENTS))
-            await page.setExtraHTTPHeaders({
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br'
-            })
-            await stealth(page)
-
-            if not await self.navigate_page(novel_url, "小说页面", page):
-                return False
+
+            async def load_existing():
+                if not novel_exists:
+                    return {}
+                existing = await sync_to_async(frontier.existing_titles)(novel_exists)
+                self.print_status("章节信息", f"当前章节数：{len(existing)}", "info")
+                return existing
 
             try:
                 # 先尝试获取章节列表
-                chapter_links = await page.evaluate('''() => {
-                    const links = document.querySelectorAll('.chapters a[href*="/fiction/"]');
-                    return Array.from(links).map(a => ({
-                        title: a.textContent.trim(),
-                        url: a.href
-                    }));
-                }''')
+                chapter_links = extract_chapter_links(soup, novel_url)
 
                 # 如果没有找到章节列表，尝试直接获取内容
                 if not chapter_links:
                     self.print_status("章节检查", "未找到章节列表，尝试直接获取内容", "warning")
                     
                     # 检查是否有内容
-                    content_js = '''() => {
-                        const content = document.querySelector('#content');
-                        if (!content) return '';
-                        
-                        // 移除所有广告 span
-                        content.querySelectorAll('span').forEach(span => {
-                            if (span.textContent.includes('广告') || 
-                                span.textContent.includes('APP') || 
-                                span.textContent.includes('http') ||
-                                span.textContent.includes('小黄书')) {
-                                span.remove();
-                            }
-                        });
-                        
-                        // 获取并过滤段落
-                        return Array.from(content.querySelectorAll('p'))
-                            .map(p => {
-                                // 克隆节点以避免修改原始DOM
-                                const pClone = p.cloneNode(true);
-                                
-                                // 移除所有广告相关的 span
-                                pClone.querySelectorAll('span').forEach(span => {
-                                    if (span.textContent.includes('广告') || 
-                                        span.textContent.includes('APP') || 
-                                        span.textContent.includes('http') ||
-                                        span.textContent.includes('小黄书')) {
-                                        span.remove();
-                                    }
-                                });
-                                
-                                const text = pClone.textContent.trim();
-                                
-                                // 过滤掉广告文本
-                                if (text.includes('广告') || 
-                                    text.includes('APP') || 
-                                    text.includes('http') || 
-                                    text.includes('小黄书') ||
-                                    text.includes('下载') ||
-                                    text.includes('关注')) {
-                                    return '';
-                                }
-                                
-                                return text;
-                            })
-                            .filter(text => text.length > 20)  // 过滤掉太短的段落
-                            .map(text => '　　' + text)
-                            .join('\\n\\n');
-                    }'''
-
-                    content = await page.evaluate(content_js)
+                    content = extract_content(soup)
 
                     if content:
                         # 如果是新小说或没有章节的小说，创建第一章
-                        if chapter_count == 0:
-                            create_chapter = sync_to_async(Chapter.objects.create)
-                            await create_chapter(
-                                novel=novel,
-                                title='第1章',
-                                content=content
-                            )
+                        if not await load_existing():
+                            await self.writer.put(novel.id, '第1章', content)
                             self.print_status("章节创建", "创建第1章", "success")
                         return True
                     else:
@@ -213,33 +243,65 @@ class Command(BaseCommand):
                 total_chapters = len(chapter_links)
                 self.print_status("章节检查", f"发现 {total_chapters} 个章节", "info")
 
-                # 确定开始下载的章节索引
-                start_index = chapter_count
-                create_chapter = sync_to_async(Chapter.objects.create)
+                # 与上次记录的目录指纹对比
+                urls = [chapter_info['url'] for chapter_info in chapter_links]
+                toc_status, tail_start = frontier.compare_toc(novel_exists, urls)
+                if self.full:
+                    toc_status, tail_start = 'changed', 0
+                if toc_status == 'unchanged':
+                    await sync_to_async(frontier.save_toc)(novel.id, urls, *validators)
+                    self.print_status("章节检查", "目录指纹没有变化，跳过", "info")
+                    return True
+
+                # 确定要下载的章节：目录只在末尾追加时直接从上次记录的位置开始，
+                # 并按标题跳过库中已有的章节（不按章节数推算，中间写入失败的章节下次仍会补上）
+                start_index = 0
+                if toc_status == 'grown':
+                    start_index = tail_start
+                    self.print_status("章节检查", f"目录末尾新增 {total_chapters - tail_start} 章", "info")
+                existing = await load_existing()
 
                 # 下载新章节
+                failed_before = self.writer.failed
                 for idx, chapter_info in enumerate(chapter_links[start_index:], start=start_index + 1):
-                    chapter_page = await self.browser.newPage()
+                    if f'第{idx}章' in existing:
+                        continue
                     try:
-                        await chapter_page.goto(chapter_info['url'], {'waitUntil': 'networkidle0'})
-                        content = await chapter_page.evaluate(content_js)
+                        content = extract_content(await self.fetcher.soup(chapter_info['url']))
 
                         if content:
-                            await create_chapter(
-                                novel=novel,
-                                title=f'第{idx}章',
-                                content=content
-                            )
-                            self.print_status("章节下载", f"已下载：第{idx}/{total_chapters}章", "success")
+                            # 交给写入任务，不等待写库
+                            await self.writer.put(novel.id, f'第{idx}章', content)
+                            self.print_status("章节下载", f"已下载：第{idx}/{total_chapters}章，"
+                                                         f"写入队列 {self.writer.depth}", "success")
                     except Exception as e:
                         self.print_status("章节下载", f"第{idx}章下载失败: {str(e)}", "error")
                     finally:
-                        await chapter_page.close()
                         await asyncio.sleep(1)
 
+                # 等这本小说的章节写完，写入失败的章节不在库中，下次运行按标题补抓
+                await self.writer.join()
+                write_failed = self.writer.failed - failed_before
+                if write_failed:
+                    self.print_status("数据入库", f"{write_failed} 章写入失败，下次运行时重新下载", "error")
+
                 # 更新小说信息
                 update_novel = sync_to_async(lambda n: setattr(n, 'intro', f'共{total_chapters}章') or n.save())
                 await update_novel(novel)
+
+                # 记录目录指纹，下次没有变化时直接跳过（放在 save() 之后，避免被内存中的旧值覆盖）。
+                # 只记录已经全部入库的前缀：有章节下载或写入失败时不保存校验值，
+                # 下次按“末尾追加”从第一个缺失的章节继续，不会被 304 或指纹跳过
+                stored = await sync_to_async(frontier.existing_titles)(novel)
+                complete = 0
+                while complete < total_chapters and f'第{complete + 1}章' in stored:
+                    complete += 1
+                if complete == total_chapters:
+                    await sync_to_async(frontier.save_toc)(novel.id, urls, *validators)
+                else:
+                    self.print_status("章节检查", f"第{complete + 1}章起尚未全部入库，下次运行继续", "warning")
+                    if complete:
+                        await sync_to_async(frontier.save_toc)(novel.id, urls[:complete])
                 
                 return True
 
@@ -251,18 +313,16 @@ class Command(BaseCommand):
             self.print_status("处理流程", f"处理失败: {str(e)}", "error")
             return False
         finally:
-            if page:
-                try:
-                    await asyncio.shield(page.close())
-                except Exception as e:
-                    self.print_status("页面关闭", f"关闭异常: {str(e)}", "warning")
-                await asyncio.sleep(1)
+            await asyncio.sleep(1)
 
     async def run(self):
         """运行爬虫"""
         if not await self.init_browser():
             return
 
+        # 抓取和写库分开：写入任务在后台按批提交
+        self.writer = await ChapterWriter().start()
+
         try:
             if not await self.navigate_page(LIST_PAGE_URL):
                 return
@@ -285,13 +345,34 @@ class Command(BaseCommand):
                 await asyncio.sleep(random.uniform(2, 5))
 
         finally:
+            await self.writer.close()
+            self.print_status("写入统计", self.writer.describe(), "info")
+            if self.probe and self.probe is not self.fetcher:
+                await self.probe.close()
+            if self.fetcher:
+                await self.fetcher.close()
             if self.browser:
                 await self.browser.close()
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fetcher',
+            choices=FETCHERS,
+            default='browser',
+            help='小说页和章节页的抓取方式：browser 使用浏览器标签页，http 使用轻量 HTTP 客户端（列表页始终使用浏览器）'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='忽略目录指纹，完整检查每本小说'
+        )
+
     def handle(self, *args, **options):
         """命令入口"""
         self.print_status("爬虫启动", "开始运行", "start")
         try:
+            self.fetcher_type = options.get('fetcher') or 'browser'
+            self.full = options.get('full', False)
             asyncio.run(self.run())
         except KeyboardInterrupt:
             self.print_status("系统中断", "用户终止操作", "warning")
@@ -5,14 +5,39 @@ from django.utils import timezone  # 添加这个导入
 import asyncio
 from xchina import Book18Crawler, print_status, LIST_PAGE_URL, USER_AGENTS  # 添加 USER_AGENTS
 from asgiref.sync import sync_to_async  # 添加这个导入
+from novels import frontier
+from novels.crawling import FETCHERS, BrowserFetcher, HttpFetcher, PagePool, join_paragraphs
+from novels.ingest import ChapterWriter
 import random
 import re
 
+CONTENT_SELECTOR = 'div.fiction-body div.content'
+
+
+def extract_content(soup):
+    """提取章节正文段落"""
+    content = soup.select_one(CONTENT_SELECTOR)
+    if content is None:
+        return ''
+    return join_paragraphs(p.get_text() for p in content.find_all('p'))
+
+
 class Command(BaseCommand):
     help = '从xchina爬取小说内容'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fetcher',
+            choices=FETCHERS,
+            default='browser',
+            help='章节页的抓取方式：browser 使用浏览器标签页，http 使用轻量 HTTP 客户端（列表页始终使用浏览器）'
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('开始爬取小说...'))
+        self.fetcher_type = options.get('fetcher') or 'browser'
+        self.fetcher = None
+        self.writer = None
         
         # 运行爬虫
         crawler = Book18Crawler()
@@ -28,11 +53,25 @@ class Command(BaseCommand):
         
         self.stdout.write(self.style.SUCCESS('爬虫任务完成'))
 
+    async def init_fetcher(self, crawler):
+        """章节页的抓取后端"""
+        if self.fetcher_type == 'http':
+            self.fetcher = HttpFetcher(headers={'User-Agent': random.choice(USER_AGENTS)}, concurrency=1)
+        else:
+            async def setup(page):
+                await page.setUserAgent(random.choice(USER_AGENTS))
+            self.fetcher = BrowserFetcher(PagePool(crawler.browser, 1, setup))
+        await self.fetcher.start()
+
     async def _run_crawler(self, crawler):
         if not await crawler.init_browser():
             return
 
         try:
+            await self.init_fetcher(crawler)
+            # 抓取和写库分开：写入任务在后台按批提交
+            self.writer = await ChapterWriter().start()
+
             # 使用导入的 LIST_PAGE_URL
             if not await crawler.navigate_page(LIST_PAGE_URL):
                 return
@@ -47,6 +86,11 @@ class Command(BaseCommand):
                 await self.process_article(crawler, article)
 
         finally:
+            if self.writer:
+                await self.writer.close()
+                print_status("写入统计", self.writer.describe(), "success")
+            if self.fetcher:
+                await self.fetcher.close()
             if crawler.browser:
                 await crawler.browser.close()
 
@@ -88,67 +132,41 @@ class Command(BaseCommand):
                 # 等待章节列表加载
                 await page.waitForSelector('div.chapters', {'timeout': 30000})
 
-                # 提取所有章节链接
-                chapter_links = await page.querySelectorAll('div.chapters a[href*="/fiction/id-"]')
+                # 一次提取所有章节链接
+                chapter_links = await page.evaluate('''() => {
+                    return Array.from(document.querySelectorAll('div.chapters a[href*="/fiction/id-"]'))
+                        .map(a => ({title: a.textContent.trim(), url: a.href}));
+                }''')
                 if not chapter_links:
                     print_status("章节提取", "未找到章节链接", "warning")
                     return
 
-                for i, chapter in enumerate(chapter_links, 1):
-                    chapter_url = await page.evaluate('(el) => el.href', chapter)
-                    chapter_title = await page.evaluate('(el) => el.textContent.trim()', chapter)
-                    print_status("章节处理", f"处理章节 {i}: {chapter_title}", "start")
+                # 一次读出已有章节，在内存中找出缺失的章节
+                existing = await sync_to_async(frontier.existing_titles)(novel)
+                missing = frontier.plan_missing(existing, chapter_links)
+                print_status("章节对比", f"共 {len(chapter_links)} 章，已有 {len(existing)} 章，需要下载 {len(missing)} 章", "start")
+                failed_before = self.writer.failed
 
-                    # 检查章节是否已存在
-                    chapter_exists = sync_to_async(Chapter.objects.filter(novel=novel, title=chapter_title).exists)
-                    if await chapter_exists():
-                        print_status("章节处理", f"章节已存在: {chapter_title}", "warning")
-                        continue
+                for i, chapter in enumerate(missing, 1):
+                    chapter_url = chapter['url']
+                    chapter_title = chapter['title']
+                    print_status("章节处理", f"处理章节 {i}/{len(missing)}: {chapter_title}", "start")
 
-                    chapter_page = None
                     try:
-                        chapter_page = await crawler.browser.newPage()
-                        await chapter_page.setUserAgent(random.choice(USER_AGENTS))
-                        
-                        if not await crawler.navigate_page(chapter_url, "章节页", chapter_page):
-                            print_status("章节处理", f"章节 {i}: 加载失败，跳过", "warning")
-                            continue
-
-                        # 等待正文加载
-                        await chapter_page.waitForSelector('div.fiction-body div.content', {'timeout': 30000})
+                        print_status("章节页", f"开始访问: {chapter_url}", "start")
+                        soup = await self.fetcher.soup(chapter_url, wait_for=CONTENT_SELECTOR)
 
                         # 提取章节正文
-                        content = await chapter_page.evaluate('''() => {
-                            const contentElement = document.querySelector('div.fiction-body div.content');
-                            if (!contentElement) return '';
-
-                            const paragraphs = contentElement.getElementsByTagName('p');
-                            if (!paragraphs || paragraphs.length === 0) return '';
-
-                            let result = [];
-                            for (let p of paragraphs) {
-                                const text = p.innerText.trim();
-                                if (text.length > 0) {
-                                    result.push('　　' + text);
-                                }
-                            }
-                            return result.join('\\n\\n');
-                        }''')
+                        content = extract_content(soup)
 
                         if content:
                             content = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]', '', content)
                             content = re.sub(r'^关注.*?下载APP$|^广告.*?$|^看精彩成人小说上《小黄书》：https://xchina\.store$|^看精彩成人小说上《小黄书》.*?$', '', content, flags=re.MULTILINE)
                             content = re.sub(r'\n{4,}', '\n\n', content)
                             
-                            # 保存到数据库
-                            create_chapter = sync_to_async(Chapter.objects.create)
-                            await create_chapter(
-                                novel=novel,
-                                title=chapter_title,
-                                content=content,
-                                created_at=now
-                            )
-                            print_status("数据入库", f"新增章节: {chapter_title}", "success")
+                            # 交给写入任务，不等待写库
+                            await self.writer.put(novel.id, chapter_title, content)
+                            print_status("数据入库", f"新增章节: {chapter_title}（写入队列 {self.writer.depth}）", "success")
                         else:
                             print_status("章节处理", f"章节 {i}: {chapter_title} 未找到正文", "warning")
 
@@ -156,10 +174,14 @@ class Command(BaseCommand):
                         print_status("章节处理", f"章节 {i}: 处理异常 - {str(e)}", "error")
                         continue
                     finally:
-                        if chapter_page:
-                            await chapter_page.close()
                         await asyncio.sleep(random.uniform(2, 4))
 
+                # 等这篇文章的章节写完；写入失败的章节不在库中，下次运行对比时会重新下载
+                await self.writer.join()
+                write_failed = self.writer.failed - failed_before
+                if write_failed:
+                    print_status("数据入库", f"{write_failed} 章写入失败，下次运行时重新下载", "error")
+
             finally:
                 if page:
                     await page.close()
@@ -1,6 +1,12 @@
 from django.core.management.base import BaseCommand
-from novels.models import Novel, Chapter, Category
-from django.utils import timezone
+from novels.crawling import (
+    DEFAULT_RATE, DEFAULT_WORKERS, FETCHERS, BrowserFetcher, HostLimiter, HttpFetcher, PagePool,
+    join_paragraphs, parse_html, run_queue,
+)
+from novels import frontier
+from novels.headings import chapter_number, is_special
+from novels.ingest import ChapterWriter
+from novels.models import Novel, Category, CrawlTask
 import asyncio
 import random
 import re
@@ -9,6 +15,7 @@ from pyppeteer import launch
 from pyppeteer_stealth import stealth
 from asgiref.sync import sync_to_async
 import time
+from urllib.parse import urljoin
 from fake_useragent import UserAgent
 
 # 配置信息
@@ -41,6 +48,39 @@ HEADERS = {
     'Upgrade-Insecure-Requests': '1'
 }
 
+
+def extract_chapter_content(soup):
+    """提取章节正文：.novel-body 下的非空段落"""
+    body = soup.select_one('.novel-body')
+    if body is None:
+        return ''
+    return join_paragraphs(p.get_text() for p in body.select('p'))
+
+
+def extract_toc_links(soup, base_url):
+    """小说页 HTML 中直接可见的章节链接"""
+    return [
+        {'title': a.get_text().strip(), 'url': urljoin(base_url, a['href'])}
+        for a in soup.select('.list a[href]')
+    ]
+
+
+def toc_signature(soup, base_url):
+    """
+    预检指纹：服务器直接返回的目录数据（可见链接和页面内嵌的章节 JSON）
+    浏览器中合并、去重、排序后的目录与它不可比，只能和上次预检的指纹比较；
+    页面里没有任何目录数据（如只返回前端页面壳）时返回空字符串，表示无法比较
+    """
+    parts = [link['url'] for link in extract_toc_links(soup, base_url)]
+    for script in soup.select('script'):
+        text = script.string or ''
+        if script.get('type') == 'application/json' or '__INITIAL_STATE__' in text:
+            parts.append(text.strip())
+    if not any(parts):
+        return ''
+    return frontier.toc_fingerprint(parts)
+
+
 class Command(BaseCommand):
     help = '从 xqbj 网站爬取小说并入库'
 
@@ -50,6 +90,14 @@ class Command(BaseCommand):
         self.main_page = None
         self.ua = UserAgent()
         self.last_request_time = time.time()
+        self.list_url = LIST_PAGE_URL
+        self.workers = DEFAULT_WORKERS
+        self.limiter = HostLimiter(DEFAULT_RATE, DEFAULT_WORKERS)
+        self.fetcher_type = 'browser'
+        self.fetcher = None
+        self.probe = None
+        self.writer = None
+        self.full = False
 
     def clean_chapter_title(self, title):
         """清理章节标题，去除时间戳格式和多余空白"""
@@ -66,15 +114,8 @@ class Command(BaseCommand):
         return title
         
     def extract_chapter_number(self, title):
-        """从章节标题中提取章节序号"""
-        match = re.search(r'第(\d+)章', title)
-        if match:
-            return int(match.group(1))
-        # 尝试其他可能的格式
-        numbers = re.findall(r'\d+', title)
-        if numbers:
-            return int(numbers[0])
-        return 0
+        """从章节标题中提取章节序号（支持中文数字）"""
+        return chapter_number(title)
 
     def print_status(self, stage, message, status=None):
         """打印带颜色的状态信息"""
@@ -100,6 +141,119 @@ class Command(BaseCommand):
         sleep_time = random.uniform(min_time, max_time)
         await asyncio.sleep(sleep_time)
 
+    async def setup_page(self, page):
+        """章节标签页的初始设置，每个标签页只做一次"""
+        await page.setUserAgent(self.ua.random)
+        await page.setExtraHTTPHeaders(HEADERS)
+
+    async def init_fetcher(self):
+        """章节页的抓取后端：正文由服务器渲染，可以不经过浏览器"""
+        headers = dict(HEADERS, **{'User-Agent': self.ua.random})
+        if self.fetcher_type == 'http':
+            self.fetcher = HttpFetcher(self.limiter, headers, self.workers)
+        else:
+            # 使用固定数量的标签页循环复用
+            self.fetcher = BrowserFetcher(PagePool(self.browser, self.workers, self.setup_page), self.limiter)
+        await self.fetcher.start()
+        # 目录预检总是用轻量 HTTP 请求
+        if isinstance(self.fetcher, HttpFetcher):
+            self.probe = self.fetcher
+        else:
+            self.probe = await HttpFetcher(self.limiter, headers, 1).start()
+
+    async def probe_toc(self, novel, url):
+        """
+        用一次 HTTP 请求判断目录是否变化，返回 (是否没有变化, (etag, last_modified), 预检指纹)
+        服务器支持条件请求时直接看 304，否则与上次预检的指纹对比；
+        新小说、--full 或距上次完整检查超过 TOC_MAX_AGE 时只计算指纹，供完整检查后保存
+        """
+        check = novel is not None and not self.full
+        if check and frontier.toc_expired(novel):
+            self.print_status("目录预检", "距上次完整检查时间过长，改为完整检查", "info")
+            check = False
+        try:
+            html, etag, last_modified = await self.probe.fetch_conditional(
+                url, *((novel.toc_etag, novel.toc_last_modified) if check else ('', ''))
+            )
+        except Exception as e:
+            self.print_status("目录预检", f"预检失败，改为完整检查: {str(e)}", "warning")
+            return False, ('', ''), ''
+
+        if html is None:
+            probe_hash = novel.toc_probe_hash
+            reason = '服务器返回 304'
+        else:
+            probe_hash = toc_signature(parse_html(html), url)
+            if not (check and probe_hash and novel.toc_probe_hash == probe_hash):
+                return False, (etag, last_modified), probe_hash
+            reason = '页面中的目录数据没有变化'
+        await sync_to_async(frontier.touch_toc)(novel.id, etag, last_modified)
+        self.print_status("目录预检", f"目录没有变化（{reason}），跳过", "info")
+        return True, (etag, last_modified), probe_hash
+
+    async def fetch_chapter_content(self, url):
+        """抓取章节页并提取正文，请求受主机限速约束"""
+        return extract_chapter_content(await self.fetcher.soup(url))
+
+    def on_chapters_written(self, items, inserted):
+        """一批章节提交后（在写入线程中）标记抓取任务完成，并登记到已有章节"""
+        frontier.mark_done_many(item.meta['task_id'] for item in items if item.meta.get('task_id'))
+        for item in items:
+            existing = item.meta.get('existing')
+            if existing is not None:
+                existing[item.title] = inserted.get((item.novel_id, item.title), existing.get(item.title))
+
+    async def download_chapters(self, novel, chapters=(), existing=None):
+        """
+        把缺失的章节登记到抓取队列，再由多个工作协程并发下载这本小说所有到期的任务
+        existing 为已有章节的 {标题: id}，没有传入时读取一次；写入成功的章节会加入其中
+        章节抓取后交给写入任务，提交后立即记录状态，返回失败的章节列表
+        """
+        if chapters:
+            await sync_to_async(frontier.enqueue)(novel, chapters)
+        tasks = await sync_to_async(frontier.due_tasks)(novel)
+        if not tasks:
+            return []
+        if existing is None:
+            existing = await sync_to_async(frontier.existing_titles)(novel)
+
+        # 队列中较早登记的章节可能已经入库，直接标记完成
+        chapters = []
+        done = []
+        for task in tasks:
+            title = self.clean_chapter_title(task.title)
+            if title in existing:
+                done.append(task.id)
+            else:
+                chapters.append({'title': title, 'url': task.url, 'order': task.order, 'task_id': task.id})
+        if done:
+            await sync_to_async(frontier.mark_done_many)(done)
+
+        total = len(chapters)
+        start = time.perf_counter()
+
+        async def handle(item):
+            idx, chapter_info = item
+            success = await self.process_chapter(novel, chapter_info, idx, total, existing)
+            if success:
+                return None
+            await sync_to_async(frontier.mark_failed)(chapter_info['task_id'], chapter_info.get('error', ''))
+            return chapter_info
+
+        results = await run_queue(enumerate(chapters, 1), handle, self.workers)
+        failed = [chapter_info for chapter_info in results if chapter_info]
+
+        elapsed = time.perf_counter() - start
+        if total:
+            self.print_status("下载统计", f"{total - len(failed)}/{total} 章，用时 {elapsed:.1f} 秒，"
+                                         f"{total / elapsed if elapsed else 0:.2f} 章/秒", "info")
+
+        # 等这本小说的章节全部写完，之后的完整性检查和章节计数才准确
+        await self.writer.join()
+        if total:
+            self.print_status("写入统计", self.writer.describe(), "info")
+        return failed
+
     async def init_browser(self):
         """初始化浏览器"""
         self.print_status("浏览器引擎", "开始初始化", "start")
@@ -134,6 +288,8 @@ class Command(BaseCommand):
                 Object.defineProperty(navigator, 'plugins', {get: () => [1, 2, 3, 4, 5]});
                 window.chrome = { runtime: {} };
             }''')
+
+            await self.init_fetcher()
             
             self.print_status("浏览器引擎", "初始化完成", "success")
             return True
@@ -173,7 +329,6 @@ class Command(BaseCommand):
                     for idx, novel in enumerate(novels, 1):
                         self.print_status("进度", f"第{page}页 - 处理第 {idx}/{len(novels)} 本", "info")
                         await self.process_novel(novel)
-                        await self.random_sleep(2, 4)  # 小说间短暂等待
                     
                     # 当前页处理完成后，检查是否有下一页
                     next_button = await self.main_page.querySelector('.van-pagination__item--next:not(.van-pagination__item--disabled)')
@@ -200,19 +355,27 @@ class Command(BaseCommand):
         """处理单本小说"""
         self.print_status("小说处理", f"开始处理: {novel_info['title']}", "start")
         
-        # 增加处理每本小说前的随机等待
-        await self.random_sleep(WAIT_TIME['novel_min'], WAIT_TIME['novel_max'])
-        
         try:
+            # 检查小说是否已存在；先预检，已有小说的目录没有变化就不打开浏览器
+            novel_exists = await sync_to_async(Novel.objects.filter(title=novel_info['title']).first)()
+            unchanged, validators, probe_hash = await self.probe_toc(novel_exists, novel_info['url'])
+            if unchanged:
+                # 目录没有变化，不会重新登记章节：冷却期满的放弃任务在这里重新排队，
+                # 再处理队列中到期重试的章节
+                await sync_to_async(frontier.revive_failed)(novel_exists)
+                await self.download_chapters(novel_exists)
+                return True
+
             page = await self.browser.newPage()
-            await page.setUserAgent(self.ua.random)
-            await page.setExtraHTTPHeaders(HEADERS)
+            await self.setup_page(page)
             
             try:
-                await page.goto(novel_info['url'], {
-                    'waitUntil': 'networkidle0',
-                    'timeout': 30000
-                })
+                # 小说页和章节页共用同一个主机的限速
+                async with self.limiter.slot(novel_info['url']):
+                    await page.goto(novel_info['url'], {
+                        'waitUntil': 'networkidle0',
+                        'timeout': 30000
+                    })
                 
                 # 等待章节列表加载
                 await page.waitForSelector('.list')
@@ -308,18 +471,37 @@ class Command(BaseCommand):
 
                 total_chapters = len(all_chapters)
                 self.print_status("章节列表", f"找到 {total_chapters} 个章节", "success")
-                
-                # 检查小说是否已存在
-                novel_exists = await sync_to_async(Novel.objects.filter(title=novel_info['title']).first)()
+
+                # 数据库中保存的是清理后的标题，对比前统一清理
+                for chapter in all_chapters:
+                    chapter['title'] = self.clean_chapter_title(chapter['title'])
+
+                # 与上次记录的目录指纹对比
+                urls = [chapter['url'] for chapter in all_chapters]
+                toc_status, tail_start = frontier.compare_toc(novel_exists, urls)
+                if self.full:
+                    toc_status, tail_start = 'changed', 0
+                if toc_status == 'unchanged':
+                    await sync_to_async(frontier.save_toc)(novel_exists.id, urls, *validators, probe_hash)
+                    self.print_status("章节对比", "目录指纹没有变化，跳过", "info")
+                    await self.download_chapters(novel_exists)
+                    return True
                 
                 if novel_exists:
-                    # 获取现有章节数和章节标题列表
-                    existing_chapters = await sync_to_async(lambda: list(Chapter.objects.filter(novel=novel_exists).values_list('title', flat=True)))()
-                    self.print_status("章节信息", f"数据库中已有 {len(existing_chapters)} 章", "info")
+                    # 一次读出现有章节的标题，在内存中与目录对比
+                    existing = await sync_to_async(frontier.existing_titles)(novel_exists)
+                    self.print_status("章节信息", f"数据库中已有 {len(existing)} 章", "info")
                     
+                    # 目录只在末尾追加时只对比新增部分
+                    candidates = all_chapters
+                    if toc_status == 'grown':
+                        candidates = all_chapters[tail_start:]
+                        self.print_status("章节对比", f"目录末尾新增 {len(candidates)} 章，只抓取新增部分", "info")
+
                     # 找出需要新增的章节
-                    new_chapters = [chapter for chapter in all_chapters if chapter['title'] not in existing_chapters]
+                    new_chapters = frontier.plan_missing(existing, candidates)
                     if not new_chapters:
+                        await sync_to_async(frontier.save_toc)(novel_exists.id, urls, *validators, probe_hash)
                         self.print_status("章节对比", "无需更新章节", "info")
                         return True
                         
@@ -340,30 +522,27 @@ class Command(BaseCommand):
                         source_url=novel_info['url']
                     )
                     self.print_status("小说创建", "新建小说成功", "success")
-                    chapters_to_process = all_chapters
+                    existing = {}
+                    chapters_to_process = frontier.plan_missing(existing, all_chapters)
 
-                # 记录处理失败的章节
-                failed_chapters = []
-                
-                # 处理需要下载的章节
-                for idx, chapter_info in enumerate(chapters_to_process, 1):
-                    success = await self.process_chapter(novel, chapter_info, idx, len(chapters_to_process))
-                    if not success:
-                        # 记录失败的章节
-                        failed_chapters.append(chapter_info)
+                # 并发下载需要的章节，记录处理失败的章节
+                failed_chapters = await self.download_chapters(novel, chapters_to_process, existing)
 
                 # 记录失败的章节到文件，便于后续处理
                 if failed_chapters:
-                    self.print_status("章节统计", f"有 {len(failed_chapters)} 章下载失败，已记录", "warning")
-                    await self.save_failed_chapters(novel.title, failed_chapters)
+                    self.print_status("章节统计", f"有 {len(failed_chapters)} 章下载失败，已加入重试队列", "warning")
                 
-                # 再次检查是否有遗漏章节
-                await self.verify_chapters_completeness(novel, all_chapters)
-                    
+                # 再次检查是否有遗漏章节（目录只是追加时前面部分上次已经检查过）
+                if toc_status != 'grown':
+                    await self.verify_chapters_completeness(novel, all_chapters, existing)
+
                 # 更新小说信息
-                current_chapter_count = await sync_to_async(lambda: Chapter.objects.filter(novel=novel).count())()
+                current_chapter_count = len(existing)
                 update_novel = sync_to_async(lambda n: setattr(n, 'intro', f'共{current_chapter_count}章') or n.save())
                 await update_novel(novel)
+
+                # 记录目录指纹，下次没有变化时直接跳过（放在 save() 之后，避免被内存中的旧值覆盖）
+                await sync_to_async(frontier.save_toc)(novel.id, urls, *validators, probe_hash)
                 
                 return True
 
@@ -374,84 +553,41 @@ class Command(BaseCommand):
             self.print_status("小说处理", f"处理失败: {str(e)}", "error")
             return False
 
-    async def process_chapter(self, novel, chapter_info, idx, total):
-        """处理单个章节"""
+    async def process_chapter(self, novel, chapter_info, idx, total, existing=None):
+        """处理单个章节：抓取正文后放进写入队列，不等待写库"""
         max_retries = 3
         retry_count = 0
         
-        # 清理章节标题
-        clean_title = self.clean_chapter_title(chapter_info['title'])
-        
-        # 首先检查章节是否已存在 (使用清理后的标题)
-        existing_chapter = await sync_to_async(lambda: Chapter.objects.filter(
-            novel=novel,
-            title=clean_title
-        ).first())()
-        
-        if existing_chapter:
-            # 如果章节已存在，直接跳过
-            self.print_status("章节处理", f"章节已存在，跳过：{clean_title} ({idx}/{total})", "info")
-            return True
-            
-        # 更新章节标题为清理后的标题
-        chapter_info['title'] = clean_title
+        # 已有的章节在登记前已经按标题排除，这里不再逐章查询
+        chapter_info['title'] = self.clean_chapter_title(chapter_info['title'])
         
         while retry_count < max_retries:
             try:
-                chapter_page = await self.browser.newPage()
-                await chapter_page.setUserAgent(self.ua.random)
-                await chapter_page.setExtraHTTPHeaders(HEADERS)
-                
-                await self.random_sleep()
-                await chapter_page.goto(chapter_info['url'], {
-                    'waitUntil': 'networkidle0',
-                    'timeout': 30000
-                })
-                
-                content = await chapter_page.evaluate('''() => {
-                    const content = document.querySelector('.novel-body');
-                    if (!content) return '';
-                    return Array.from(content.querySelectorAll('p'))
-                        .map(p => p.textContent.trim())
-                        .filter(text => text.length > 0)
-                        .map(text => '　　' + text)
-                        .join('\\n\\n');
-                }''')
+                content = await self.fetch_chapter_content(chapter_info['url'])
 
                 if content:
                     # 使用章节信息中的order值（如果有）
                     chapter_order = chapter_info.get('order', self.extract_chapter_number(chapter_info['title']))
                     
-                    # 清理章节标题
-                    clean_title = self.clean_chapter_title(chapter_info['title'])
-                    
-                    # 创建新章节
-                    await sync_to_async(Chapter.objects.create)(
-                        novel=novel,
-                        title=clean_title,
-                        content=content,
-                        order=chapter_order  # 使用正确的排序值
+                    # 交给写入任务，已存在的同名章节由唯一约束跳过
+                    await self.writer.put(
+                        novel.id, chapter_info['title'], content, chapter_order,
+                        task_id=chapter_info.get('task_id'), existing=existing
                     )
-                    self.print_status("章节下载", f"已下载：{chapter_info['title']} ({idx}/{total})", "success")
+                    self.print_status("章节下载", f"已下载：{chapter_info['title']} ({idx}/{total})，"
+                                                 f"写入队列 {self.writer.depth}", "success")
                     break  # 成功处理，跳出重试循环
                 else:
                     self.print_status("章节下载", f"章节内容为空：{chapter_info['title']}", "warning")
+                    chapter_info['error'] = '章节内容为空'
                     retry_count += 1
                     
             except Exception as e:
                 retry_count += 1
+                chapter_info['error'] = str(e)
                 self.print_status("章节下载", f"下载失败: {chapter_info['title']}\n                                    {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - {str(e)} (重试 {retry_count}/{max_retries})", "error")
                 
-                # 如果是唯一性约束错误，说明章节已存在但前面的检查没有捕获到
-                # 这可能是因为并发问题或数据库同步延迟
-                if "UNIQUE constraint failed" in str(e) and "novels_chapter.novel_id, novels_chapter.title" in str(e):
-                    self.print_status("章节处理", f"章节已存在（并发检测）：{chapter_info['title']}", "info")
-                    return True  # 视为成功，直接返回
-                
-                await self.random_sleep(2, 5)  # 失败后等待时间更长
-                
-            finally:
-                await chapter_page.close()
+                await asyncio.sleep(2 ** retry_count)  # 失败后逐次加长等待
         
         # 如果所有重试都失败，记录到失败列表
         if retry_count >= max_retries:
@@ -460,219 +596,85 @@ class Command(BaseCommand):
         
         return True
 
-    async def save_failed_chapters(self, novel_title, failed_chapters):
-        """保存失败的章节信息到文件"""
-        import json
-        import os
-        
-        # 创建失败记录目录
-        os.makedirs('failed_chapters', exist_ok=True)
-        
-        # 文件名使用小说标题
-        safe_title = re.sub(r'[\\/*?:"<>|]', "_", novel_title)
-        filename = f'failed_chapters/{safe_title}.json'
-        
-        # 读取现有失败记录
-        existing_data = []
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as f:
-                try:
-                    existing_data = json.load(f)
-                except:
-                    pass
-        
-        # 合并新的失败记录
-        existing_urls = [item['url'] for item in existing_data]
-        for chapter in failed_chapters:
-            if chapter['url'] not in existing_urls:
-                existing_data.append(chapter)
-        
-        # 保存到文件
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=2)
-
-    async def verify_chapters_completeness(self, novel, all_chapters):
-        """验证章节完整性并按顺序补充缺失章节"""
-        # 获取数据库中的章节
-        db_chapters = await sync_to_async(lambda: list(Chapter.objects.filter(novel=novel).values('title', 'id', 'order')))()
-        
-        # 创建章节标题到ID的映射
-        db_chapter_map = {c['title']: c for c in db_chapters}
-        db_chapter_titles = set(db_chapter_map.keys())
-        
-        # 比较章节数量
-        self.print_status("章节信息", f"数据库中已有 {len(db_chapters)} 章", "info")
-        self.print_status("章节对比", f"发现 {len(all_chapters) - len(db_chapters)} 章需要更新", "info")
-        
-        # 清理all_chapters中的标题
-        cleaned_all_chapters = []
-        for chapter in all_chapters:
-            cleaned_chapter = chapter.copy()
-            cleaned_chapter['title'] = self.clean_chapter_title(chapter['title'])
-            cleaned_chapter['original_title'] = chapter['title']  # 保留原始标题用于调试
-            cleaned_all_chapters.append(cleaned_chapter)
-        
-        # 如果章节数量相同，可能不需要更新
-        if len(cleaned_all_chapters) == len(db_chapters) and all(c['title'] in db_chapter_titles for c in cleaned_all_chapters):
-            self.print_status("章节完整性", "章节数量相同且标题匹配，无需更新", "success")
-            return
-        
+    async def verify_chapters_completeness(self, novel, all_chapters, existing):
+        """验证章节完整性并按顺序补充缺失章节，all_chapters 的标题已清理，existing 为已有章节的 {标题: id}"""
+        self.print_status("章节信息", f"数据库中已有 {len(existing)} 章", "info")
+
         # 找出缺失的章节
-        missing_chapters = []
-        for chapter in cleaned_all_chapters:
-            if chapter['title'] not in db_chapter_titles:
-                chapter['number'] = self.extract_chapter_number(chapter['title'])
-                # 检查是否是番外章节
-                chapter['is_special'] = any(keyword in chapter['title'] for keyword in 
-                                           ['番外', '后记', '附录', '特别篇', '外传'])
-                missing_chapters.append(chapter)
-        
+        missing_chapters = frontier.plan_missing(existing, all_chapters)
         if not missing_chapters:
             self.print_status("章节完整性", "所有章节已完整下载", "success")
             return
+
+        for chapter in missing_chapters:
+            chapter['number'] = self.extract_chapter_number(chapter['title'])
+            # 检查是否是番外章节
+            chapter['is_special'] = is_special(chapter['title'])
         
         # 按章节类型和序号排序：正常章节在前，番外在后
         missing_chapters.sort(key=lambda x: (1 if x['is_special'] else 0, x['number']))
         
         self.print_status("章节完整性", f"发现 {len(missing_chapters)} 章缺失，尝试补充下载", "warning")
         
-        # 下载缺失的章节
-        failed_chapters = []
-        for idx, chapter_info in enumerate(missing_chapters, 1):
-            # 设置正确的order值
+        # 设置正确的order值
+        for chapter_info in missing_chapters:
             if chapter_info['is_special']:
                 # 番外章节使用大序号，确保排在最后
                 chapter_info['order'] = 1000000 + chapter_info['number']
             else:
                 # 正常章节使用提取的序号
                 chapter_info['order'] = chapter_info['number']
-            
-            success = await self.process_chapter(novel, chapter_info, idx, len(missing_chapters))
-            if not success:
-                failed_chapters.append(chapter_info)
-
-    async def process_failed_chapters(self):
-        """处理之前失败的章节"""
-        import json
-        import os
-        import glob
         
-        # 查找所有失败记录文件
-        failed_files = glob.glob('failed_chapters/*.json')
-        if not failed_files:
-            self.print_status("失败章节", "没有找到失败章节记录", "info")
+        # 下载缺失的章节
+        await self.download_chapters(novel, missing_chapters, existing)
+
+    async def process_frontier(self):
+        """继续抓取队列中到期的章节，不需要重新打开列表页和小说页"""
+        # 旧版本把失败章节记录在 failed_chapters/*.json 中，先导入队列
+        imported, skipped = await sync_to_async(frontier.import_legacy)()
+        if imported:
+            self.print_status("失败章节", f"从旧的失败记录导入 {imported} 个章节", "info")
+        for path in skipped:
+            self.print_status("失败章节", f"无法导入失败记录: {path}", "warning")
+
+        novels = await sync_to_async(frontier.pending_novels)()
+        if not novels:
+            self.print_status("抓取队列", "没有到期的章节", "info")
             return
-        
-        self.print_status("失败章节", f"找到 {len(failed_files)} 个小说有失败章节记录", "info")
-        
-        for file_path in failed_files:
-            try:
-                # 读取失败记录
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    failed_chapters = json.load(f)
-                
-                if not failed_chapters:
-                    continue
-                    
-                # 从文件名获取小说标题
-                novel_title = os.path.basename(file_path).replace('.json', '')
-                novel_title = re.sub(r'_+', " ", novel_title).strip()
-                
-                # 查找小说
-                novel = await sync_to_async(Novel.objects.filter(title__icontains=novel_title).first)()
-                if not novel:
-                    self.print_status("失败章节", f"找不到小说: {novel_title}", "warning")
-                    continue
-                    
-                self.print_status("失败章节", f"处理小说 '{novel.title}' 的 {len(failed_chapters)} 个失败章节", "info")
-                
-                # 获取已有章节
-                existing_chapters = await sync_to_async(lambda: list(Chapter.objects.filter(novel=novel).values_list('title', flat=True)))()
-                
-                # 过滤出尚未下载的章节
-                chapters_to_process = [c for c in failed_chapters if c['title'] not in existing_chapters]
-                
-                if not chapters_to_process:
-                    self.print_status("失败章节", f"小说 '{novel.title}' 的所有章节已下载完成", "success")
-                    # 删除空记录文件
-                    os.remove(file_path)
-                    continue
-                    
-                # 下载失败的章节
-                remaining_failed = []
-                for chapter_info in chapters_to_process:
-                    try:
-                        chapter_page = await self.browser.newPage()
-                        await chapter_page.setUserAgent(self.ua.random)
-                        await chapter_page.setExtraHTTPHeaders(HEADERS)
-                        
-                        await self.random_sleep()
-                        await chapter_page.goto(chapter_info['url'], {
-                            'waitUntil': 'networkidle0',
-                            'timeout': 30000
-                        })
-                        
-                        content = await chapter_page.evaluate('''() => {
-                            const content = document.querySelector('.novel-body');
-                            if (!content) return '';
-                            return Array.from(content.querySelectorAll('p'))
-                                .map(p => p.textContent.trim())
-                                .filter(text => text.length > 0)
-                                .map(text => '　　' + text)
-                                .join('\\n\\n');
-                        }''')
-
-                        if content:
-                            # 清理章节标题
-                            clean_title = self.clean_chapter_title(chapter_info['title'])
-                            
-                            # 提取章节序号（使用清理后的标题）
-                            chapter_num = self.extract_chapter_number(clean_title)
-                            
-                            await sync_to_async(Chapter.objects.create)(
-                                novel=novel,
-                                title=clean_title,
-                                content=content,
-                                order=chapter_num  # 设置排序值
-                            )
-                            self.print_status("章节恢复", f"已下载：{chapter_info['title']}", "success")
-                        else:
-                            self.print_status("章节恢复", f"章节内容为空：{chapter_info['title']}", "warning")
-                            remaining_failed.append(chapter_info)
-
-                    except Exception as e:
-                        self.print_status("章节恢复", f"下载失败: {chapter_info['title']} - {str(e)}", "error")
-                        remaining_failed.append(chapter_info)
-                    finally:
-                        await chapter_page.close()
-                        await self.random_sleep(1, 3)
-                
-                # 更新失败记录
-                if remaining_failed:
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        json.dump(remaining_failed, f, ensure_ascii=False, indent=2)
-                    self.print_status("失败章节", f"小说 '{novel.title}' 还有 {len(remaining_failed)} 章下载失败", "warning")
-                else:
-                    # 删除空记录文件
-                    os.remove(file_path)
-                    self.print_status("失败章节", f"小说 '{novel.title}' 的所有失败章节已恢复", "success")
-                    
-            except Exception as e:
-                self.print_status("失败章节处理", f"处理文件 {file_path} 时出错: {str(e)}", "error")
+
+        self.print_status("抓取队列", f"{len(novels)} 本小说有待抓取的章节", "info")
+        for novel in novels:
+            self.print_status("抓取队列", f"处理小说 '{novel.title}'", "info")
+            failed = await self.download_chapters(novel)
+            if failed:
+                self.print_status("抓取队列", f"小说 '{novel.title}' 还有 {len(failed)} 章下载失败，已安排重试", "warning")
+            else:
+                self.print_status("抓取队列", f"小说 '{novel.title}' 的到期章节已全部完成", "success")
+
+        counts = await sync_to_async(frontier.summary)()
+        self.print_status("抓取队列", "，".join(
+            f"{label} {counts[state]}" for state, label in CrawlTask.STATE_CHOICES
+        ), "info")
 
     async def run(self, process_failed=False):
         """运行爬虫"""
-        if not await self.init_browser():
+        if process_failed and self.fetcher_type == 'http':
+            # 只处理队列时章节页不经过浏览器，不需要启动
+            await self.init_fetcher()
+        elif not await self.init_browser():
             return
 
+        # 抓取和写库分开：写入任务在后台按批提交
+        self.writer = await ChapterWriter(on_flush=self.on_chapters_written).start()
+
         try:
             if process_failed:
-                # 处理之前失败的章节
-                await self.process_failed_chapters()
+                # 继续抓取队列中未完成和到期重试的章节
+                await self.process_frontier()
             else:
                 # 正常爬取流程
                 await self.random_sleep(WAIT_TIME['page_min'], WAIT_TIME['page_max'])
-                await self.main_page.goto(LIST_PAGE_URL, {
+                await self.main_page.goto(self.list_url, {
                     'waitUntil': 'networkidle0',
                     'timeout': 30000
                 })
@@ -680,23 +682,64 @@ class Command(BaseCommand):
                 await self.parse_list_page()
 
         finally:
+            await self.writer.close()
+            self.print_status("写入统计", self.writer.describe(), "info")
+            if self.probe and self.probe is not self.fetcher:
+                await self.probe.close()
+            if self.fetcher:
+                await self.fetcher.close()
             if self.browser:
                 await self.browser.close()
 
     def add_arguments(self, parser):
         parser.add_argument(
-            '--failed',
+            '--failed', '--resume',
+            dest='failed',
             action='store_true',
-            help='处理之前失败的章节'
+            help='继续抓取队列中未完成和到期重试的章节（会先导入旧的 failed_chapters 记录）'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=DEFAULT_WORKERS,
+            help=f'并发下载章节的标签页数（默认 {DEFAULT_WORKERS}）'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=DEFAULT_RATE,
+            help=f'每个主机每秒最多请求数，0 为不限速（默认 {DEFAULT_RATE}）'
+        )
+        parser.add_argument(
+            '--fetcher',
+            choices=FETCHERS,
+            default='browser',
+            help='章节页的抓取方式：browser 使用浏览器标签页，http 使用轻量 HTTP 客户端（列表页和小说页始终使用浏览器）'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='忽略目录指纹，完整检查每本小说'
+        )
+        parser.add_argument(
+            '--list-url',
+            type=str,
+            default=LIST_PAGE_URL,
+            help='小说列表页地址'
         )
 
     def handle(self, *args, **options):
         """命令入口"""
         self.print_status("爬虫启动", "开始运行", "start")
         try:
+            self.workers = max(1, options.get('workers') or DEFAULT_WORKERS)
+            self.limiter = HostLimiter(options.get('rate', DEFAULT_RATE), self.workers)
+            self.list_url = options.get('list_url') or LIST_PAGE_URL
+            self.fetcher_type = options.get('fetcher') or 'browser'
+            self.full = options.get('full', False)
             process_failed = options.get('failed', False)
             if process_failed:
-                self.print_status("运行模式", "处理失败章节模式", "info")
+                self.print_status("运行模式", "继续抓取队列模式", "info")
             else:
                 self.print_status("运行模式", "正常爬取模式", "info")
             
@@ -1,8 +1,13 @@
 from django.core.management.base import BaseCommand
-from novels.models import Novel, Chapter, Category
+from novels.ingest import import_novel
+from novels.models import Category
+from novels.textfiles import STREAM_THRESHOLD, iter_file_chapters, parse_txt_file, read_intro
 from django.utils import timezone
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
 import os
 import re
+import time
 import unicodedata
 from difflib import SequenceMatcher
 from datetime import datetime
@@ -12,6 +17,9 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('folder_path', type=str, help='TXT文件所在文件夹路径')
+        parser.add_argument('--workers', type=int, default=1, help='解析文件的进程数（默认 1，不启用进程池）')
+        parser.add_argument('--stream-mb', type=int, default=STREAM_THRESHOLD // 1024 // 1024,
+                            help='超过该大小（MB）的文件边读边写入，不整体载入内存')
 
     def safe_filename(self, text, max_length=120):
         """生成安全的文件名（支持多语言字符）"""
@@ -41,98 +49,85 @@ class Command(BaseCommand):
         else:
             self.stdout.write(f"{timestamp} ➡️ {stage}: {message}")
 
-    def process_file(self, file_path):
-        """处理单个TXT文件"""
-        self.print_status("文件处理", f"开始处理: {os.path.basename(file_path)}", "start")
+    def save_parsed(self, parsed):
+        """把解析结果写入数据库，返回写入的章节数，失败时返回 None"""
+        name = os.path.basename(parsed['path'])
+        if parsed['error']:
+            self.print_status("文件解析", f"{name}: {parsed['error']}", "error")
+            return None
 
-        # 尝试不同的编码
-        encodings = ['utf-8', 'gb18030', 'gbk', 'gb2312', 'big5', 'utf-16']
-        content = None
-        detected_encoding = None
+        if parsed['stream']:
+            return self.save_streamed(parsed)
 
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                detected_encoding = encoding
-                break
-            except UnicodeDecodeError:
-                continue
-
-        if content is None:
-            self.print_status("文件读取", f"无法识别文件编码: {file_path}", "error")
-            return False
-
-        # 提取书名和作者
-        filename = os.path.splitext(os.path.basename(file_path))[0]
         try:
-            title, author = filename.split('-')
-        except ValueError:
-            title = filename
-            author = '未知'
-
-        # 处理重复的小说标题
-        base_title = title.strip()
-        final_title = base_title
-        counter = 1
-        while Novel.objects.filter(title=final_title).exists():
-            final_title = f"{base_title}({counter})"
-            counter += 1
-
-        # 查找章节
-        chapter_pattern = r'第[一二三四五六七八九十百千万0-9１２３４５６７８９０]+[章節回卷].*?\n'
-        chapters = list(re.finditer(chapter_pattern, content))
-        chapter_positions = [(m.start(), m.group()) for m in chapters]
-
-        if not chapter_positions:
-            self.print_status("章节识别", "未找到任何章节", "error")
-            return False
-
-        try:
-            # 创建小说
-            novel = Novel.objects.create(
-                title=final_title,
-                author=author.strip(),
-                category=Category.objects.get_or_create(name='本地导入')[0],
-                intro=content[:200] + '...',
-                source_url=f'本地导入: {os.path.basename(file_path)}'
+            # 创建小说并批量写入章节（重复的书名和章节标题自动加后缀）
+            novel, count = import_novel(
+                parsed['chapters'],
+                title=parsed['title'],
+                author=parsed['author'],
+                category=self.category,
+                intro=parsed['intro'],
+                source_url=f'本地导入: {name}'
             )
 
-            # 创建章节
-            used_titles = set()
-            for i, (pos, title) in enumerate(chapter_positions):
-                # 获取章节内容
-                next_pos = chapter_positions[i + 1][0] if i + 1 < len(chapter_positions) else len(content)
-                chapter_content = content[pos:next_pos].strip()
-
-                # 处理重复标题
-                original_title = title.strip()
-                chapter_title = original_title
-                counter = 1
-                while chapter_title in used_titles:
-                    chapter_title = f"{original_title}({counter})"
-                    counter += 1
-                used_titles.add(chapter_title)
-
-                try:
-                    Chapter.objects.create(
-                        novel=novel,
-                        title=chapter_title,
-                        content=chapter_content
-                    )
-                except Exception as e:
-                    self.print_status("章节创建", f"章节 {chapter_title} 创建失败: {str(e)}", "warning")
-
             self.print_status(
                 "导入完成", 
-                f"《{novel.title}》导入成功，共 {len(chapter_positions)} 章 | 编码: {detected_encoding}", 
+                f"《{novel.title}》导入成功，共 {count} 章 | 编码: {parsed['encoding']}", 
                 "success"
             )
-            return True
+            return count
 
         except Exception as e:
             self.print_status("小说创建", f"创建失败: {str(e)}", "error")
-            return False
+            return None
+
+    def save_streamed(self, parsed):
+        """
+        大文件边读边切分边写入，内存占用与文件大小无关
+        样本之后出现非法字节时整本回滚，换下一个候选编码重试
+        """
+        name = os.path.basename(parsed['path'])
+        for encoding in parsed['encodings']:
+            try:
+                novel, count = import_novel(
+                    iter_file_chapters(parsed['path'], encoding),
+                    title=parsed['title'],
+                    author=parsed['author'],
+                    category=self.category,
+                    intro=read_intro(parsed['path'], encoding),
+                    source_url=f'本地导入: {name}'
+                )
+            except UnicodeDecodeError:
+                self.print_status("文件读取", f"{name} 不是 {encoding} 编码，尝试下一个候选", "warning")
+                continue
+            except Exception as e:
+                self.print_status("小说创建", f"创建失败: {str(e)}", "error")
+                return None
+
+            self.print_status(
+                "导入完成", 
+                f"《{novel.title}》流式导入成功，共 {count} 章 | 编码: {encoding}", 
+                "success"
+            )
+            return count
+
+        self.print_status("文件读取", f"{name}: 无法识别文件编码", "error")
+        return None
+
+    def parse_in_pool(self, file_paths, workers, stream_threshold):
+        """
+        在进程池中解码和切分章节，按完成顺序逐个返回解析结果
+        同时在途的文件数有上限，避免写入跟不上时解析结果堆积在内存里
+        """
+        pending = iter(file_paths)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(parse_txt_file, path, stream_threshold) for path in islice(pending, workers * 2)}
+            while futures:
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for path in islice(pending, len(done)):
+                    futures.add(executor.submit(parse_txt_file, path, stream_threshold))
+                for future in done:
+                    yield future.result()
 
     def handle(self, *args, **options):
         folder_path = options['folder_path']
@@ -152,14 +147,36 @@ class Command(BaseCommand):
 
         self.print_status("文件扫描", f"找到 {len(txt_files)} 个TXT文件", "success")
 
+        self.category = Category.objects.get_or_create(name='本地导入')[0]
+        file_paths = [os.path.join(folder_path, file_name) for file_name in txt_files]
+        workers = options['workers']
+        stream_threshold = options['stream_mb'] * 1024 * 1024
+        start_time = time.monotonic()
+
+        if workers > 1:
+            self.print_status("并行解析", f"使用 {workers} 个进程解析文件", "start")
+            parsed_files = self.parse_in_pool(file_paths, workers, stream_threshold)
+        else:
+            parsed_files = (parse_txt_file(path, stream_threshold) for path in file_paths)
+
         success_count = 0
-        for file_name in txt_files:
-            file_path = os.path.join(folder_path, file_name)
-            if self.process_file(file_path):
+        chapter_count = 0
+        total_bytes = 0
+        for parsed in parsed_files:
+            total_bytes += parsed['size']
+            count = self.save_parsed(parsed)
+            if count is not None:
                 success_count += 1
+                chapter_count += count
 
+        elapsed = max(time.monotonic() - start_time, 1e-6)
         self.print_status(
             "导入统计", 
             f"共处理 {len(txt_files)} 个文件，成功导入 {success_count} 本小说",
             "success" if success_count > 0 else "warning"
-        ) 
\ No newline at end of file
+        )
+        self.print_status(
+            "吞吐量",
+            f"耗时 {elapsed:.1f} 秒 | {len(txt_files) / elapsed:.1f} 文件/秒 | "
+            f"{chapter_count / elapsed:.0f} 章/秒 | {total_bytes / elapsed / 1024 / 1024:.1f} MB/秒"
+        )
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from novels.models import Novel, Chapter
+from novels.titles import WRITE_BATCH, TitleRule, apply_titles, format_diff, plan_titles
 import re
 
 class Command(BaseCommand):
@@ -10,7 +11,8 @@ class Command(BaseCommand):
         parser.add_argument('--pattern', type=str, required=True, help='要匹配的标题模式（正则表达式）')
         parser.add_argument('--replace', type=str, help='替换为的内容')
         parser.add_argument('--remove', action='store_true', help='移除匹配的内容')
-        parser.add_argument('--preview', action='store_true', help='预览模式，不实际修改')
+        parser.add_argument('--preview', '--dry-run', action='store_true', help='预览模式，不实际修改')
+        parser.add_argument('--batch-size', type=int, default=WRITE_BATCH, help='每批写回的章节数')
 
     def handle(self, *args, **options):
         pattern = options['pattern']
@@ -26,6 +28,12 @@ class Command(BaseCommand):
         if not (remove or replace):
             self.stderr.write(self.style.ERROR('必须指定 --remove 或 --replace 参数'))
             return
+
+        try:
+            rule = TitleRule(pattern, '' if remove else replace)
+        except re.error as e:
+            self.stderr.write(self.style.ERROR(f'正则表达式有误: {e}'))
+            return
             
         # 构建查询
         chapters_query = Chapter.objects.all()
@@ -36,37 +44,21 @@ class Command(BaseCommand):
                 return
             chapters_query = chapters_query.filter(novel__in=novels)
             
-        # 找出匹配的章节
-        matching_chapters = []
-        for chapter in chapters_query:
-            if re.search(pattern, chapter.title):
-                matching_chapters.append(chapter)
+        # 计算改写结果并预先检查重复标题
+        changes, conflicts = plan_titles([rule], chapters_query)
                 
-        if not matching_chapters:
+        if not changes and not conflicts:
             self.stdout.write(self.style.WARNING(f'没有找到匹配模式 "{pattern}" 的章节标题'))
             return
             
-        self.stdout.write(f'找到 {len(matching_chapters)} 个匹配的章节')
-        
-        # 处理章节标题
-        updated_count = 0
-        for chapter in matching_chapters:
-            old_title = chapter.title
-            if remove:
-                new_title = re.sub(pattern, '', old_title)
-            else:
-                new_title = re.sub(pattern, replace, old_title)
-                
-            if old_title != new_title:
-                if preview:
-                    self.stdout.write(f'预览: "{old_title}" -> "{new_title}"')
-                else:
-                    chapter.title = new_title
-                    chapter.save(update_fields=['title'])
-                    updated_count += 1
-                    self.stdout.write(f'已更新: "{old_title}" -> "{new_title}"')
+        self.stdout.write(f'找到 {len(changes) + len(conflicts)} 个需要修改的章节')
+        for line in format_diff(conflicts):
+            self.stdout.write(self.style.WARNING(f'跳过（与已有标题重复或为空）: {line}'))
         
         if preview:
-            self.stdout.write(self.style.SUCCESS(f'预览完成，共有 {len(matching_chapters)} 个章节标题将被修改'))
+            for line in format_diff(changes):
+                self.stdout.write(f'预览: {line}')
+            self.stdout.write(self.style.SUCCESS(f'预览完成，共有 {len(changes)} 个章节标题将被修改'))
         else:
-            self.stdout.write(self.style.SUCCESS(f'处理完成，共更新了 {updated_count} 个章节标题')) 
\ No newline at end of file
+            updated_count = apply_titles(changes, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'处理完成，共更新了 {updated_count} 个章节标题'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from novels import search_index
+
+class Command(BaseCommand):
+    help = '重建小说和章节的全文搜索索引'
+
+    def handle(self, *args, **options):
+        if not search_index.is_available():
+            self.stderr.write(self.style.ERROR('全文索引仅支持 SQLite 数据库'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('开始重建搜索索引...'))
+        novel_count, chapter_count = search_index.rebuild(stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'完成! 共索引 {novel_count} 本小说、{chapter_count} 个章节'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from novels.cleaning import BATCH_SIZE, enqueue_cleaning, run_pending_jobs
+
+class Command(BaseCommand):
+    help = '执行过滤词清理任务（可从检查点继续）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--resume', action='store_true', help='立即接管所有进行中的任务（默认只接管长时间没有进展的）')
+        parser.add_argument('--all', action='store_true', help='新建一个任务，为所有旧章节生成渲染内容')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='每批扫描的章节数')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            job = enqueue_cleaning()
+            self.stdout.write(f'已登记清理任务 #{job.pk}')
+
+        finished = run_pending_jobs(resume=options['resume'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'完成! 共执行了 {finished} 个清理任务'))
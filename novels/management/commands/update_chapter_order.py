@@ -1,41 +1,34 @@
 from django.core.management.base import BaseCommand
-from novels.models import Novel, Chapter
-import re
+from novels.reorder import reorder_novels, select_novels
 
 class Command(BaseCommand):
     help = '更新所有章节的排序值'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--novel', type=str, help='只处理指定小说（id 或书名关键字）')
+        parser.add_argument('--dry-run', action='store_true', help='只显示将要修改的排序，不写入数据库')
+        parser.add_argument('--workers', type=int, default=1, help='并行计算排序的进程数')
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('开始更新章节排序...'))
         
-        # 提取章节序号的函数
-        def extract_chapter_number(title):
-            match = re.search(r'第(\d+)章', title)
-            if match:
-                return int(match.group(1))
-            # 尝试其他可能的格式
-            numbers = re.findall(r'\d+', title)
-            if numbers:
-                return int(numbers[0])
-            return 0
-        
-        # 获取所有小说
-        novels = Novel.objects.all()
-        self.stdout.write(f'找到 {novels.count()} 本小说')
+        novel_ids = select_novels(options['novel'])
+        self.stdout.write(f'找到 {len(novel_ids)} 本小说')
         
-        total_updated = 0
+        def report(novel_id, changes):
+            if options['dry_run']:
+                for chapter_id, title, old_order, new_order in changes:
+                    self.stdout.write(f'  [{novel_id}] {title}: order {old_order} -> {new_order}')
         
-        # 处理每本小说的章节
-        for novel in novels:
-            self.stdout.write(f'处理小说: {novel.title}')
-            chapters = Chapter.objects.filter(novel=novel)
-            
-            # 更新每个章节的排序值
-            for chapter in chapters:
-                order = extract_chapter_number(chapter.title)
-                if chapter.order != order:
-                    chapter.order = order
-                    chapter.save(update_fields=['order'])
-                    total_updated += 1
+        total_updated = reorder_novels(
+            novel_ids,
+            strategy='number',
+            dry_run=options['dry_run'],
+            workers=options['workers'],
+            callback=report
+        )
         
-        self.stdout.write(self.style.SUCCESS(f'完成! 共更新了 {total_updated} 个章节的排序')) 
\ No newline at end of file
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'预览完成，共有 {total_updated} 个章节的排序将被修改'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'完成! 共更新了 {total_updated} 个章节的排序'))
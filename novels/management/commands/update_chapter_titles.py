@@ -1,21 +1,31 @@
 from django.core.management.base import BaseCommand
 from novels.models import Chapter
-import re
+from novels.reorder import select_novels
+from novels.titles import TIMESTAMP_RULE, apply_titles, format_diff, plan_titles
 
 class Command(BaseCommand):
     help = '更新章节标题，去掉时间文本'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--novel', type=str, help='只处理指定小说（id 或书名关键字）')
+        parser.add_argument('--dry-run', action='store_true', help='只显示将要修改的标题，不写入数据库')
+
+    def handle(self, *args, **options):
         chapters = Chapter.objects.all()
-        updated_count = 0
+        if options['novel']:
+            chapters = chapters.filter(novel_id__in=select_novels(options['novel']))
 
-        for chapter in chapters:
-            # 去掉章节标题中的时间文本
-            new_title = re.sub(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', '', chapter.title).strip()
-            if new_title != chapter.title:
-                chapter.title = new_title
-                chapter.save()
-                updated_count += 1
-                self.stdout.write(self.style.SUCCESS(f"更新章节标题: {chapter.id} -> {new_title}"))
+        # 去掉章节标题中的时间文本，与已有标题重复的跳过
+        changes, conflicts = plan_titles([TIMESTAMP_RULE], chapters)
+        for line in format_diff(conflicts):
+            self.stdout.write(self.style.WARNING(f"跳过重复标题: {line}"))
 
-        self.stdout.write(self.style.SUCCESS(f"总共更新了 {updated_count} 个章节标题")) 
\ No newline at end of file
+        if options['dry_run']:
+            for line in format_diff(changes):
+                self.stdout.write(f"预览: {line}")
+            self.stdout.write(self.style.SUCCESS(f"预览完成，共有 {len(changes)} 个章节标题将被修改"))
+        else:
+            updated_count = apply_titles(changes)
+            self.stdout.write(self.style.SUCCESS(f"总共更新了 {updated_count} 个章节标题"))
+        if conflicts:
+            self.stdout.write(self.style.WARNING(f"{len(conflicts)} 个章节去掉时间后与已有标题重复，未修改"))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0008_remove_novel_default_cover_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='filter_version',
+            field=models.CharField(blank=True, default='', max_length=16, verbose_name='过滤词版本'),
+        ),
+        migrations.AddField(
+            model_name='chapter',
+            name='rendered_content',
+            field=models.TextField(blank=True, default='', verbose_name='渲染内容'),
+        ),
+    ]
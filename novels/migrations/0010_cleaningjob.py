@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0009_chapter_rendered_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleaningJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('words', models.TextField(blank=True, default='', verbose_name='变更的过滤词')),
+                ('status', models.CharField(choices=[('pending', '等待中'), ('running', '进行中'), ('done', '已完成'), ('failed', '失败')], db_index=True, default='pending', max_length=10, verbose_name='状态')),
+                ('filter_version', models.CharField(blank=True, default='', max_length=16, verbose_name='过滤词版本')),
+                ('last_chapter_id', models.BigIntegerField(default=0, verbose_name='进度检查点')),
+                ('total_count', models.IntegerField(default=0, verbose_name='章节总数')),
+                ('processed_count', models.IntegerField(default=0, verbose_name='已扫描')),
+                ('cleaned_count', models.IntegerField(default=0, verbose_name='已清理')),
+                ('error', models.TextField(blank=True, default='', verbose_name='错误信息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '清理任务',
+                'verbose_name_plural': '清理任务',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
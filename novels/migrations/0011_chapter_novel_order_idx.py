@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0010_cleaningjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chapter',
+            index=models.Index(fields=['novel', 'order', 'id'], name='chapter_novel_order_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def create_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from novels.search_index import CREATE_SQL
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from novels.search_index import DROP_SQL
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0011_chapter_novel_order_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:03
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0012_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrawlTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, unique=True, verbose_name='章节链接')),
+                ('title', models.CharField(max_length=255, verbose_name='章节标题')),
+                ('order', models.IntegerField(default=0, verbose_name='排序')),
+                ('state', models.CharField(choices=[('pending', '等待抓取'), ('done', '已完成'), ('failed', '已放弃')], default='pending', max_length=10, verbose_name='状态')),
+                ('attempts', models.IntegerField(default=0, verbose_name='失败次数')),
+                ('next_retry_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='下次抓取时间')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='最近错误')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('novel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='crawl_tasks', to='novels.novel', verbose_name='小说')),
+            ],
+            options={
+                'verbose_name': '抓取任务',
+                'verbose_name_plural': '抓取任务',
+                'ordering': ['novel', 'order', 'id'],
+                'indexes': [models.Index(fields=['state', 'next_retry_at'], name='crawltask_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0013_crawltask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='novel',
+            name='toc_checked_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='目录检查时间'),
+        ),
+        migrations.AddField(
+            model_name='novel',
+            name='toc_count',
+            field=models.IntegerField(default=0, verbose_name='远端章节数'),
+        ),
+        migrations.AddField(
+            model_name='novel',
+            name='toc_etag',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='目录 ETag'),
+        ),
+        migrations.AddField(
+            model_name='novel',
+            name='toc_hash',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='目录指纹'),
+        ),
+        migrations.AddField(
+            model_name='novel',
+            name='toc_last_modified',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='目录 Last-Modified'),
+        ),
+        migrations.AddField(
+            model_name='novel',
+            name='toc_last_url',
+            field=models.URLField(blank=True, default='', max_length=500, verbose_name='最后一章链接'),
+        ),
+    ]
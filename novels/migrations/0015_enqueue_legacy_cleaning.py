@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def enqueue_legacy_cleaning(apps, schema_editor):
+    """旧章节没有渲染内容（filter_version 为空），登记一个清理任务为它们统一生成"""
+    Chapter = apps.get_model('novels', 'Chapter')
+    CleaningJob = apps.get_model('novels', 'CleaningJob')
+    if not Chapter.objects.filter(filter_version='').exists():
+        return
+    if CleaningJob.objects.filter(status__in=['pending', 'running']).exists():
+        return
+    CleaningJob.objects.create(total_count=Chapter.objects.count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0014_novel_toc_fingerprint'),
+    ]
+
+    operations = [
+        migrations.RunPython(enqueue_legacy_cleaning, migrations.RunPython.noop),
+    ]
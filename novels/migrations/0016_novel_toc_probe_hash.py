@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0015_enqueue_legacy_cleaning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='novel',
+            name='toc_probe_hash',
+            field=models.CharField(blank=True, default='', max_length=40, verbose_name='预检指纹'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0016_novel_toc_probe_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chapter',
+            index=models.Index(fields=['novel', 'updated_at'], name='chapter_novel_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def backfill_search_index(apps, schema_editor):
+    """为已有的小说和章节建立全文索引（0012 只建了空表），按主键分批写入"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from novels.search_index import INDEX_BATCH, index_chapters, index_novels
+
+    Novel = apps.get_model('novels', 'Novel')
+    Chapter = apps.get_model('novels', 'Chapter')
+    index_novels(Novel.objects.only('id', 'title', 'author', 'intro').iterator())
+
+    chapters = Chapter.objects.order_by('pk').values_list('id', 'novel_id', 'title', 'content')
+    last_id = 0
+    while True:
+        rows = list(chapters.filter(pk__gt=last_id)[:INDEX_BATCH * 5])
+        if not rows:
+            break
+        index_chapters(rows)
+        last_id = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('novels', '0017_chapter_novel_updated_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_index, migrations.RunPython.noop),
+    ]
@@ -21,6 +21,14 @@ class Novel(models.Model):
     source_url = models.URLField(max_length=500, verbose_name='来源链接')
     created_at = models.DateTimeField(default=timezone.now, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    # 远端目录指纹，爬虫据此跳过没有更新的小说（用 update() 写入，不改变 updated_at）
+    toc_hash = models.CharField(max_length=40, blank=True, default='', verbose_name='目录指纹')
+    toc_count = models.IntegerField(default=0, verbose_name='远端章节数')
+    toc_last_url = models.URLField(max_length=500, blank=True, default='', verbose_name='最后一章链接')
+    toc_etag = models.CharField(max_length=255, blank=True, default='', verbose_name='目录 ETag')
+    toc_last_modified = models.CharField(max_length=64, blank=True, default='', verbose_name='目录 Last-Modified')
+    toc_probe_hash = models.CharField(max_length=40, blank=True, default='', verbose_name='预检指纹')
+    toc_checked_at = models.DateTimeField(null=True, blank=True, verbose_name='目录检查时间')
 
     class Meta:
         verbose_name = '小说'
@@ -42,12 +50,20 @@ class Chapter(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     order = models.IntegerField(default=0, verbose_name='排序', db_index=True)
+    rendered_content = models.TextField(blank=True, default='', verbose_name='渲染内容')
+    filter_version = models.CharField(max_length=16, blank=True, default='', verbose_name='过滤词版本')
 
     class Meta:
         verbose_name = '章节'
         verbose_name_plural = '章节'
         ordering = ['order', 'id']
         unique_together = ['novel', 'title']
+        indexes = [
+            # 目录按 (novel, order, id) 顺序分页
+            models.Index(fields=['novel', 'order', 'id'], name='chapter_novel_order_idx'),
+            # 章节序列和导出缓存按小说取 Max(updated_at) 作版本
+            models.Index(fields=['novel', 'updated_at'], name='chapter_novel_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.novel.title} - {self.title}"
@@ -56,18 +72,14 @@ class Chapter(models.Model):
         return self.content[:50] + "..." if len(self.content) > 50 else self.content
     content_preview.short_description = "内容预览"
 
-    def clean_content(self):
+    def clean_content(self, matcher=None):
         """清理章节内容中的广告"""
-        content = self.content
-        
-        # 获取用户添加的过滤词
-        from django.apps import apps
-        FilterWord = apps.get_model('novels', 'FilterWord')
-        filter_words = FilterWord.objects.values_list('word', flat=True)
-        
-        # 应用用户添加的过滤词
-        for word in filter_words:
-            content = content.replace(word, '')
+        if matcher is None:
+            from .filters import get_filter_matcher
+            matcher = get_filter_matcher()
+
+        # 一次扫描删除所有用户添加的过滤词
+        content = matcher.remove(self.content)
         
         # 规范化换行符
         content = content.replace('\r\n', '\n').replace('\r', '\n')
@@ -85,9 +97,27 @@ class Chapter(models.Model):
         # 返回处理后的内容
         return '\n'.join(paragraphs)
 
+    @staticmethod
+    def render_content(content):
+        """把清理后的内容渲染成段落 HTML，阅读页直接输出"""
+        return '\n'.join(f'<p>{line}</p>' for line in content.split('\n') if line)
+
+    def refresh_rendered(self, matcher=None):
+        """按当前过滤词重新清理并生成渲染内容"""
+        if matcher is None:
+            from .filters import get_filter_matcher
+            matcher = get_filter_matcher()
+        self.content = self.clean_content(matcher)
+        self.rendered_content = self.render_content(self.content)
+        self.filter_version = matcher.version
+
     def save(self, *args, **kwargs):
-        # 保存前自动清理内容
-        self.content = self.clean_content()
+        # 保存前自动清理内容（只更新其他字段时跳过）
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.refresh_rendered()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'rendered_content', 'filter_version'}
         super().save(*args, **kwargs)
 
 class FilterWord(models.Model):
@@ -102,3 +132,71 @@ class FilterWord(models.Model):
 
     def __str__(self):
         return self.word
+
+# 过滤词清理任务
+class CleaningJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', '等待中'),
+        ('running', '进行中'),
+        ('done', '已完成'),
+        ('failed', '失败'),
+    ]
+
+    words = models.TextField(blank=True, default='', verbose_name='变更的过滤词')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True, verbose_name='状态')
+    filter_version = models.CharField(max_length=16, blank=True, default='', verbose_name='过滤词版本')
+    last_chapter_id = models.BigIntegerField(default=0, verbose_name='进度检查点')
+    total_count = models.IntegerField(default=0, verbose_name='章节总数')
+    processed_count = models.IntegerField(default=0, verbose_name='已扫描')
+    cleaned_count = models.IntegerField(default=0, verbose_name='已清理')
+    error = models.TextField(blank=True, default='', verbose_name='错误信息')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '清理任务'
+        verbose_name_plural = '清理任务'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"清理任务 #{self.pk}"
+
+    def word_list(self):
+        return [w for w in self.words.split('\n') if w]
+
+    def progress(self):
+        if not self.total_count:
+            return '100%' if self.status == 'done' else '0%'
+        return f"{min(self.processed_count * 100 // self.total_count, 100)}%"
+    progress.short_description = '进度'
+
+# 爬虫待抓取的章节
+class CrawlTask(models.Model):
+    STATE_CHOICES = [
+        ('pending', '等待抓取'),
+        ('done', '已完成'),
+        ('failed', '已放弃'),
+    ]
+
+    url = models.URLField(max_length=500, unique=True, verbose_name='章节链接')
+    novel = models.ForeignKey(Novel, on_delete=models.CASCADE, related_name='crawl_tasks', verbose_name='小说')
+    title = models.CharField(max_length=255, verbose_name='章节标题')
+    order = models.IntegerField(default=0, verbose_name='排序')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='pending', verbose_name='状态')
+    attempts = models.IntegerField(default=0, verbose_name='失败次数')
+    next_retry_at = models.DateTimeField(default=timezone.now, verbose_name='下次抓取时间')
+    last_error = models.TextField(blank=True, default='', verbose_name='最近错误')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '抓取任务'
+        verbose_name_plural = '抓取任务'
+        ordering = ['novel', 'order', 'id']
+        indexes = [
+            # 按状态和到期时间领取任务
+            models.Index(fields=['state', 'next_retry_at'], name='crawltask_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.novel_id} - {self.title}"
@@ -0,0 +1,139 @@
+"""
+章节导航索引
+
+每本小说的章节 id 按 ('order', 'id') 排好后缓存成数组，
+阅读页取上一章/下一章时直接查数组，不再读取整本书的章节。
+缓存的数组带着数据库中的版本（章节数和最近更新时间），每次使用前核对：
+爬虫、导入和排序命令在其他进程中修改章节时，网站进程的本地缓存也会立即失效。
+目录使用 (novel, order, id) 复合索引做游标分页，页面开销与书的长度无关。
+"""
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+
+SEQUENCE_KEY = 'novel_chapter_ids:{}'
+SEQUENCE_TIMEOUT = 60 * 60 * 24
+TOC_PAGE_SIZE = 100
+
+
+def sequence_stamp(novel_id):
+    """章节序列的版本：章节数加最近更新时间，增删章节和修改排序都会改变它"""
+    from .models import Chapter
+    stats = Chapter.objects.filter(novel_id=novel_id).aggregate(count=Count('id'), updated=Max('updated_at'))
+    return f"{stats['count']}:{stats['updated'].isoformat() if stats['updated'] else ''}"
+
+
+def get_chapter_sequence(novel_id):
+    """获取小说的有序章节 id 列表（与 Chapter.Meta.ordering 一致）"""
+    key = SEQUENCE_KEY.format(novel_id)
+    stamp = sequence_stamp(novel_id)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    from .models import Chapter
+    ids = list(
+        Chapter.objects.filter(novel_id=novel_id)
+        .order_by('order', 'id')
+        .values_list('id', flat=True)
+    )
+    cache.set(key, (stamp, ids), SEQUENCE_TIMEOUT)
+    return ids
+
+
+def get_neighbours(novel_id, chapter_id):
+    """返回 (上一章 id, 下一章 id)，没有时为 None"""
+    ids = get_chapter_sequence(novel_id)
+    try:
+        index = ids.index(chapter_id)
+    except ValueError:
+        # 缓存落后于数据库（例如批量写入后），重建一次
+        invalidate_chapter_sequence(novel_id)
+        ids = get_chapter_sequence(novel_id)
+        if chapter_id not in ids:
+            return None, None
+        index = ids.index(chapter_id)
+
+    prev_id = ids[index - 1] if index > 0 else None
+    next_id = ids[index + 1] if index + 1 < len(ids) else None
+    return prev_id, next_id
+
+
+def invalidate_chapter_sequence(*novel_ids):
+    """章节新增、删除或重新排序后调用，让本进程立即重建（其他进程通过版本核对发现变化）"""
+    cache.delete_many([SEQUENCE_KEY.format(novel_id) for novel_id in novel_ids])
+
+
+def make_cursor(chapter):
+    """目录游标：order_id"""
+    return f"{chapter['order']}_{chapter['id']}"
+
+
+def parse_cursor(cursor):
+    """解析游标，格式不对时返回 None"""
+    try:
+        order, chapter_id = cursor.rsplit('_', 1)
+        return int(order), int(chapter_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def get_toc_page(novel_id, after=None, before=None, jump=None, limit=TOC_PAGE_SIZE):
+    """
+    按游标获取一页目录，只读取 id/title/order
+    after/before 为游标，jump 为要跳转到的章节序号（没有填写序号的书按第 jump 章的位置跳转）
+    """
+    from .models import Chapter
+    chapters = Chapter.objects.filter(novel_id=novel_id).values('id', 'title', 'order')
+
+    after, before = parse_cursor(after), parse_cursor(before)
+    backward = False
+    if before:
+        order, chapter_id = before
+        page = chapters.filter(
+            Q(order__lt=order) | Q(order=order, id__lt=chapter_id)
+        ).order_by('-order', '-id')
+        backward = True
+    elif after:
+        order, chapter_id = after
+        page = chapters.filter(
+            Q(order__gt=order) | Q(order=order, id__gt=chapter_id)
+        ).order_by('order', 'id')
+    elif jump is not None:
+        page = chapters.filter(order__gte=jump).order_by('order', 'id')
+    else:
+        page = chapters.order_by('order', 'id')
+
+    rows = list(page[:limit + 1])
+    if jump is not None and not rows:
+        # 爬虫和 TXT 导入写入的 order 都是 0，按序号找不到时改为按位置跳到第 jump 章；
+        # 超出末尾时显示最后一页，保证总有游标可以继续翻页
+        start = max(jump - 1, 0)
+        rows = list(chapters.order_by('order', 'id')[start:start + limit + 1])
+        if not rows:
+            rows = list(chapters.order_by('-order', '-id')[:limit])
+            rows.reverse()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+
+    if not rows:
+        return {'chapters': [], 'prev_cursor': None, 'next_cursor': None}
+
+    first, last = rows[0], rows[-1]
+    if backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_next = has_more
+        if after:
+            has_prev = True
+        else:
+            has_prev = jump is not None and chapters.filter(
+                Q(order__lt=first['order']) | Q(order=first['order'], id__lt=first['id'])
+            ).exists()
+
+    return {
+        'chapters': rows,
+        'prev_cursor': make_cursor(first) if has_prev else None,
+        'next_cursor': make_cursor(last) if has_next else None,
+    }
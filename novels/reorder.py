@@ -0,0 +1,124 @@
+"""
+章节重排
+
+按小说逐本计算新的排序值：只读取 (id, title, order)，不加载正文，
+在内存中算好后用 bulk_update 分批写回（每批一条 CASE UPDATE），
+只改动排序真正变化的章节。计算可以放到多个进程中并行，写入仍由主进程完成。
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .caching import SCOPE_CHAPTERS, purge_scopes
+from .headings import chapter_number, parse_heading
+from .models import Chapter, Novel
+from .navigation import invalidate_chapter_sequence
+
+WRITE_BATCH = 500  # 每条 UPDATE 写回的章节数
+SPECIAL_BASE = 1000000  # 番外等特殊章节的排序起点，保证排在正文之后
+UNKNOWN_NUMBER = 999999  # 标题里没有序号时的排序值
+
+
+def number_order(chapters):
+    """排序值直接取标题中的章节序号，识别不到时为 0"""
+    return [(chapter_id, chapter_number(title)) for chapter_id, title, _ in chapters]
+
+
+def special_last_order(chapters):
+    """正文按章节序号排序，番外、后记等特殊章节依次排在最后"""
+    items = []
+    for chapter_id, title, _ in chapters:
+        heading = parse_heading(title)
+        number = UNKNOWN_NUMBER if heading.number is None else heading.number
+        items.append((chapter_id, 0 if heading.special else 1, number))
+
+    # 正常章节(1)在前，番外(0)在后；番外之间按序号倒序，与原有修复逻辑一致
+    items.sort(key=lambda x: (x[1], -x[2] if x[1] == 0 else x[2]))
+    return [
+        (chapter_id, number if chapter_type == 1 else SPECIAL_BASE + i)
+        for i, (chapter_id, chapter_type, number) in enumerate(items)
+    ]
+
+
+STRATEGIES = {
+    'number': number_order,
+    'special_last': special_last_order,
+}
+
+
+def select_novels(novel=None):
+    """按 id 或书名（模糊匹配）选择要处理的小说，返回 id 列表"""
+    novels = Novel.objects.order_by('id')
+    if novel:
+        novels = novels.filter(id=int(novel)) if str(novel).isdigit() else novels.filter(title__icontains=novel)
+    return list(novels.values_list('id', flat=True))
+
+
+def plan_reorder(novel_id, strategy='special_last'):
+    """
+    计算一本小说需要修改的排序，返回 (novel_id, [(id, 标题, 旧排序, 新排序), ...])
+    只读数据库，可以在子进程中执行
+    """
+    chapters = list(
+        Chapter.objects.filter(novel_id=novel_id)
+        .order_by('order', 'id')
+        .values_list('id', 'title', 'order')
+    )
+    current = {chapter_id: (title, order) for chapter_id, title, order in chapters}
+    changes = [
+        (chapter_id, current[chapter_id][0], current[chapter_id][1], new_order)
+        for chapter_id, new_order in STRATEGIES[strategy](chapters)
+        if current[chapter_id][1] != new_order
+    ]
+    return novel_id, changes
+
+
+def apply_reorder(novel_id, changes, batch_size=WRITE_BATCH):
+    """
+    写回排序变化，返回修改的章节数
+    同时更新 updated_at，让目录的条件请求和下载缓存随之失效
+    """
+    if not changes:
+        return 0
+    now = timezone.now()
+    chapters = [Chapter(id=chapter_id, order=new_order, updated_at=now) for chapter_id, _, _, new_order in changes]
+    with transaction.atomic():
+        Chapter.objects.bulk_update(chapters, ['order', 'updated_at'], batch_size=batch_size)
+    invalidate_chapter_sequence(novel_id)
+    return len(chapters)
+
+
+def _plan_many(novel_ids, strategy, workers):
+    """按小说逐个计算，workers 大于 1 时在进程池中并行，结果按输入顺序返回"""
+    if workers <= 1:
+        for novel_id in novel_ids:
+            yield plan_reorder(novel_id, strategy)
+        return
+
+    # 子进程各自建立数据库连接，不能继承父进程打开的连接
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+        yield from executor.map(
+            plan_reorder, novel_ids, [strategy] * len(novel_ids),
+            chunksize=max(1, len(novel_ids) // (workers * 8))
+        )
+
+
+def reorder_novels(novel_ids, strategy='special_last', dry_run=False, workers=1, callback=None):
+    """
+    重排多本小说，返回修改（或预览时将要修改）的章节总数
+    callback(novel_id, changes) 在每本小说处理完后调用，用于输出进度
+    """
+    total = 0
+    for novel_id, changes in _plan_many(novel_ids, strategy, workers):
+        if not dry_run:
+            apply_reorder(novel_id, changes)
+        total += len(changes)
+        if callback:
+            callback(novel_id, changes)
+
+    if total and not dry_run:
+        purge_scopes(SCOPE_CHAPTERS)
+    return total
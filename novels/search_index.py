@@ -0,0 +1,329 @@
+"""
+全文搜索索引
+
+基于 SQLite FTS5 为小说（标题/作者/简介）和章节（标题/正文）建立倒排索引。
+FTS5 自带的分词器不会切分中文，这里在写入前把连续的中日韩文字切成二元组
+（"斗破苍穹" -> "斗破 破苍 苍穹"），查询时同样切分后按短语匹配，
+效果等同于子串搜索，但可以走索引并按 bm25 排序。
+搜索结果只取有限窗口，计数设上限，并按规范化后的查询词缓存整页结果。
+"""
+import hashlib
+import re
+import unicodedata
+from html import escape
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils.safestring import mark_safe
+
+NOVEL_TABLE = 'novels_novel_fts'
+CHAPTER_TABLE = 'novels_chapter_fts'
+
+CREATE_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {NOVEL_TABLE} USING fts5("
+    f"title, author, intro, tokenize='unicode61 remove_diacritics 2')",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {CHAPTER_TABLE} USING fts5("
+    f"title, content, novel_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')",
+]
+DROP_SQL = [
+    f"DROP TABLE IF EXISTS {NOVEL_TABLE}",
+    f"DROP TABLE IF EXISTS {CHAPTER_TABLE}",
+]
+
+# 中日韩文字（含扩展 A 区和兼容区）
+CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+# 非中文的单词不能吞掉紧跟的汉字（"1章风云" 应切成 "1" 和 "章风云"）
+WORD = re.compile(r'[㐀-䶿一-鿿豈-﫿]+|[^\W㐀-䶿一-鿿豈-﫿]+')
+
+# bm25 列权重：标题 > 作者 > 正文
+NOVEL_WEIGHTS = (10.0, 5.0, 1.0)
+CHAPTER_WEIGHTS = (5.0, 1.0)
+
+INDEX_BATCH = 200
+
+SEARCH_PAGE_SIZE = 20  # 每页章节结果数
+SEARCH_NOVEL_LIMIT = 12  # 小说结果数
+SEARCH_MAX_PAGES = 50  # 最多翻到第几页
+COUNT_CAP = SEARCH_PAGE_SIZE * SEARCH_MAX_PAGES  # 超过后只显示“N+”
+SEARCH_CACHE_TIMEOUT = 300
+
+
+def is_available():
+    """只有 SQLite 后端才启用 FTS5 索引"""
+    return connection.vendor == 'sqlite'
+
+
+def create_tables():
+    with connection.cursor() as cursor:
+        for sql in CREATE_SQL:
+            cursor.execute(sql)
+
+
+def drop_tables():
+    with connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+def tokenize(text):
+    """把文本切分成用于索引的词：中文切二元组，其他按单词保留"""
+    if not text:
+        return ''
+    tokens = []
+    for word in WORD.findall(text):
+        if CJK_RUN.fullmatch(word):
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+            # 末字单独成词，保证单字前缀查询能命中结尾的字
+            tokens.append(word[-1])
+        else:
+            tokens.append(word.lower())
+    return ' '.join(tokens)
+
+
+def build_match(query):
+    """把用户输入转换成 FTS5 查询表达式，无法构成查询时返回 None"""
+    terms = []
+    for word in WORD.findall(query or ''):
+        if CJK_RUN.fullmatch(word):
+            if len(word) == 1:
+                # 单字用前缀查询匹配以它开头的二元组
+                terms.append(f'"{word}"*')
+            else:
+                bigrams = ' '.join(word[i:i + 2] for i in range(len(word) - 1))
+                terms.append(f'"{bigrams}"')
+        else:
+            terms.append(f'"{word.lower()}"')
+    return ' '.join(terms) or None
+
+
+def index_novels(novels):
+    """写入或更新小说索引"""
+    if not is_available():
+        return
+    rows = [
+        (novel.id, tokenize(novel.title), tokenize(novel.author), tokenize(novel.intro))
+        for novel in novels
+    ]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO {NOVEL_TABLE}(rowid, title, author, intro) VALUES (%s, %s, %s, %s)",
+                rows
+            )
+
+
+def index_chapters(chapters):
+    """
+    写入或更新章节索引
+    chapters 为 Chapter 实例或 (id, novel_id, title, content) 元组的可迭代对象
+    """
+    if not is_available():
+        return
+    batch = []
+    with connection.cursor() as cursor:
+        for chapter in chapters:
+            if isinstance(chapter, tuple):
+                chapter_id, novel_id, title, content = chapter
+            else:
+                chapter_id, novel_id, title, content = chapter.id, chapter.novel_id, chapter.title, chapter.content
+            batch.append((chapter_id, tokenize(title), tokenize(content), novel_id))
+            if len(batch) >= INDEX_BATCH:
+                _write_chapters(cursor, batch)
+                batch = []
+        if batch:
+            _write_chapters(cursor, batch)
+
+
+def _write_chapters(cursor, rows):
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO {CHAPTER_TABLE}(rowid, title, content, novel_id) VALUES (%s, %s, %s, %s)",
+        rows
+    )
+
+
+def update_chapter_titles(rows):
+    """只更新章节标题列，rows 为 (id, 新标题) 列表，不需要读取正文"""
+    if not is_available() or not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {CHAPTER_TABLE} SET title = %s WHERE rowid = %s",
+            [(tokenize(title), chapter_id) for chapter_id, title in rows]
+        )
+
+
+def remove_novels(novel_ids):
+    if not is_available() or not novel_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {NOVEL_TABLE} WHERE rowid = %s", [(i,) for i in novel_ids])
+
+
+def remove_chapters(chapter_ids):
+    if not is_available() or not chapter_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {CHAPTER_TABLE} WHERE rowid = %s", [(i,) for i in chapter_ids])
+
+
+def search_novels(query, limit, offset=0):
+    """按相关度返回匹配的小说 id 列表"""
+    return _search(NOVEL_TABLE, NOVEL_WEIGHTS, query, limit, offset)
+
+
+def search_chapters(query, limit, offset=0):
+    """按相关度返回匹配的章节 id 列表"""
+    return _search(CHAPTER_TABLE, CHAPTER_WEIGHTS, query, limit, offset)
+
+
+def _search(table, weights, query, limit, offset):
+    match = build_match(query)
+    if match is None:
+        return []
+    weight_args = ', '.join(str(w) for w in weights)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {table} WHERE {table} MATCH %s "
+            f"ORDER BY bm25({table}, {weight_args}) LIMIT %s OFFSET %s",
+            [match, limit, offset]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def count_novels(query):
+    return _count(NOVEL_TABLE, query)
+
+
+def count_chapters(query):
+    return _count(CHAPTER_TABLE, query)
+
+
+def _count(table, query, cap=COUNT_CAP):
+    """计数最多数到 cap + 1，结果大于 cap 说明命中数超过上限"""
+    match = build_match(query)
+    if match is None:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT count(*) FROM (SELECT 1 FROM {table} WHERE {table} MATCH %s LIMIT %s)",
+            [match, cap + 1]
+        )
+        return cursor.fetchone()[0]
+
+
+def make_snippet(text, query, width=60):
+    """截取正文中命中关键词附近的片段并高亮"""
+    text = (text or '').replace('\n', ' ')
+    words = [w for w in WORD.findall(query or '') if w]
+    pos = -1
+    hit = ''
+    for word in words:
+        pos = text.lower().find(word.lower())
+        if pos >= 0:
+            hit = text[pos:pos + len(word)]
+            break
+    if pos < 0:
+        return text[:width * 2] + ('…' if len(text) > width * 2 else '')
+
+    start = max(pos - width, 0)
+    end = min(pos + len(hit) + width, len(text))
+    snippet = (
+        ('…' if start > 0 else '')
+        + escape(text[start:pos])
+        + f'<mark>{escape(hit)}</mark>'
+        + escape(text[pos + len(hit):end])
+        + ('…' if end < len(text) else '')
+    )
+    return mark_safe(snippet)
+
+
+def rebuild(stdout=None):
+    """清空并重建全部索引，返回 (小说数, 章节数)"""
+    from .models import Chapter, Novel
+
+    drop_tables()
+    create_tables()
+    index_novels(Novel.objects.only('id', 'title', 'author', 'intro').iterator())
+
+    chapters = Chapter.objects.order_by('pk').values_list('id', 'novel_id', 'title', 'content')
+    chapter_count = 0
+    last_id = 0
+    while True:
+        rows = list(chapters.filter(pk__gt=last_id)[:INDEX_BATCH * 5])
+        if not rows:
+            break
+        index_chapters(rows)
+        chapter_count += len(rows)
+        last_id = rows[-1][0]
+        if stdout:
+            stdout.write(f'已索引 {chapter_count} 个章节')
+    return Novel.objects.count(), chapter_count
+
+
+def normalize_query(query):
+    """规范化查询词：全角转半角、统一小写、合并空白"""
+    query = unicodedata.normalize('NFKC', query or '')
+    return ' '.join(query.lower().split())
+
+
+def search_page(query, page=1):
+    """
+    执行一次搜索并返回可直接渲染的结果
+    同一查询词同一页的结果会被缓存，热门搜索只需一次缓存读取
+    """
+    query = normalize_query(query)
+    page = min(max(page, 1), SEARCH_MAX_PAGES)
+    if not query:
+        return {'novels': [], 'chapters': [], 'novel_count': 0, 'chapter_count': 0, 'page': page}
+
+    key = 'search:{}:{}'.format(hashlib.sha1(query.encode('utf-8')).hexdigest(), page)
+    result = cache.get(key)
+    if result is None:
+        result = _run_search(query, page)
+        cache.set(key, result, SEARCH_CACHE_TIMEOUT)
+    return result
+
+
+def _run_search(query, page):
+    from .models import Chapter, Novel
+
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    if is_available():
+        novel_ids = search_novels(query, SEARCH_NOVEL_LIMIT)
+        chapter_ids = search_chapters(query, SEARCH_PAGE_SIZE, offset)
+        novel_count = count_novels(query)
+        chapter_count = count_chapters(query)
+    else:
+        # 非 SQLite 数据库时退回到模糊匹配
+        novels = Novel.objects.filter(Q(title__icontains=query) | Q(author__icontains=query))
+        chapters = Chapter.objects.filter(title__icontains=query).order_by('pk')
+        novel_ids = list(novels.values_list('id', flat=True)[:SEARCH_NOVEL_LIMIT])
+        chapter_ids = list(chapters.values_list('id', flat=True)[offset:offset + SEARCH_PAGE_SIZE])
+        novel_count = novels.values('id')[:COUNT_CAP + 1].count()
+        chapter_count = chapters.values('id')[:COUNT_CAP + 1].count()
+
+    novel_map = Novel.objects.only('id', 'title', 'author', 'cover').in_bulk(novel_ids)
+    chapter_map = Chapter.objects.select_related('novel').only(
+        'id', 'title', 'content', 'novel__id', 'novel__title'
+    ).in_bulk(chapter_ids)
+
+    # 只缓存渲染所需的字段
+    return {
+        'novels': [
+            {'id': n.id, 'title': n.title, 'author': n.author, 'cover': n.cover}
+            for n in (novel_map[i] for i in novel_ids if i in novel_map)
+        ],
+        'chapters': [
+            {
+                'id': c.id,
+                'title': c.title,
+                'snippet': make_snippet(c.content, query),
+                'novel': {'id': c.novel.id, 'title': c.novel.title},
+            }
+            for c in (chapter_map[i] for i in chapter_ids if i in chapter_map)
+        ],
+        'novel_count': novel_count,
+        'chapter_count': chapter_count,
+        'page': page,
+    }
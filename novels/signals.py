@@ -0,0 +1,82 @@
+"""
+信号处理
+
+模型变化时同步各类缓存，保证读路径上的缓存数据始终有效。
+"""
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .cleaning import enqueue_cleaning
+from .filters import invalidate_filter_matcher
+from . import search_index
+from .caching import (
+    SCOPE_CHAPTERS, SCOPE_NOVELS, SCOPE_SITE, category_scope, invalidate_common_data, purge_scopes
+)
+from .models import Category, Chapter, FilterWord, Novel
+from .navigation import invalidate_chapter_sequence
+
+
+@receiver(post_save, sender=FilterWord)
+def filter_word_saved(sender, instance, raw=False, **kwargs):
+    """过滤词新增或修改后重建自动机，并在后台清理包含该词的章节"""
+    invalidate_filter_matcher()
+    if not raw:
+        enqueue_cleaning([instance.word])
+
+
+@receiver(post_delete, sender=FilterWord)
+def filter_word_deleted(sender, instance, **kwargs):
+    """过滤词删除后重建自动机，后台任务只需刷新章节的版本号"""
+    invalidate_filter_matcher()
+    enqueue_cleaning()
+
+
+@receiver(post_save, sender=Chapter)
+def chapter_saved(sender, instance, created, update_fields=None, **kwargs):
+    """章节新增或排序变化后重建导航索引，标题或正文变化后更新搜索索引"""
+    if created or update_fields is None or 'order' in update_fields:
+        invalidate_chapter_sequence(instance.novel_id)
+    if update_fields is None or {'title', 'content'} & set(update_fields):
+        search_index.index_chapters([instance])
+    if created:
+        purge_scopes(SCOPE_CHAPTERS)
+
+
+@receiver(post_delete, sender=Chapter)
+def chapter_deleted(sender, instance, **kwargs):
+    invalidate_chapter_sequence(instance.novel_id)
+    search_index.remove_chapters([instance.id])
+    purge_scopes(SCOPE_CHAPTERS)
+
+
+@receiver(pre_save, sender=Novel)
+def novel_saving(sender, instance, raw=False, **kwargs):
+    """记下保存前的分类，换分类时原分类的页面缓存也要清除"""
+    instance._previous_category_id = None
+    if instance.pk and not raw:
+        instance._previous_category_id = (
+            Novel.objects.filter(pk=instance.pk).values_list('category_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Novel)
+@receiver(post_delete, sender=Novel)
+def novel_changed(sender, instance, **kwargs):
+    """小说变化后更新搜索索引，并清除所在分类（以及换分类前的分类）和小说列表的页面缓存"""
+    if kwargs.get('signal') is post_delete:
+        search_index.remove_novels([instance.id])
+    else:
+        search_index.index_novels([instance])
+    invalidate_common_data()
+    scopes = [SCOPE_NOVELS, category_scope(instance.category_id)]
+    previous = getattr(instance, '_previous_category_id', None)
+    if previous and previous != instance.category_id:
+        scopes.append(category_scope(previous))
+    purge_scopes(*scopes)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    invalidate_common_data()
+    purge_scopes(SCOPE_SITE)
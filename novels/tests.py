@@ -1,3 +1,453 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from . import filters, frontier, search_index
+from .caching import category_scope, scope_version
+from .cleaning import STALE_AFTER, claim_next_job, run_cleaning_job
+from .crawling import HostLimiter, HttpFetcher, PagePool, parse_html, run_queue
+from .filters import FilterMatcher, get_filter_matcher
+from .headings import CHAPTER_PATTERN, HeadingParser, chinese_to_int, chapter_number, is_special
+from .ingest import PendingChapter, write_pending
+from .navigation import get_neighbours, get_toc_page
+from .models import Category, Chapter, CleaningJob, CrawlTask, FilterWord, Novel
+
+
+class FilterMatcherTests(TestCase):
+    def test_overlapping_words(self):
+        # 以同一位置结尾的较短过滤词也要找出来，不能只保留最长的一个
+        matcher = FilterMatcher(['ab', 'bcd', 'cd'])
+        self.assertEqual(matcher.spans('abcd'), [(0, 2), (2, 4)])
+        self.assertEqual(matcher.remove('abcd'), '')
+        self.assertEqual(matcher.mask('abcd'), '****')
+        self.assertEqual(matcher.remove('xabcdy'), 'xy')
+
+    def test_longest_match_at_same_start(self):
+        matcher = FilterMatcher(['广告', '广告词'])
+        self.assertEqual(matcher.remove('正文广告词正文'), '正文正文')
+        self.assertEqual(matcher.mask('正文广告正文'), '正文**正文')
+
+    def test_remove_until_clean(self):
+        # 删除后前后文字拼成新的过滤词
+        matcher = FilterMatcher(['ab', 'c'])
+        self.assertEqual(matcher.remove('acb'), '')
+        self.assertFalse(matcher.contains(matcher.remove('aacbb')))
+
+    def test_rebuilds_when_table_changes_elsewhere(self):
+        FilterWord.objects.create(word='旧词')
+        self.assertEqual(get_filter_matcher().remove('旧词新词'), '新词')
+
+        # 用 update() 模拟其他进程修改：不触发本进程的信号
+        FilterWord.objects.update(word='新词', updated_at=timezone.now())
+        self.assertEqual(get_filter_matcher().remove('旧词新词'), '旧词')
+
+    def tearDown(self):
+        filters.invalidate_filter_matcher()
+
+
+class HeadingTests(SimpleTestCase):
+    def test_chinese_to_int(self):
+        cases = {
+            '一百二十三': 123,
+            '十二': 12,
+            '二十': 20,
+            '一千零一': 1001,
+            '一万零五': 10005,
+            '两百': 200,
+            '一〇二': 102,
+            '123': 123,
+            '１２３': 123,
+        }
+        for text, expected in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(chinese_to_int(text), expected)
+        self.assertIsNone(chinese_to_int('序章'))
+
+    def test_chapter_number(self):
+        cases = {
+            '第一百二十三章 风起': 123,
+            '第十二章': 12,
+            '第一千零一章': 1001,
+            '第一万零五章': 10005,
+            '第3卷 第5章 重逢': 5,
+            '第二卷': 2,
+            '108 大结局': 108,
+            '楔子': 0,
+        }
+        for title, expected in cases.items():
+            with self.subTest(title=title):
+                self.assertEqual(chapter_number(title), expected)
+
+    def test_special_chapters(self):
+        self.assertTrue(is_special('番外一 初遇'))
+        self.assertTrue(is_special('后记'))
+        self.assertTrue(is_special('第一百章 後記'))
+        self.assertFalse(is_special('第一百章 归来'))
+
+    def test_custom_parser_and_line_pattern(self):
+        parser = HeadingParser(special_keywords=('尾声',))
+        self.assertTrue(parser.is_special('尾声'))
+        self.assertFalse(parser.is_special('番外'))
+        self.assertEqual(parser.number('未知', default=-1), -1)
+        self.assertEqual(CHAPTER_PATTERN.findall('前言\n第一章 开始\n正文\n第2回 继续\n'),
+                         ['第一章 开始\n', '第2回 继续\n'])
+
+
+class NovelCachePurgeTests(TestCase):
+    def test_moving_novel_purges_both_categories(self):
+        old, new = Category.objects.create(name='旧分类'), Category.objects.create(name='新分类')
+        novel = Novel.objects.create(title='小说', author='作者', category=old)
+        before = scope_version(category_scope(old.id)), scope_version(category_scope(new.id))
+
+        novel.category = new
+        novel.save()
+        self.assertNotEqual(scope_version(category_scope(old.id)), before[0])
+        self.assertNotEqual(scope_version(category_scope(new.id)), before[1])
+
+
+class CleaningJobTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='分类')
+        novel = Novel.objects.create(title='小说', author='作者', category=category)
+        self.chapter = Chapter.objects.create(novel=novel, title='第1章', content='正文', order=1)
+        FilterWord.objects.create(word='广告')
+        FilterWord.objects.create(word='其他')
+        CleaningJob.objects.all().delete()
+        # 进程中断前没来得及清理的章节
+        Chapter.objects.filter(pk=self.chapter.pk).update(content='正文广告', filter_version='old')
+        self.dead = CleaningJob.objects.create(words='广告', status='running', total_count=1)
+
+    def tearDown(self):
+        filters.invalidate_filter_matcher()
+
+    def test_next_job_cleans_words_of_unfinished_job(self):
+        run_cleaning_job(CleaningJob.objects.create(words='其他', total_count=1))
+        self.chapter.refresh_from_db()
+        self.assertNotIn('广告', self.chapter.content)
+        self.assertEqual(self.chapter.filter_version, get_filter_matcher().version)
+
+    def test_stale_running_job_taken_over(self):
+        self.assertIsNone(claim_next_job())
+        CleaningJob.objects.filter(pk=self.dead.pk).update(updated_at=timezone.now() - STALE_AFTER * 2)
+        self.assertEqual(claim_next_job().pk, self.dead.pk)
+
+
+class ChapterViewTests(TestCase):
+    def test_warm_chapter_view_queries(self):
+        category = Category.objects.create(name='分类')
+        novel = Novel.objects.create(title='小说', author='作者', category=category)
+        chapter = Chapter.objects.create(novel=novel, title='第1章', content='正文', order=1)
+        url = reverse('novels:chapter_detail', args=[chapter.id])
+        cache.clear()
+        self.assertContains(self.client.get(url), '正文')
+
+        # 章节行、过滤词版本和章节序列版本各查一次，ETag 与页面共用
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertContains(response, '正文')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_neighbours_follow_changes_from_other_processes(self):
+        category = Category.objects.create(name='分类')
+        novel = Novel.objects.create(title='小说', author='作者', category=category)
+        first = Chapter.objects.create(novel=novel, title='第1章', content='正文', order=1)
+        self.assertEqual(get_neighbours(novel.id, first.id), (None, None))
+
+        # bulk_create 和 update() 不触发本进程的失效，模拟爬虫或排序命令在其他进程中写入
+        Chapter.objects.bulk_create([Chapter(novel=novel, title='第2章', content='正文', order=2)])
+        second = Chapter.objects.get(novel=novel, title='第2章')
+        self.assertEqual(get_neighbours(novel.id, first.id), (None, second.id))
+        Chapter.objects.filter(pk=second.pk).update(order=0, updated_at=timezone.now())
+        self.assertEqual(get_neighbours(novel.id, first.id), (second.id, None))
+
+
+class TocPageTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='分类')
+        self.novel = Novel.objects.create(title='小说', author='作者', category=category)
+
+    def add_chapters(self, count, numbered):
+        Chapter.objects.bulk_create([
+            Chapter(novel=self.novel, title=f'第{i}章', content='正文', order=i if numbered else 0)
+            for i in range(1, count + 1)
+        ])
+
+    def titles(self, page):
+        return [chapter['title'] for chapter in page['chapters']]
+
+    def test_jump_by_order(self):
+        self.add_chapters(30, numbered=True)
+        page = get_toc_page(self.novel.id, jump=12, limit=5)
+        self.assertEqual(self.titles(page), [f'第{i}章' for i in range(12, 17)])
+        self.assertIsNotNone(page['prev_cursor'])
+        self.assertIsNotNone(page['next_cursor'])
+
+    def test_jump_without_order_uses_position(self):
+        # TXT 导入和部分爬虫写入的 order 都是 0
+        self.add_chapters(30, numbered=False)
+        page = get_toc_page(self.novel.id, jump=12, limit=5)
+        self.assertEqual(self.titles(page), [f'第{i}章' for i in range(12, 17)])
+        previous = get_toc_page(self.novel.id, before=page['prev_cursor'], limit=5)
+        self.assertEqual(self.titles(previous), [f'第{i}章' for i in range(7, 12)])
+
+    def test_jump_past_end_shows_last_page(self):
+        self.add_chapters(8, numbered=False)
+        page = get_toc_page(self.novel.id, jump=100, limit=5)
+        self.assertEqual(self.titles(page), [f'第{i}章' for i in range(4, 9)])
+        self.assertIsNotNone(page['prev_cursor'])
+        self.assertIsNone(page['next_cursor'])
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """本地测试页面：记录每个请求的开始时间和同时在处理的请求数"""
+    delay = 0.1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.started.append(time.monotonic())
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            time.sleep(self.delay)
+            body = f'<html><body><div id="content"><p>{self.path}</p></div></body></html>'.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def isClosed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.pages = []
+
+    async def newPage(self):
+        page = FakePage()
+        self.pages.append(page)
+        return page
+
+
+class CrawlingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+        cls.server.lock = threading.Lock()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.started = []
+        self.server.active = 0
+        self.server.peak = 0
+
+    def test_host_limiter_bounds_rate_and_concurrency(self):
+        limiter = HostLimiter(rate=20, concurrency=2)
+
+        async def crawl():
+            fetcher = await HttpFetcher(limiter=limiter, concurrency=4).start()
+            try:
+                urls = [f'{self.base_url}/chapter/{i}' for i in range(6)]
+                return await run_queue(urls, fetcher.soup, workers=4)
+            finally:
+                await fetcher.close()
+
+        pages = asyncio.run(crawl())
+        self.assertEqual(len(pages), 6)
+        self.assertTrue(all(page.select_one('#content p') for page in pages))
+        self.assertLessEqual(self.server.peak, 2)
+        started = sorted(self.server.started)
+        gaps = [b - a for a, b in zip(started, started[1:])]
+        self.assertGreaterEqual(min(gaps), 0.04)
+
+    def test_page_pool_reuses_pages(self):
+        browser = FakeBrowser()
+        pool = PagePool(browser, size=2)
+
+        async def crawl():
+            await pool.start()
+
+            async def handle(i):
+                async with pool.page() as page:
+                    await asyncio.sleep(0)
+                    if i == 3:
+                        await page.close()  # 标签页崩溃，归还时换一个新的
+                    return page
+
+            used = await run_queue(range(10), handle, workers=4)
+            await pool.close()
+            return used
+
+        used = asyncio.run(crawl())
+        self.assertEqual(len(used), 10)
+        self.assertEqual(len(browser.pages), 3)
+        self.assertTrue(all(page.isClosed() for page in browser.pages))
+
+    def test_run_queue_finishes(self):
+        async def double(item):
+            await asyncio.sleep(0)
+            return item * 2
+
+        async def run(items, workers):
+            return await asyncio.wait_for(run_queue(items, double, workers=workers), timeout=5)
+
+        self.assertEqual(sorted(asyncio.run(run(range(5), 3))), [0, 2, 4, 6, 8])
+        self.assertEqual(asyncio.run(run([], 3)), [])
+        self.assertEqual(asyncio.run(run([1], 8)), [2])
+
+
+class FrontierEnqueueTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='分类')
+        self.novel = Novel.objects.create(title='小说', author='作者', category=category)
+        self.chapters = [{'title': '第1章', 'url': 'http://example.com/1'},
+                         {'title': '第2章', 'url': 'http://example.com/2'}]
+        frontier.enqueue(self.novel, self.chapters)
+
+    def state(self, url):
+        return CrawlTask.objects.values_list('state', 'attempts').get(url=url)
+
+    def test_given_up_task_waits_for_cooldown(self):
+        task = CrawlTask.objects.get(url='http://example.com/1')
+        for _ in range(frontier.MAX_ATTEMPTS):
+            frontier.mark_failed(task.id, '404')
+        frontier.enqueue(self.novel, self.chapters)
+        self.assertEqual(self.state(task.url), ('failed', frontier.MAX_ATTEMPTS))
+
+        CrawlTask.objects.filter(pk=task.pk).update(
+            updated_at=timezone.now() - frontier.FAILED_COOLDOWN - timedelta(minutes=1)
+        )
+        frontier.enqueue(self.novel, self.chapters)
+        self.assertEqual(self.state(task.url), ('pending', 0))
+
+    def test_revive_failed_without_toc(self):
+        # 目录没有变化而跳过对比时，冷却期满的放弃任务由 revive_failed 重新排队
+        CrawlTask.objects.update(
+            state='failed', attempts=frontier.MAX_ATTEMPTS,
+            updated_at=timezone.now() - frontier.FAILED_COOLDOWN - timedelta(minutes=1)
+        )
+        CrawlTask.objects.filter(url='http://example.com/2').update(updated_at=timezone.now())
+        self.assertEqual(frontier.revive_failed(self.novel), 1)
+        self.assertEqual(self.state('http://example.com/1'), ('pending', 0))
+        self.assertEqual(self.state('http://example.com/2'), ('failed', frontier.MAX_ATTEMPTS))
+
+    def test_done_task_requeued_only_when_chapter_missing(self):
+        frontier.mark_done_many(CrawlTask.objects.values_list('pk', flat=True))
+        Chapter.objects.bulk_create([Chapter(novel=self.novel, title='第1章', content='正文')])
+        frontier.enqueue(self.novel, self.chapters)
+        self.assertEqual(self.state('http://example.com/1'), ('done', 0))
+        self.assertEqual(self.state('http://example.com/2'), ('pending', 0))
+
+
+class FakeProbe:
+    """记录条件请求的校验值；带着校验值请求时模拟缓存一直返回 304"""
+
+    def __init__(self, html):
+        self.html = html
+        self.validators = []
+
+    async def fetch_conditional(self, url, etag='', last_modified=''):
+        self.validators.append((etag, last_modified))
+        if etag or last_modified:
+            return None, etag, last_modified
+        return self.html, '"v1"', ''
+
+
+class TocProbeTests(TestCase):
+    SHELL = '<html><body><div id="app"></div><script src="/app.js"></script></body></html>'
+
+    def setUp(self):
+        from .management.commands.crawl_xqbj import Command
+
+        category = Category.objects.create(name='分类')
+        self.novel = Novel.objects.create(
+            title='小说', author='作者', category=category,
+            toc_etag='"v1"', toc_checked_at=timezone.now(),
+        )
+        self.command = Command()
+        self.command.print_status = lambda *args: None
+
+    def probe(self, html):
+        self.command.probe = FakeProbe(html)
+        return asyncio.run(self.command.probe_toc(self.novel, 'http://example.com/book'))
+
+    def test_empty_signature_never_matches(self):
+        from .management.commands.crawl_xqbj import toc_signature
+
+        self.assertEqual(toc_signature(parse_html(self.SHELL), 'http://example.com/book'), '')
+        self.novel.toc_etag = ''
+        self.novel.toc_probe_hash = ''
+        unchanged, _, probe_hash = self.probe(self.SHELL)
+        self.assertFalse(unchanged)
+        self.assertEqual(probe_hash, '')
+
+    def test_expired_check_skips_conditional_request(self):
+        self.novel.toc_checked_at = timezone.now() - frontier.TOC_MAX_AGE - timedelta(minutes=1)
+        unchanged, validators, _ = self.probe(self.SHELL)
+        self.assertFalse(unchanged)
+        self.assertEqual(self.command.probe.validators, [('', '')])
+        self.assertEqual(validators, ('"v1"', ''))
+
+    def test_skip_does_not_extend_max_age(self):
+        checked_at = timezone.now() - timedelta(hours=1)
+        Novel.objects.filter(pk=self.novel.pk).update(toc_checked_at=checked_at)
+        frontier.touch_toc(self.novel.pk, '"v2"')
+        self.novel.refresh_from_db()
+        self.assertEqual(self.novel.toc_checked_at, checked_at)
+        self.assertEqual(self.novel.toc_etag, '"v2"')
+        self.assertFalse(frontier.toc_expired(self.novel))
+        self.assertTrue(frontier.toc_expired(self.novel, now=checked_at + frontier.TOC_MAX_AGE))
+
+        frontier.save_toc(self.novel.pk, ['http://example.com/1'])
+        self.novel.refresh_from_db()
+        self.assertGreater(self.novel.toc_checked_at, checked_at)
+
+
+class WritePendingTests(TestCase):
+    def test_duplicate_in_batch_keeps_first(self):
+        category = Category.objects.create(name='分类')
+        novel = Novel.objects.create(title='小说', author='作者', category=category)
+        inserted = write_pending([
+            PendingChapter(novel.id, '第2章', '第一份正文', 2, {}),
+            PendingChapter(novel.id, '第2章', '第二份正文', 2, {}),
+        ])
+        chapter = Chapter.objects.get(novel=novel)
+        self.assertEqual(inserted, {(novel.id, '第2章'): chapter.id})
+        self.assertIn('第一份正文', chapter.content)
+
+        # 搜索索引中的正文必须是实际入库的那一份
+        if search_index.is_available():
+            self.assertEqual(search_index.search_chapters('第一份', 10), [chapter.id])
+            self.assertEqual(search_index.count_chapters('第二份'), 0)
@@ -0,0 +1,205 @@
+"""
+TXT 小说解析
+
+读取文件、识别编码、切分章节，只处理文本不访问数据库，
+可以放到子进程中并行执行，结果交给 ingest 统一写入。
+大文件按行流式切分，每次只在内存中保留一章。
+"""
+import codecs
+import io
+import mmap
+import os
+
+from .headings import CHAPTER_PATTERN
+
+# 按 BOM 判断的编码，UTF-32 的 BOM 以 UTF-16 的开头，需要先判断
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# 没有 BOM 时的候选编码；gbk、gb2312 都是 gb18030 的子集，不必单独尝试
+ENCODINGS = ['utf-8', 'gb18030', 'big5', 'utf-16-le', 'utf-16-be']
+
+SAMPLE_SIZE = 64 * 1024  # 只用文件开头这么多字节判断编码
+STREAM_THRESHOLD = 16 * 1024 * 1024  # 超过这个大小的文件边读边切分，不整体载入内存
+
+# 简繁体最常用的汉字，正确解码的中文文本里这些字约占三成以上，解码错了则很少出现
+COMMON_CHARS = frozenset(
+    '的一是了不在人有我他这个们中来上大为和国地到以说时要就出会也你对生能而子那得于着下'
+    '自之年过发后作里道行所然家事成多经么去都没看天还好小心只想日手头面前开起见把长意两'
+    '她它道声眼身话什样点已又再听问走笑知神色情真没当从被向些气'
+    '這個們來為國說時會對於著後裡過發經麼還頭見長兩開起聲話樣點問氣當從'
+)
+
+
+
+def _decodes(sample, encoding):
+    """用增量解码器检查样本能否按该编码解码，末尾被截断的多字节字符不算错误"""
+    try:
+        codecs.getincrementaldecoder(encoding)('strict').decode(sample, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def _score(sample, encoding):
+    """常用汉字在解码结果中的占比，用于在多个可行编码之间选择"""
+    text = codecs.decode(sample, encoding, 'replace')
+    hanzi = sum(1 for char in text if '\u4e00' <= char <= '\u9fff')
+    if not hanzi:
+        return 0.0
+    return sum(1 for char in text if char in COMMON_CHARS) / hanzi
+
+
+def guess_encodings(sample):
+    """
+    根据文件开头的样本推测编码，按可能性从高到低返回候选列表
+    先看 BOM，再用增量解码器排除不可能的编码，剩下多个时按常用字占比排序
+    """
+    sample = bytes(sample[:SAMPLE_SIZE])
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return [encoding]
+
+    # 合法的 UTF-8 几乎不会是其他编码的巧合，纯 ASCII 也按 UTF-8 处理；
+    # 样本之后仍可能出现 GBK 字节，留 gb18030 作为后备
+    if _decodes(sample, 'utf-8'):
+        return ['utf-8', 'gb18030']
+
+    candidates = [e for e in ENCODINGS[1:] if _decodes(sample, e)]
+    if len(candidates) > 1:
+        candidates.sort(key=lambda e: _score(sample, e), reverse=True)
+    return candidates
+
+
+def decode_bytes(data):
+    """
+    识别编码并整体解码一次，返回 (内容, 编码)，无法解码时返回 (None, None)
+    data 可以是 bytes、memoryview 或 mmap，不会额外复制整个文件
+    """
+    for encoding in guess_encodings(data):
+        try:
+            content = str(data, encoding)
+        except UnicodeDecodeError:
+            # 样本之后出现了非法字节，换下一个候选
+            continue
+        # 与文本模式读取一致，统一换行符
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        return content, encoding
+    return None, None
+
+
+def read_text(file_path):
+    """把文件映射到内存后识别编码并解码，返回 (内容, 编码)，失败时返回 (None, None)"""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return '', 'utf-8'
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return decode_bytes(data)
+
+
+def split_title_author(filename):
+    """从文件名（书名-作者.txt）中提取书名和作者"""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    try:
+        title, author = name.split('-')
+    except ValueError:
+        title = name
+        author = '未知'
+    return title, author
+
+
+def iter_chapters(lines):
+    """
+    逐行扫描文本，每遇到一个章节标题就输出上一章的 (标题, 内容)
+    只保留当前章节的行，内存占用与全文长度无关；第一个标题之前的文字忽略
+    """
+    title = None
+    body = []
+    for line in lines:
+        match = CHAPTER_PATTERN.search(line)
+        if match:
+            # 标题之前的半行仍属于上一章
+            if title is not None:
+                body.append(line[:match.start()])
+                yield title, ''.join(body).strip()
+            title = match.group()
+            body = [line[match.start():]]
+        elif title is not None:
+            body.append(line)
+    if title is not None:
+        yield title, ''.join(body).strip()
+
+
+def split_chapters(content):
+    """按章节标题切分全文，返回 [(标题, 内容), ...]"""
+    return list(iter_chapters(io.StringIO(content)))
+
+
+def iter_file_chapters(file_path, encoding, buffer_size=1024 * 1024):
+    """按给定编码边读边切分章节；文件中途出现非法字节时抛出 UnicodeDecodeError"""
+    with open(file_path, 'r', encoding=encoding, buffering=buffer_size) as f:
+        yield from iter_chapters(f)
+
+
+def read_intro(file_path, encoding, length=200):
+    """读取文件开头作为简介"""
+    with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+        return f.read(length) + '...'
+
+
+def sample_encodings(file_path):
+    """只读取文件开头的样本推测编码，返回候选列表"""
+    with open(file_path, 'rb') as f:
+        sample = f.read(SAMPLE_SIZE)
+    return guess_encodings(sample) if sample else ['utf-8']
+
+
+def parse_txt_file(file_path, stream_threshold=STREAM_THRESHOLD):
+    """
+    解析单个 TXT 文件，返回可直接写入的字典，失败时 error 字段为错误说明
+    超过 stream_threshold 的大文件只识别编码，stream 为真，
+    章节留给写入方用 iter_file_chapters 边读边切分
+    """
+    title, author = split_title_author(file_path)
+    result = {
+        'path': file_path,
+        'title': title,
+        'author': author,
+        'encoding': None,
+        'encodings': [],
+        'intro': '',
+        'chapters': [],
+        'stream': False,
+        'size': 0,
+        'error': None,
+    }
+
+    try:
+        result['size'] = os.path.getsize(file_path)
+        if result['size'] > stream_threshold:
+            result['stream'] = True
+            result['encodings'] = sample_encodings(file_path)
+            if not result['encodings']:
+                result['error'] = '无法识别文件编码'
+            return result
+        content, encoding = read_text(file_path)
+    except OSError as e:
+        result['error'] = f'读取文件失败: {e}'
+        return result
+
+    if content is None:
+        result['error'] = '无法识别文件编码'
+        return result
+
+    result['encoding'] = encoding
+    result['intro'] = content[:200] + '...'
+    result['chapters'] = split_chapters(content)
+    if not result['chapters']:
+        result['error'] = '未找到任何章节'
+    return result
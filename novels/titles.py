@@ -0,0 +1,150 @@
+"""
+章节标题批量改写
+
+改写规则只编译一次；按小说顺序流式读取 (id, novel_id, title)，不加载正文，
+在内存中预先检查同一本小说内的标题冲突（unique_together），
+预览时只输出差异，执行时按批 bulk_update 写回并同步搜索索引。
+"""
+import logging
+import re
+import threading
+
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import search_index
+from .caching import SCOPE_CHAPTERS, purge_scopes
+from .models import Chapter
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH = 500  # 每批写回的章节数
+READ_CHUNK = 2000  # 游标每次读取的行数
+
+
+class TitleRule:
+    """一条改写规则：把匹配 pattern 的部分替换为 replace（默认删除）"""
+
+    def __init__(self, pattern, replace='', strip=False):
+        self.regex = re.compile(pattern)
+        self.replace = replace or ''
+        self.strip = strip
+
+    @property
+    def pattern(self):
+        return self.regex.pattern
+
+    def apply(self, title):
+        title = self.regex.sub(self.replace, title)
+        return title.strip() if self.strip else title
+
+
+# 去掉爬虫混入标题的发布时间
+TIMESTAMP_RULE = TitleRule(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', strip=True)
+
+
+def rewrite(title, rules):
+    for rule in rules:
+        title = rule.apply(title)
+    return title
+
+
+def _candidates(rules, chapters):
+    """只有一条规则时交给 SQLite 的 REGEXP（由 Python re 实现，语义一致）预先筛选"""
+    if len(rules) == 1 and connection.vendor == 'sqlite':
+        chapters = chapters.filter(title__regex=rules[0].pattern)
+    return (
+        chapters.order_by('novel_id', 'id')
+        .values_list('id', 'novel_id', 'title')
+        .iterator(chunk_size=READ_CHUNK)
+    )
+
+
+def _resolve(novel_id, pending, changes, conflicts):
+    """
+    检查一本小说内的冲突：新标题与现有任何标题（包括其他待改章节的旧标题）
+    或同批其他新标题重复时跳过，保证逐行更新时不会违反唯一约束
+    """
+    used = set(Chapter.objects.filter(novel_id=novel_id).values_list('title', flat=True))
+    seen = set()
+    for change in pending:
+        new_title = change[3]
+        if not new_title or new_title in used or new_title in seen:
+            conflicts.append(change)
+        else:
+            seen.add(new_title)
+            changes.append(change)
+
+
+def plan_titles(rules, chapters=None):
+    """
+    计算改写结果，返回 (changes, conflicts)
+    两者都是 [(id, novel_id, 旧标题, 新标题), ...]，conflicts 为因重复或为空而跳过的章节
+    """
+    if chapters is None:
+        chapters = Chapter.objects.all()
+
+    changes = []
+    conflicts = []
+    pending = []
+    current_novel = None
+    for chapter_id, novel_id, title in _candidates(rules, chapters):
+        if novel_id != current_novel:
+            if pending:
+                _resolve(current_novel, pending, changes, conflicts)
+            current_novel = novel_id
+            pending = []
+        new_title = rewrite(title, rules)
+        if new_title != title:
+            pending.append((chapter_id, novel_id, title, new_title))
+    if pending:
+        _resolve(current_novel, pending, changes, conflicts)
+    return changes, conflicts
+
+
+def apply_titles(changes, batch_size=WRITE_BATCH):
+    """
+    按批写回新标题，返回更新的章节数
+    同时更新 updated_at，让阅读页和目录的条件请求随之失效
+    """
+    now = timezone.now()
+    for start in range(0, len(changes), batch_size):
+        batch = changes[start:start + batch_size]
+        with transaction.atomic():
+            Chapter.objects.bulk_update(
+                [Chapter(id=chapter_id, title=new_title, updated_at=now) for chapter_id, _, _, new_title in batch],
+                ['title', 'updated_at']
+            )
+            search_index.update_chapter_titles([(chapter_id, new_title) for chapter_id, _, _, new_title in batch])
+    if changes:
+        purge_scopes(SCOPE_CHAPTERS)
+    return len(changes)
+
+
+def format_diff(changes):
+    """预览用的差异行"""
+    return [f'[{novel_id}] #{chapter_id}: "{old}" -> "{new}"' for chapter_id, novel_id, old, new in changes]
+
+
+def run_title_rewrite(rules, chapter_ids=None, batch_size=WRITE_BATCH):
+    """计算并写回，返回 (更新数, 冲突数)"""
+    chapters = Chapter.objects.all()
+    if chapter_ids is not None:
+        chapters = chapters.filter(id__in=chapter_ids)
+    changes, conflicts = plan_titles(rules, chapters)
+    return apply_titles(changes, batch_size=batch_size), len(conflicts)
+
+
+def start_title_rewrite(rules, chapter_ids):
+    """在后台线程中执行改写，供后台管理的动作调用，不阻塞请求"""
+    def worker():
+        try:
+            close_old_connections()
+            updated, skipped = run_title_rewrite(rules, chapter_ids)
+            logger.info('章节标题改写完成：更新 %s 个，因重复跳过 %s 个', updated, skipped)
+        except Exception:
+            logger.exception('章节标题改写失败')
+        finally:
+            connection.close()
+
+    threading.Thread(target=worker, name='title-rewrite', daemon=True).start()
@@ -1,47 +1,39 @@
 from django.shortcuts import render, get_object_or_404
-from django.core.cache import cache
 from django.db import DatabaseError
-from .models import Novel, Chapter, Category, FilterWord
+from .models import Novel, Chapter, Category
+from .caching import (
+    SCOPE_CHAPTERS, SCOPE_NOVELS, SCOPE_SITE, cache_page_scoped, category_scope, get_common_data, scope_version
+)
+from .filters import get_filter_matcher
+from .navigation import get_neighbours, get_toc_page
+from . import search_index
+from .exports import CHUNK_SIZE, build_epub, cached_artifact, chapter_stats, export_stamp, stream_and_cache_text
 from django.core.paginator import Paginator
 from django.views.generic import DetailView
-from django.http import HttpResponse
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition
+from django.utils.http import quote_etag
 from urllib.parse import quote
-from django.db.models import Q
-
-def get_common_data():
-    """公共上下文数据，带缓存优化"""
-    from django.db.models import Count
-    
-    # 获取推荐小说（带缓存）
-    recommend_novels = cache.get('recommend_novels')
-    if not recommend_novels:
-        recommend_novels = Novel.objects.filter(is_recommend=True)[:3]
-        cache.set('recommend_novels', recommend_novels, 1800)
-    
-    # 获取分类及对应小说数量
-    categories = Category.objects.annotate(
-        novel_count=Count('novels')
-    ).order_by('-novel_count')
-    
-    return {
-        'categories': categories,
-        'recommend_novels': recommend_novels,
-    }
+import os
+import re
 
+@cache_page_scoped(lambda request: [SCOPE_NOVELS, SCOPE_CHAPTERS])
 def index(request):
     """为每一本小说打造独特的展示空间"""
     try:
-        # 获取各类小说
-        recommended_novels = Novel.objects.filter(is_recommend=True).order_by('-updated_at')[:6]
-        latest_novels = Novel.objects.order_by('-created_at')[:12]
-        latest_chapters = Chapter.objects.select_related('novel').order_by('-created_at')[:10]
-        categories = Category.objects.all()
+        # 获取各类小说（查询集是惰性的，命中片段缓存时不会执行）
+        recommended_novels = Novel.objects.filter(is_recommend=True).select_related('category').order_by('-updated_at')[:6]
+        latest_novels = Novel.objects.select_related('category').order_by('-created_at')[:12]
+        latest_chapters = Chapter.objects.select_related('novel').only(
+            'id', 'title', 'novel__id', 'novel__title'
+        ).order_by('-created_at')[:10]
         
         context = {
             'recommended_novels': recommended_novels,
             'latest_novels': latest_novels,
             'latest_chapters': latest_chapters,
-            'categories': categories,
+            'site_version': scope_version(SCOPE_SITE),
+            'novels_version': scope_version(SCOPE_NOVELS),
         }
         context.update(get_common_data())
         
@@ -49,6 +41,7 @@ def index(request):
     except DatabaseError as e:
         return HttpResponse(f"数据库错误: {str(e)}", status=500)  # 处理数据库错误
 
+@cache_page_scoped(lambda request, category_id: [category_scope(category_id)])
 def category(request, category_id):
     category = get_object_or_404(Category, pk=category_id)
     novel_list = Novel.objects.filter(category=category).select_related('category')
@@ -61,51 +54,129 @@ def category(request, category_id):
     context = {
         'category': category,
         'page_obj': page_obj,
+        'category_version': scope_version(category_scope(category_id)),
     }
     context.update(get_common_data())
     return render(request, 'novels/category.html', context)
 
 
+def _novel_meta(request, novel_id):
+    """条件请求用的小说元数据：小说本身和章节的最近更新时间"""
+    if not hasattr(request, '_novel_meta'):
+        novel = Novel.objects.filter(id=novel_id).only('id', 'updated_at').first()
+        meta = None
+        if novel:
+            stats = chapter_stats(novel_id)
+            meta = {
+                'stamp': export_stamp(novel, stats),
+                'last_modified': max(filter(None, [novel.updated_at, stats[1]])),
+            }
+        request._novel_meta = meta
+    return request._novel_meta
+
+def _novel_etag(request, novel_id):
+    meta = _novel_meta(request, novel_id)
+    return meta and meta['stamp']
+
+def _novel_last_modified(request, novel_id):
+    meta = _novel_meta(request, novel_id)
+    return meta and meta['last_modified']
+
+@condition(etag_func=_novel_etag, last_modified_func=_novel_last_modified)
 def novel_detail(request, novel_id):
     """展现小说的独特魅力"""
-    novel = get_object_or_404(Novel, id=novel_id)
-    chapters = novel.chapters.all().order_by('order', 'id')
+    novel = get_object_or_404(Novel.objects.select_related('category'), id=novel_id)
+    toc = get_toc_page(novel.id, **_toc_params(request))
     
     context = {
         'novel': novel,
-        'chapters': chapters,
+        'chapters': toc['chapters'],
+        'prev_cursor': toc['prev_cursor'],
+        'next_cursor': toc['next_cursor'],
     }
     context.update(get_common_data())
     
     return render(request, 'novels/novel_detail.html', context)
 
+def _toc_params(request):
+    """从查询参数中读取目录分页参数"""
+    jump = request.GET.get('chapter')
+    try:
+        jump = int(jump) if jump else None
+    except ValueError:
+        jump = None
+    return {
+        'after': request.GET.get('after'),
+        'before': request.GET.get('before'),
+        'jump': jump,
+    }
+
+def novel_toc(request, novel_id):
+    """目录接口：游标分页，支持跳转到第 N 章"""
+    if not Novel.objects.filter(id=novel_id).exists():
+        return JsonResponse({'error': '小说不存在'}, status=404)
+    return JsonResponse(get_toc_page(novel_id, **_toc_params(request)))
+
+def _chapter_meta(request, chapter_id):
+    """
+    条件请求用的章节元数据，同一请求内只查询一次
+    读到的章节、过滤词自动机和相邻章节留给视图复用，不再重复查询
+    """
+    if not hasattr(request, '_chapter_meta'):
+        chapter = Chapter.objects.select_related('novel').defer('content').filter(id=chapter_id).first()
+        meta = None
+        if chapter:
+            matcher = get_filter_matcher()
+            # 上一章/下一章链接也在页面中，一并计入 ETag
+            neighbours = get_neighbours(chapter.novel_id, chapter.id)
+            meta = {
+                'chapter': chapter,
+                'matcher': matcher,
+                'neighbours': neighbours,
+                'updated_at': chapter.updated_at,
+                'etag': '{}-{}-{}-{}'.format(
+                    int(chapter.updated_at.timestamp() * 1000),
+                    matcher.version,
+                    *neighbours
+                ),
+            }
+        request._chapter_meta = meta
+    return request._chapter_meta
+
+def _chapter_etag(request, chapter_id):
+    meta = _chapter_meta(request, chapter_id)
+    return meta and meta['etag']
+
+def _chapter_last_modified(request, chapter_id):
+    meta = _chapter_meta(request, chapter_id)
+    return meta and meta['updated_at']
+
+@condition(etag_func=_chapter_etag, last_modified_func=_chapter_last_modified)
 def chapter_detail(request, chapter_id):
     """展现章节的优美韵律"""
-    chapter = Chapter.objects.select_related('novel').get(id=chapter_id)
-    
-    # 清理内容
-    chapter.content = chapter.clean_content()
+    # 章节在计算 ETag 时已经读出，这里直接复用
+    meta = _chapter_meta(request, chapter_id)
+    if meta is None:
+        raise Http404('章节不存在')
+    chapter, matcher = meta['chapter'], meta['matcher']
     
-    # 获取上一章和下一章
-    prev_chapter = Chapter.objects.filter(
-        novel=chapter.novel,
-        id__lt=chapter.id
-    ).order_by('-id').first()
+    # 渲染内容在写入时已生成；过滤词变化后后台尚未重新清理时才临时处理
+    if chapter.filter_version != matcher.version:
+        chapter.refresh_rendered(matcher)
     
-    next_chapter = Chapter.objects.filter(
-        novel=chapter.novel,
-        id__gt=chapter.id
-    ).order_by('id').first()
+    # 从缓存的章节序列中获取上一章和下一章
+    prev_chapter_id, next_chapter_id = meta['neighbours']
     
     context = {
         'chapter': chapter,
-        'prev_chapter': prev_chapter,
-        'next_chapter': next_chapter,
+        'prev_chapter_id': prev_chapter_id,
+        'next_chapter_id': next_chapter_id,
     }
     context.update(get_common_data())
     
     return render(request, 'novels/chapter_detail.html', context)
 
+@cache_page_scoped(lambda request: [SCOPE_NOVELS])
 def latest_novels_view(request):
     """展现最新小说的绚丽画卷"""
     # 获取最新的小说，使用 updated_at 替代 update_time
@@ -117,11 +188,8 @@ def latest_novels_view(request):
     return render(request, 'novels/latest_novels.html', context)
 
 def filter_content(content):
-    filter_words = FilterWord.objects.all()
-    filtered_content = content
-    for word in filter_words:
-        filtered_content = filtered_content.replace(word.word, '*' * len(word.word))
-    return filtered_content
+    """用星号遮盖过滤词"""
+    return get_filter_matcher().mask(content)
 
 class ChapterDetailView(DetailView):
     model = Chapter
@@ -136,41 +204,141 @@ class ChapterDetailView(DetailView):
         # ... 其他代码 ...
         return context
 
+def _attachment_response(response, filename):
+    """设置附件下载头，处理中文文件名"""
+    encoded_filename = quote(filename)  # URL编码文件名
+    response['Content-Disposition'] = f'attachment; filename="{encoded_filename}"; filename*=utf-8\'\'{encoded_filename}'
+    return response
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def _range_response(request, path, etag):
+    """
+    处理单段 Range 请求，支持断点续传
+    请求头无效或 If-Range 不匹配时返回 None，由调用方发送完整文件
+    """
+    match = RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+    if not match:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range.strip() != quote_etag(etag):
+        return None
+
+    size = os.path.getsize(path)
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    def iter_range():
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    response = StreamingHttpResponse(iter_range(), status=206, content_type='application/octet-stream')
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+def _download_meta(request, novel_id):
+    """条件请求用的下载元数据"""
+    if not hasattr(request, '_download_meta'):
+        novel = Novel.objects.filter(id=novel_id).first()
+        meta = None
+        if novel:
+            stats = chapter_stats(novel_id)
+            stamp = export_stamp(novel, stats)
+            gzipped = (
+                'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+                and 'HTTP_RANGE' not in request.META
+                and cached_artifact(novel, stamp, 'txt.gz') is not None
+            )
+            meta = {
+                'novel': novel,
+                'stamp': stamp,
+                'gzipped': gzipped,
+                # 压缩与未压缩的内容不同，ETag 需要区分
+                'etag': f'{stamp}-gz' if gzipped else stamp,
+                'last_modified': max(filter(None, [novel.updated_at, stats[1]])),
+            }
+        request._download_meta = meta
+    return request._download_meta
+
+def _download_etag(request, novel_id):
+    meta = _download_meta(request, novel_id)
+    return meta and meta['etag']
+
+def _download_last_modified(request, novel_id):
+    meta = _download_meta(request, novel_id)
+    return meta and meta['last_modified']
+
+@condition(etag_func=_download_etag, last_modified_func=_download_last_modified)
 def download_novel(request, novel_id):
     """下载小说"""
     try:
-        novel = Novel.objects.prefetch_related('chapters').get(id=novel_id)
-        
-        # 生成文件内容
-        content = [
-            f"{novel.title}\n",
-            f"作者：{novel.author}\n",
-            f"简介：{novel.intro}\n",
-            "=" * 50 + "\n\n"
-        ]
+        meta = _download_meta(request, novel_id)
+        if meta is None:
+            raise Novel.DoesNotExist
+        novel, stamp = meta['novel'], meta['stamp']
+        filename = f"{novel.title}.txt"
         
-        # 添加所有章节
-        for chapter in novel.chapters.all():
-            content.extend([
-                f"{chapter.title}\n\n",
-                f"{chapter.content}\n\n",
-                "=" * 30 + "\n\n"
-            ])
+        # 命中磁盘缓存时直接发送文件（由服务器 sendfile 零拷贝输出）
+        gz_path = cached_artifact(novel, stamp, 'txt.gz') if meta['gzipped'] else None
+        txt_path = cached_artifact(novel, stamp, 'txt')
+        if txt_path and not gz_path:
+            # 断点续传
+            response = _range_response(request, txt_path, meta['etag'])
+            if response is not None:
+                response['Accept-Ranges'] = 'bytes'
+                return _attachment_response(response, filename)
         
-        # 创建响应
-        response = HttpResponse(content_type='application/octet-stream')  # 修改content type
+        path = gz_path or txt_path
+        if path:
+            response = FileResponse(open(path, 'rb'), content_type='application/octet-stream')
+            if gz_path:
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response['Accept-Ranges'] = 'bytes'
+            response['Vary'] = 'Accept-Encoding'
+            return _attachment_response(response, filename)
         
-        # 处理中文文件名
-        filename = f"{novel.title}.txt"
-        encoded_filename = quote(filename)  # URL编码文件名
+        # 未缓存时逐章流式输出，同时生成缓存
+        response = StreamingHttpResponse(
+            stream_and_cache_text(novel, stamp),
+            content_type='application/octet-stream'
+        )
+        return _attachment_response(response, filename)
         
-        # 添加正确的响应头
-        response['Content-Disposition'] = f'attachment; filename="{encoded_filename}"; filename*=utf-8\'\'{encoded_filename}'
-        response['Content-Length'] = len(''.join(content).encode('utf-8'))
+    except Novel.DoesNotExist:
+        return HttpResponse("小说不存在", status=404)
+    except Exception as e:
+        return HttpResponse(f"下载失败：{str(e)}", status=500)
+
+def download_epub(request, novel_id):
+    """下载 EPUB 电子书"""
+    try:
+        novel = Novel.objects.get(id=novel_id)
+        stamp = export_stamp(novel)
         
-        # 写入内容
-        response.write(''.join(content))
-        return response
+        # 同一版本的 EPUB 只生成一次
+        path = cached_artifact(novel, stamp, 'epub') or build_epub(novel, stamp)
+        response = FileResponse(open(path, 'rb'), content_type='application/epub+zip')
+        return _attachment_response(response, f"{novel.title}.epub")
         
     except Novel.DoesNotExist:
         return HttpResponse("小说不存在", status=404)
@@ -179,29 +347,30 @@ def download_novel(request, novel_id):
 
 def search(request):
     """搜索小说"""
-    query = request.GET.get('q', '')
+    query = request.GET.get('q', '').strip()
+    try:
+        page = int(request.GET.get('page', 1))
+    except ValueError:
+        page = 1
     
-    if query:
-        # 搜索小说标题和作者
-        novels = Novel.objects.filter(
-            Q(title__icontains=query) | 
-            Q(author__icontains=query)
-        ).distinct()
-        
-        # 搜索章节标题
-        chapters = Chapter.objects.filter(
-            title__icontains=query
-        ).select_related('novel').distinct()
-    else:
-        novels = Novel.objects.none()
-        chapters = Chapter.objects.none()
+    result = search_index.search_page(query, page)
+    page = result['page']
+    cap = search_index.COUNT_CAP
     
     context = {
         'query': query,
-        'novels': novels,
-        'chapters': chapters,
-        'novel_count': novels.count(),
-        'chapter_count': chapters.count(),
+        'novels': result['novels'],
+        'chapters': result['chapters'],
+        'novel_count': min(result['novel_count'], cap),
+        'chapter_count': min(result['chapter_count'], cap),
+        'novel_count_capped': result['novel_count'] > cap,
+        'chapter_count_capped': result['chapter_count'] > cap,
+        'page': page,
+        'prev_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if (
+            page < search_index.SEARCH_MAX_PAGES
+            and page * search_index.SEARCH_PAGE_SIZE < result['chapter_count']
+        ) else None,
     }
     context.update(get_common_data())
     